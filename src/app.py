@@ -32,15 +32,16 @@ apply_custom_css()
 render_header()
 
 # --- System Check ---
+# Cached with a TTL so a Streamlit rerun (every widget interaction) doesn't reconnect to TiDB
+@st.cache_data(ttl=60, show_spinner=False)
 def check_system_health():
-    """Checks if Neo4j and Ollama are reachable."""
+    """Checks if TiDB, the embedding model config and Groq are reachable."""
     health_status = []
     
     # Check TiDB
     try:
-        from tidb_store import TiDBGraph
-        graph = TiDBGraph()
-        conn = graph.get_connection()
+        from resources import get_graph
+        conn = get_graph().get_connection()
         if conn.is_connected():
             health_status.append(("TiDB", "Connected", "✅"))
             conn.close()
@@ -51,7 +52,6 @@ def check_system_health():
 
     # Check Embeddings Model (HuggingFace)
     try:
-        from langchain_huggingface import HuggingFaceEmbeddings
         from config import EMBEDDING_MODEL
         if EMBEDDING_MODEL:
             health_status.append(("Embeddings (HF)", "Ready", "✅"))
@@ -73,6 +73,17 @@ def check_system_health():
 
     return health_status
 
+@st.cache_data(ttl=60, show_spinner=False)
+def known_workspaces():
+    """Workspaces that already hold data, plus the configured default."""
+    from config import DEFAULT_WORKSPACE
+    try:
+        from resources import get_graph
+        found = get_graph().list_workspaces()
+    except Exception:
+        found = []
+    return sorted(set(found) | {DEFAULT_WORKSPACE})
+
 # --- Sidebar ---
 with st.sidebar:
     st.image("https://img.icons8.com/clouds/200/company.png", width=150) # Placeholder or local asset
@@ -83,9 +94,27 @@ with st.sidebar:
         for service, status_text, icon in check_system_health():
             st.markdown(f"**{service}**: {status_text} {icon}")
 
+    st.markdown("---")
+    st.header("🏢 Workspace")
+    workspaces = known_workspaces()
+    from config import DEFAULT_WORKSPACE
+    ws = st.selectbox("Active workspace:", options=workspaces, index=workspaces.index(DEFAULT_WORKSPACE),
+                      help="Documents, graph and searches are isolated per workspace.")
+    new_ws = st.text_input("Or create a workspace:", placeholder="e.g. client-a")
+    if new_ws.strip():
+        try:
+            from workspaces import normalize_workspace
+            ws = normalize_workspace(new_ws.strip())
+        except ValueError as e:
+            st.error(str(e))
+    st.session_state["workspace"] = ws
+
     st.markdown("---")
     st.header("📂 Data Ingestion")
     uploaded_file = st.file_uploader("Upload Company Report (PDF)", type="pdf")
+    include_deferred = st.checkbox("Extract low-density sections too", value=False,
+                                   help="Sections with few named entities are deferred by default; "
+                                        "this extracts them as well (more LLM requests).")
     
     if uploaded_file is not None:
         if st.button("🚀 Process Document", type="primary"):
@@ -97,8 +126,10 @@ with st.sidebar:
             with st.status("Processing Document...", expanded=True) as status:
                 try:
                     # 1. Save file locally
-                    os.makedirs("data/uploaded", exist_ok=True)
-                    file_path = os.path.join("data/uploaded", uploaded_file.name)
+                    from manage_data import upload_dir
+                    target_dir = upload_dir(ws)
+                    os.makedirs(target_dir, exist_ok=True)
+                    file_path = os.path.join(target_dir, uploaded_file.name)
                     with open(file_path, "wb") as f:
                         f.write(uploaded_file.getbuffer())
                     st.write(f"✅ File saved: `{uploaded_file.name}`")
@@ -109,27 +140,47 @@ with st.sidebar:
                     from vector_store import ingest_vectors
 
                     st.write("⚙️ Ingesting Vectors...")
-                    ingest_vectors(file_path, status_callback=lambda m: st.write(f"vectors: {m}"))
+                    ingest_vectors(file_path, status_callback=lambda m: st.write(f"vectors: {m}"), workspace=ws)
                     st.write("✅ Vectors Index Updated")
 
+                    st.write("📊 Extracting Tables...")
+                    from tables import ingest_tables
+                    ingest_tables(file_path, status_callback=lambda m: st.write(f"tables: {m}"), workspace=ws)
+                    st.write("✅ Tables Stored")
+
                     st.write("🕸️ Extracting Knowledge Graph (Llama3)...")
-                    process_document(file_path, status_callback=lambda m: st.write(f"graph: {m}")) 
+                    process_document(file_path, status_callback=lambda m: st.write(f"graph: {m}"), workspace=ws,
+                                     include_deferred=include_deferred)
                     st.write("✅ Knowledge Graph Updated")
+
+                    # LLM summaries of the whole graph take minutes: updated in the background
+                    from communities import start_build_job
+                    start_build_job(ws)
+                    st.write("🧩 Community summaries are updating in the background")
                     
                     status.update(label="Processing Complete!", state="complete", expanded=False)
+                    known_workspaces.clear()
                     st.balloons()
                     
                 except Exception as e:
                     status.update(label="Processing Failed", state="error")
                     st.error(f"Error: {e}")
 
+    from communities import get_build_job
+    community_job = get_build_job(ws)
+    if community_job and community_job["state"] in ("queued", "running"):
+        st.caption(f"🧩 {community_job['message']}")
+    elif community_job and community_job["state"] == "failed":
+        st.caption(f"⚠️ {community_job['message']}")
+
     st.markdown("---")
+    st.caption(f"⚡ LLM calls saved by fast routing this session: {st.session_state.get('llm_calls_saved', 0)}")
     st.markdown("###### Powered by LangGraph & TiDB")
 
     # Document Selector
     try:
         from manage_data import list_documents
-        available_docs = list_documents()
+        available_docs = list_documents(ws)
         if available_docs:
             st.markdown("### 📂 Filter Context")
             selected_docs = st.multiselect(
@@ -187,26 +238,51 @@ with tab1:
                     
                     inputs = {
                         "question": prompt,
-                        "selected_sources": st.session_state.get("selected_docs", [])
+                        "selected_sources": st.session_state.get("selected_docs", []),
+                        "workspace": st.session_state.get("workspace")
                     }
+
+                    # Evidence from earlier turns of this conversation
+                    from config import MEMORY_ENABLED
+                    memory = None
+                    if MEMORY_ENABLED:
+                        from session_memory import SessionMemory
+                        memory = st.session_state.setdefault("retrieval_memory", SessionMemory())
+                        inputs.update(memory.start_turn(prompt, inputs["workspace"], inputs["selected_sources"]))
+                        if inputs["recalled"]:
+                            status.write(f"🧠 **Memory**: Reusing {inputs['recalled']} documents from earlier questions")
+                    documents = list(inputs.get("documents", []))
                     # Placeholder for graph visualization (future)
                     
                     for output in agent_app.stream(inputs):
                         for key, value in output.items():
+                            # Nodes return only their new evidence records
+                            documents.extend(value.get("documents") or [])
                             if key == "supervisor":
-                                status.write(f"📋 **Supervisor**: Planning step {value.get('attempts', 1)}")
+                                if value.get("route_source") in ("memory", "confidence", "rules", "classifier"):
+                                    st.session_state.llm_calls_saved = st.session_state.get("llm_calls_saved", 0) + 1
+                                    status.write(f"⚡ **Router**: {value['plan']['next_step']} ({value['route_source']})")
+                                else:
+                                    status.write(f"📋 **Supervisor**: Planning step {value.get('attempts', 1)}")
                             elif key == "vector_search":
                                 status.write(f"🔍 **Vector Search**: Found relevant documents")
                             elif key == "graph_search":
                                 status.write(f"🕸️ **Graph Search**: Querying knowledge graph")
+                            elif key == "graphrag_search":
+                                status.write(f"🧭 **GraphRAG Search**: Expanding document entities")
+                            elif key == "global_search":
+                                status.write(f"🌐 **Global Search**: Reading community summaries")
                             elif key == "generator":
                                 status.write("✍️ **Generator**: Drafting response...")
                                 if "answer" in value:
                                     full_response = value["answer"]
                             elif key == "reviewer":
-                                status.write("⚖️ **Reviewer**: Validating answer...")
+                                source = "grounding check" if value.get("review_source") == "grounding" else "LLM"
+                                status.write(f"⚖️ **Reviewer**: {value.get('review_verdict', 'Validating')} ({source})")
                     
                     status.update(label="Complete", state="complete", expanded=False)
+                    if memory is not None:
+                        memory.remember(documents)
                     
                     if full_response:
                         message_placeholder.markdown(full_response)
@@ -226,9 +302,24 @@ with tab2:
     st.header("🗂️ Managed Resources")
     
     try:
-        from manage_data import list_documents, delete_document
+        from manage_data import list_documents, start_delete_job, get_job
         
-        docs = list_documents()
+        # Progress of a running background deletion
+        job_id = st.session_state.get("delete_job")
+        if job_id:
+            job = get_job(job_id)
+            if job is None:
+                del st.session_state["delete_job"]
+            elif job["state"] in ("queued", "running"):
+                st.info(job["message"], icon="⏳")
+            else:
+                if job["state"] == "done":
+                    st.toast(job["message"], icon="✅")
+                else:
+                    st.toast(job["message"], icon="⚠️")
+                del st.session_state["delete_job"]
+        
+        docs = list_documents(st.session_state.get("workspace"))
         
         if not docs:
             st.info("No documents uploaded yet.", icon="ℹ️")
@@ -244,22 +335,24 @@ with tab2:
                 c3.markdown("**Action**")
                 st.divider()
 
+                busy = "delete_job" in st.session_state
                 for doc in docs:
                     c1, c2, c3 = st.columns([3, 1, 1])
                     c1.write(f"📄 {doc}")
                     c2.write("PDF") # Assuming PDF for now
                     
-                    if c3.button("🗑️ Delete", key=f"del_{doc}"):
-                        with st.spinner(f"Deleting {doc}..."):
-                            res = delete_document(doc)
-                            if res['disk'] or res['vector'] or res['graph']:
-                                st.toast(f"Deleted {doc}", icon="✅")
-                            else:
-                                st.toast(f"Could not delete {doc}", icon="⚠️")
-                        time.sleep(1) # Give time for toast
+                    if c3.button("🗑️ Delete", key=f"del_{doc}", disabled=busy):
+                        st.session_state["delete_job"] = start_delete_job(doc, st.session_state.get("workspace"))
+                        # Remembered evidence may quote the deleted document
+                        st.session_state.pop("retrieval_memory", None)
                         st.rerun()
                     
                     st.divider()
                         
+        if "delete_job" in st.session_state:
+            # Poll until the background deletion finishes
+            time.sleep(1)
+            st.rerun()
+                        
     except ImportError:
         st.error("Could not import manage_data module. Please check installation.")
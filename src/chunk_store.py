@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+import threading
+
+from config import (
+    CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_STORE_DIR, EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_ONNX_DIR
+)
+from chunker import chunk_pages
+from pdf_loader import iter_pages, file_hash, page_text_mode
+from resources import get_tokenizer, get_embeddings
+
+# Bump when chunking logic changes so persisted boundaries are recomputed
+CHUNKER_VERSION = 2
+_tokenizer_failed = False
+
+def chunk_params():
+    return {
+        "version": CHUNKER_VERSION,
+        "max_tokens": CHUNK_TOKENS,
+        "overlap_tokens": CHUNK_OVERLAP_TOKENS,
+        "tokenizer": EMBEDDING_MODEL,
+        # Table regions are cut out of the page text in "tables" mode, which moves boundaries
+        "page_text": page_text_mode(),
+    }
+
+def count_tokens(texts):
+    """Token counts with the embedding model's tokenizer (~4/3 tokens per word if it can't load)."""
+    global _tokenizer_failed
+    if not _tokenizer_failed:
+        try:
+            encoded = get_tokenizer()(list(texts), add_special_tokens=False)["input_ids"]
+            return [len(ids) for ids in encoded]
+        except (ImportError, OSError) as e:
+            print(f"Tokenizer unavailable, estimating token counts: {e}")
+            _tokenizer_failed = True
+    return [max(1, round(len(t.split()) * 4 / 3)) for t in texts]
+
+def load_chunks(file_path: str):
+    """
+    Chunks of a PDF for the current parameters. Boundaries are persisted under
+    data/chunk_store/<file sha256>/<params hash>.json, so ingestion stages and reruns share
+    the exact same chunks (and chunk keys) without re-chunking.
+    """
+    digest = file_hash(file_path)
+    params = chunk_params()
+    params_key = hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(CHUNK_STORE_DIR, digest, f"{params_key}.json")
+
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            chunks = json.load(f)["chunks"]
+    else:
+        pages = ((page, text) for page, text, _ in iter_pages(file_path))
+        chunks = chunk_pages(pages, digest, count_tokens, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"params": params, "chunks": chunks}, f)
+        os.replace(tmp, path)
+
+    for chunk in chunks:
+        chunk["source"] = file_path
+    return chunks
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by (model, backend, text) in a local SQLite file. Re-chunking experiments
+    only embed spans whose text actually changed. Backends produce slightly different vectors
+    (the ONNX export is int8-quantized), so each keeps its own entries.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CHUNK_STORE_DIR, "embeddings.sqlite")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector TEXT)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def key(text):
+        # The ONNX export directory names the exported (quantized) model
+        backend = f"onnx:{EMBEDDING_ONNX_DIR}" if EMBEDDING_BACKEND == "onnx" else EMBEDDING_BACKEND
+        return hashlib.sha1(f"{EMBEDDING_MODEL}\0{backend}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock, self._connect() as conn:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ", ".join(["?"] * len(batch))
+                for key, vector in conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ):
+                    found[key] = json.loads(vector)
+        return found
+
+    def put_many(self, items):
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, json.dumps(vector)) for key, vector in items.items()]
+            )
+
+def embed_chunks(chunks, status_callback=None):
+    """Embeddings for chunks in order; cached texts are not embedded again."""
+    cache = EmbeddingCache()
+    keys = [EmbeddingCache.key(c["text"]) for c in chunks]
+    vectors = cache.get_many(list(set(keys)))
+    missing = list(dict.fromkeys(k for k in keys if k not in vectors))
+
+    msg = f"Embedding {len(missing)} chunks ({len(chunks) - len(missing)} reused from cache)..."
+    print(msg)
+    if status_callback: status_callback(msg)
+
+    if missing:
+        texts = {key: chunk["text"] for key, chunk in zip(keys, chunks)}
+        new_vectors = get_embeddings().embed_documents([texts[k] for k in missing])
+        fresh = dict(zip(missing, new_vectors))
+        cache.put_many(fresh)
+        vectors.update(fresh)
+    return [vectors[k] for k in keys]
+
+if __name__ == "__main__":
+    # Usage: python src/chunk_store.py <file.pdf>  (chunks a PDF and prints a summary)
+    if len(sys.argv) < 2:
+        print("Usage: python src/chunk_store.py <file.pdf>")
+        sys.exit(1)
+    result = load_chunks(sys.argv[1])
+    tokens = [c["tokens"] for c in result]
+    print(f"{len(result)} chunks, {sum(tokens)} tokens, max {max(tokens, default=0)}, params {chunk_params()}")
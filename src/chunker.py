@@ -0,0 +1,179 @@
+import re
+import hashlib
+
+# Sentence ends followed by whitespace and something that starts a sentence
+SENTENCE_END = re.compile(r"(?<=[.!?;:])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9•\-–])")
+NUMBERED_HEADING = re.compile(r"^((item|part|section|note)\s+\d+[a-z]?\b|\d+(\.\d+)*\.?\s+[A-Z])", re.IGNORECASE)
+MAX_HEADING_CHARS = 100
+MAX_HEADING_WORDS = 12
+
+def is_heading(line: str):
+    """
+    Short line without sentence punctuation that is numbered ("Item 7.", "2.3 Revenue"),
+    ALL CAPS, or Title Case.
+    """
+    line = line.strip()
+    if not line or len(line) > MAX_HEADING_CHARS or len(line.split()) > MAX_HEADING_WORDS:
+        return False
+    if NUMBERED_HEADING.match(line):
+        return True
+    if line[-1] in ".,;:":
+        return False
+    letters = [c for c in line if c.isalpha()]
+    if len(letters) < 3:
+        return False
+    if line.isupper():
+        return True
+    words = [w for w in re.findall(r"[A-Za-z][\w'&-]*", line) if len(w) > 3]
+    return 0 < len(words) <= 8 and all(w[0].isupper() for w in words)
+
+def split_units(text: str):
+    """
+    Splits page text into ("heading" | "sentence", start, end) spans with character offsets.
+    Paragraphs end at blank lines and headings; sentences are split inside paragraphs.
+    """
+    units = []
+    para_start = None
+    para_end = None
+
+    def flush():
+        if para_start is None:
+            return
+        start = para_start
+        for match in SENTENCE_END.finditer(text, para_start, para_end):
+            if match.start() > start:
+                units.append(("sentence", start, match.start()))
+            start = match.end()
+        if para_end > start:
+            units.append(("sentence", start, para_end))
+
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        line_start = offset + (len(line) - len(line.lstrip()))
+        line_end = line_start + len(stripped)
+        offset += len(line)
+        if not stripped:
+            flush()
+            para_start = None
+        elif is_heading(stripped):
+            flush()
+            para_start = None
+            units.append(("heading", line_start, line_end))
+        else:
+            if para_start is None:
+                para_start = line_start
+            para_end = line_end
+    flush()
+    return units
+
+def chunk_key(file_hash: str, page: int, start: int, text: str):
+    """Stable id of a chunk: the same span of the same file always gets the same key."""
+    return hashlib.sha1(f"{file_hash}:{page}:{start}:{text}".encode("utf-8")).hexdigest()
+
+def chunk_pages(pages, file_hash, count_tokens, max_tokens=256, overlap_tokens=32):
+    """
+    Structure-aware chunking of [(page, text)].
+
+    - chunks never cross a heading or a page; the current heading is kept as metadata
+    - sentences are packed until max_tokens (measured with count_tokens, the embedding
+      model's tokenizer), the next chunk repeats trailing sentences up to overlap_tokens
+    - a sentence longer than max_tokens is split on whitespace
+
+    Returns a list of dicts: key, page, start, end, heading, tokens, text.
+    """
+    chunks = []
+    heading = ""
+    for page, text in pages:
+        units = split_units(text)
+        sentences = [(s, e) for kind, s, e in units if kind == "sentence"]
+        lengths = dict(zip(sentences, count_tokens([text[s:e] for s, e in sentences]))) if sentences else {}
+
+        current = []  # [(start, end, tokens)]
+
+        def emit():
+            if not current:
+                return
+            start, end = current[0][0], current[-1][1]
+            body = text[start:end]
+            chunks.append({
+                "key": chunk_key(file_hash, page, start, body),
+                "page": page,
+                "start": start,
+                "end": end,
+                "heading": heading,
+                "tokens": sum(t for _, _, t in current),
+                "text": body,
+            })
+
+        for kind, start, end in units:
+            if kind == "heading":
+                emit()
+                current = []
+                heading = text[start:end][:255]
+                continue
+
+            pieces = [(start, end, lengths[(start, end)])]
+            if pieces[0][2] > max_tokens:
+                pieces = _split_long(text, start, end, pieces[0][2], max_tokens)
+
+            for piece in pieces:
+                if current and sum(t for _, _, t in current) + piece[2] > max_tokens:
+                    emit()
+                    # Carry trailing sentences as overlap
+                    carried, total = [], 0
+                    for unit in reversed(current):
+                        if total + unit[2] > overlap_tokens:
+                            break
+                        carried.insert(0, unit)
+                        total += unit[2]
+                    current = carried if total + piece[2] <= max_tokens else []
+                current.append(piece)
+        emit()
+    return chunks
+
+def _split_long(text, start, end, tokens, max_tokens):
+    """Hard split of an over-long sentence on whitespace, token counts estimated per character."""
+    n_parts = -(-tokens // max_tokens)
+    size = -(-(end - start) // n_parts)
+    pieces = []
+    pos = start
+    while pos < end:
+        stop = min(pos + size, end)
+        if stop < end:
+            space = text.rfind(" ", pos, stop)
+            stop = space if space > pos else stop
+        pieces.append((pos, stop, max(1, round(tokens * (stop - pos) / (end - start)))))
+        pos = stop
+        while pos < end and text[pos].isspace():
+            pos += 1
+    return pieces
+
+def group_windows(chunks, max_tokens):
+    """
+    Groups consecutive chunks into larger windows (e.g. for LLM graph extraction) without
+    repeating the overlap between neighbours. Returns [{"text", "keys", "page"}].
+    """
+    windows = []
+    current = None
+    for chunk in chunks:
+        if current and current["tokens"] + chunk["tokens"] > max_tokens:
+            windows.append(current)
+            current = None
+        if current is None:
+            current = {"text": chunk["text"], "keys": [chunk["key"]], "page": chunk["page"],
+                       "tokens": chunk["tokens"], "_last": chunk}
+            continue
+        last = current["_last"]
+        if last["page"] == chunk["page"] and chunk["start"] < last["end"]:
+            current["text"] += chunk["text"][last["end"] - chunk["start"]:]
+        else:
+            current["text"] += "\n\n" + chunk["text"]
+        current["keys"].append(chunk["key"])
+        current["tokens"] += chunk["tokens"]
+        current["_last"] = chunk
+    if current:
+        windows.append(current)
+    for window in windows:
+        del window["_last"]
+    return windows
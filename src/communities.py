@@ -0,0 +1,175 @@
+import sys
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.prompts import ChatPromptTemplate
+
+from config import COMMUNITY_MIN_SIZE, COMMUNITY_RESOLUTION, COMMUNITY_TOP_K
+from resources import get_graph, get_json_llm, get_embeddings
+from evidence import Evidence, COMMUNITY
+
+# Cap the prompt size for very large communities
+MAX_EDGES_IN_PROMPT = 150
+
+summary_prompt = """
+You are a Corporate Analyst summarizing one cluster of a Knowledge Graph built from company filings.
+Describe what ties these entities together: the main theme, key organizations and people,
+and the most important relationships.
+
+Return a strictly valid JSON object:
+{{"title": "Short theme title", "summary": "One paragraph summary"}}
+"""
+
+def community_signature(members, edges):
+    """
+    Content hash of a community (members + internal edges). A community keeps its id as
+    long as nothing inside it changes, so only communities touched by new ingests get
+    a new id and need a new summary.
+    """
+    payload = json.dumps({"members": sorted(members), "edges": sorted(edges)})
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def detect_communities(edges):
+    """Louvain community detection over the entity graph. Returns [(members, internal_edges)]."""
+    import networkx as nx
+    from networkx.algorithms.community import louvain_communities
+
+    G = nx.Graph()
+    for e in edges:
+        if G.has_edge(e["source"], e["target"]):
+            G[e["source"]][e["target"]]["weight"] += 1
+        else:
+            G.add_edge(e["source"], e["target"], weight=1)
+
+    # Fixed seed keeps the partition stable between runs on an unchanged graph
+    partition = louvain_communities(G, weight="weight", resolution=COMMUNITY_RESOLUTION, seed=42)
+
+    communities = [sorted(m) for m in partition if len(m) >= COMMUNITY_MIN_SIZE]
+    membership = {node: idx for idx, members in enumerate(communities) for node in members}
+    internal = [[] for _ in communities]
+    for e in edges:
+        idx = membership.get(e["source"])
+        if idx is not None and membership.get(e["target"]) == idx:
+            internal[idx].append((e["source"], e["type"], e["target"]))
+
+    return list(zip(communities, internal))
+
+def summarize_community(llm, node_types, members, internal_edges):
+    nodes_text = "\n".join(f"- {m} ({node_types.get(m, 'Unknown')})" for m in members)
+    edges_text = "\n".join(f"- {s} -[{t}]-> {o}" for s, t, o in internal_edges[:MAX_EDGES_IN_PROMPT])
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", summary_prompt),
+        ("human", "Entities:\n{nodes}\n\nRelationships:\n{edges}")
+    ])
+    response = (prompt | llm).invoke({"nodes": nodes_text, "edges": edges_text})
+    data = json.loads(response.content)
+    return data.get("title", "Untitled"), data.get("summary", "")
+
+def build_communities(full: bool = False, status_callback=None, workspace=None):
+    """
+    Offline job: detect the communities of a workspace's graph and summarize each one with the LLM.
+    Incremental by default: communities whose content hash is already stored are kept,
+    stale ones are deleted, and only new/changed ones are summarized.
+    """
+    def report(msg):
+        print(msg)
+        if status_callback: status_callback(msg)
+
+    graph = get_graph(workspace)
+    ws = (graph.workspace,)
+    edges = graph.query("SELECT source, target, type FROM edges WHERE workspace_id = %s AND type <> 'MENTIONED_IN'", ws)
+    node_types = {row["id"]: row["type"] for row in graph.query(
+        "SELECT id, type FROM nodes WHERE workspace_id = %s AND type <> 'Document'", ws
+    )}
+    report(f"Loaded {len(node_types)} entities and {len(edges)} relationships.")
+
+    detected = {}
+    for members, internal in detect_communities(edges):
+        detected[community_signature(members, internal)] = (members, internal)
+
+    existing = set() if full else {row["id"] for row in graph.query("SELECT id FROM communities WHERE workspace_id = %s", ws)}
+    stale = (existing - set(detected)) if not full else None
+    to_summarize = [cid for cid in detected if cid not in existing]
+    report(f"{len(detected)} communities: {len(detected) - len(to_summarize)} unchanged, {len(to_summarize)} to summarize.")
+
+    if full:
+        graph.query("DELETE FROM communities WHERE workspace_id = %s", ws)
+    elif stale:
+        placeholders = ", ".join(["%s"] * len(stale))
+        graph.query(f"DELETE FROM communities WHERE workspace_id = %s AND id IN ({placeholders})", ws + tuple(stale))
+        report(f"Removed {len(stale)} stale communities.")
+
+    if not to_summarize:
+        return
+
+    llm = get_json_llm()
+    embeddings_model = get_embeddings()
+
+    for i, cid in enumerate(to_summarize, 1):
+        members, internal = detected[cid]
+        try:
+            title, summary = summarize_community(llm, node_types, members, internal)
+            embedding = embeddings_model.embed_query(f"{title}\n{summary}")
+            graph.save_community(cid, title, summary, members, embedding)
+            report(f"[{i}/{len(to_summarize)}] {title} ({len(members)} entities)")
+        except Exception as e:
+            print(f"Error summarizing community {cid[:8]}: {e}")
+
+# Builds run in the background, one at a time, so an upload never waits for the LLM summaries.
+# One job per workspace: a request while its build runs schedules exactly one more build.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="communities")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def _run_build_job(workspace):
+    while True:
+        with _jobs_lock:
+            _jobs[workspace].update(state="running", rerun=False, message="Updating community summaries...")
+
+        def on_progress(msg):
+            with _jobs_lock:
+                _jobs[workspace]["message"] = msg
+
+        try:
+            build_communities(status_callback=on_progress, workspace=workspace)
+            state, message = "done", "Community summaries are up to date"
+        except Exception as e:
+            state, message = "failed", f"Community update failed: {e}"
+        with _jobs_lock:
+            if not _jobs[workspace]["rerun"]:
+                _jobs[workspace].update(state=state, message=message)
+                return
+
+def start_build_job(workspace=None):
+    """Queues an incremental build_communities for the workspace (coalesced with one already pending)."""
+    with _jobs_lock:
+        job = _jobs.get(workspace)
+        if job and job["state"] == "queued":
+            return
+        if job and job["state"] == "running":
+            job["rerun"] = True
+            return
+        _jobs[workspace] = {"workspace": workspace, "state": "queued", "rerun": False,
+                            "message": "Community summaries update queued"}
+    _executor.submit(_run_build_job, workspace)
+
+def get_build_job(workspace=None):
+    """Snapshot of the workspace's community build, or None if none was started."""
+    with _jobs_lock:
+        job = _jobs.get(workspace)
+        return dict(job) if job else None
+
+def global_search(query: str, top_k: int = COMMUNITY_TOP_K, workspace=None):
+    """Global retrieval mode: the community summaries (Evidence records) most relevant to a corpus-wide question."""
+    try:
+        query_embedding = get_embeddings().embed_query(query)
+        results = get_graph(workspace).search_communities(query_embedding, top_k=top_k)
+        return [Evidence(COMMUNITY, text=row["summary"], source=row["title"], size=row["node_count"],
+                         score=float(row["distance"]) if row["distance"] is not None else None, query=query)
+                for row in results]
+    except Exception as e:
+        return [Evidence.error(f"Error searching communities: {e}", query)]
+
+if __name__ == "__main__":
+    build_communities(full="--full" in sys.argv)
@@ -1,4 +1,5 @@
 import os
+import logging
 from dotenv import load_dotenv
 
 # Load environment variables once
@@ -12,13 +13,120 @@ TIDB_USER = os.getenv("TIDB_USER", "root").strip()
 TIDB_PASSWORD = os.getenv("TIDB_PASSWORD", "").strip()
 TIDB_DATABASE = os.getenv("TIDB_DATABASE", "test").strip()
 TIDB_CA_PATH = os.getenv("TIDB_CA_PATH", "").strip()
+# Optional read-only account for LLM-generated SQL (falls back to the main account)
+TIDB_READONLY_USER = os.getenv("TIDB_READONLY_USER", "").strip()
+TIDB_READONLY_PASSWORD = os.getenv("TIDB_READONLY_PASSWORD", "").strip()
+# Refuse to run LLM-generated SQL unless the read-only account above is configured
+SQL_REQUIRE_READONLY_USER = os.getenv("SQL_REQUIRE_READONLY_USER", "false").lower() == "true"
 
-print(f"DEBUG CONFIG: Host={TIDB_HOST}, Port={TIDB_PORT}, User={TIDB_USER}")
+logging.getLogger(__name__).debug(f"Config: Host={TIDB_HOST}, Port={TIDB_PORT}, User={TIDB_USER}")
 
 # LLM Configuration
 LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.1-8b-instant")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# Embedding inference: "huggingface" (PyTorch) or "onnx" (ONNX Runtime, int8-quantized, CPU)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "huggingface").lower()
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = runtime default
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "8192"))
+EMBEDDING_MAX_LENGTH = int(os.getenv("EMBEDDING_MAX_LENGTH", "256"))
+# Max allowed 1 - cosine(backend, reference) per text
+EMBEDDING_TOLERANCE = float(os.getenv("EMBEDDING_TOLERANCE", "0.02"))
 # OLLAMA_BASE_URL removed as we are using Cloud LLM (Groq) and Local Embeddings (FastEmbed)
 
+# Retrieval Configuration
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+# Adaptive retrieval: widen top_k when the best hits are far, stop searching once evidence is close
+ADAPTIVE_RETRIEVAL = os.getenv("ADAPTIVE_RETRIEVAL", "true").lower() == "true"
+RETRIEVAL_MAX_TOP_K = int(os.getenv("RETRIEVAL_MAX_TOP_K", "20"))
+RETRIEVAL_POOR_DISTANCE = float(os.getenv("RETRIEVAL_POOR_DISTANCE", "0.6"))
+EVIDENCE_CONFIDENCE_THRESHOLD = float(os.getenv("EVIDENCE_CONFIDENCE_THRESHOLD", "0.6"))
+# Chunk sizes in embedding-model tokens (all-MiniLM-L6-v2 truncates at 256)
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+# Graph extraction reads windows of consecutive chunks
+GRAPH_WINDOW_TOKENS = int(os.getenv("GRAPH_WINDOW_TOKENS", "1024"))
+# Several windows are packed into one extraction request (input token budget, max windows)
+GRAPH_PACK_TOKENS = int(os.getenv("GRAPH_PACK_TOKENS", "6000"))
+GRAPH_PACK_MAX_CHUNKS = int(os.getenv("GRAPH_PACK_MAX_CHUNKS", "6"))
+# Stream extraction output through the incremental JSON parser (needs a model/API that streams in JSON mode)
+EXTRACTION_STREAMING = os.getenv("EXTRACTION_STREAMING", "false").lower() == "true"
+# Local pre-filter before graph extraction: skip boilerplate / TOC / near-duplicate windows,
+# defer windows with few name-like tokens (per 100 words)
+EXTRACTION_FILTER = os.getenv("EXTRACTION_FILTER", "true").lower() == "true"
+FILTER_MIN_WORDS = int(os.getenv("FILTER_MIN_WORDS", "20"))
+FILTER_MIN_ENTITY_DENSITY = float(os.getenv("FILTER_MIN_ENTITY_DENSITY", "1.5"))
+FILTER_DUPLICATE_THRESHOLD = float(os.getenv("FILTER_DUPLICATE_THRESHOLD", "0.85"))
+# Hybrid retrieval: BM25 over chunk_terms fused with vector search (reciprocal rank fusion)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Optional cross-encoder reranking: over-fetch RERANK_CANDIDATES, keep top_k
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "10000"))
+# GraphRAG retrieval: neighborhood expansion around vector hits
+GRAPHRAG_HOPS = int(os.getenv("GRAPHRAG_HOPS", "2"))
+GRAPHRAG_MAX_EDGES = int(os.getenv("GRAPHRAG_MAX_EDGES", "100"))
+# Community summaries for global (corpus-wide) questions
+COMMUNITY_MIN_SIZE = int(os.getenv("COMMUNITY_MIN_SIZE", "3"))
+COMMUNITY_RESOLUTION = float(os.getenv("COMMUNITY_RESOLUTION", "1.0"))
+COMMUNITY_TOP_K = int(os.getenv("COMMUNITY_TOP_K", "20"))
+# Guardrails for LLM-generated SQL
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "200"))
+SQL_MAX_EXECUTION_MS = int(os.getenv("SQL_MAX_EXECUTION_MS", "3000"))
+SQL_MAX_EST_ROWS = int(os.getenv("SQL_MAX_EST_ROWS", "500000"))
+SQL_MAX_CELL_CHARS = int(os.getenv("SQL_MAX_CELL_CHARS", "500"))
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "500"))
+# Fast routing in front of the LLM supervisor (keyword rules + embedding classifier)
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+ROUTER_MIN_SIMILARITY = float(os.getenv("ROUTER_MIN_SIMILARITY", "0.55"))
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.08"))
+ROUTER_MIN_EXAMPLES = int(os.getenv("ROUTER_MIN_EXAMPLES", "5"))
+# Local grounding check before the LLM reviewer (share of supported answer sentences)
+GROUNDING_APPROVE_THRESHOLD = float(os.getenv("GROUNDING_APPROVE_THRESHOLD", "0.8"))
+GROUNDING_REJECT_THRESHOLD = float(os.getenv("GROUNDING_REJECT_THRESHOLD", "0.3"))
+# Paraphrased sentences: cosine similarity to a document sentence that counts as support (0 = n-grams only)
+GROUNDING_EMBEDDING_SIMILARITY = float(os.getenv("GROUNDING_EMBEDDING_SIMILARITY", "0.75"))
+REVIEWER_CONTEXT_CHARS = int(os.getenv("REVIEWER_CONTEXT_CHARS", "6000"))
+# Session memory: evidence of earlier chat turns reused by follow-up questions
+MEMORY_ENABLED = os.getenv("MEMORY_ENABLED", "true").lower() == "true"
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "6000"))
+MEMORY_RECALL_SIMILARITY = float(os.getenv("MEMORY_RECALL_SIMILARITY", "0.4"))
+MEMORY_ANSWER_SIMILARITY = float(os.getenv("MEMORY_ANSWER_SIMILARITY", "0.65"))
+MEMORY_MAX_RECALL = int(os.getenv("MEMORY_MAX_RECALL", "8"))
+MEMORY_CONDENSE_TURNS = int(os.getenv("MEMORY_CONDENSE_TURNS", "2"))
+# Page-parallel PDF parsing (0 workers = one per CPU)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# Detect tables with pdfplumber and store them as rows (table text is kept out of chunks)
+TABLE_EXTRACTION = os.getenv("TABLE_EXTRACTION", "true").lower() == "true"
+# Vector search backend: "tidb" (VEC_COSINE_DISTANCE in SQL) or "local" (memory-mapped index)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "tidb").lower()
+# TiDB KNN: the HNSW index only serves unfiltered ORDER BY distance LIMIT queries, so top_k * factor
+# candidates are fetched and filtered (workspace, documents, exclusions); the pool widens up to the max
+VECTOR_CANDIDATE_FACTOR = int(os.getenv("VECTOR_CANDIDATE_FACTOR", "4"))
+VECTOR_MAX_CANDIDATES = int(os.getenv("VECTOR_MAX_CANDIDATES", "2000"))
+# Local index storage: float32, float16 or int8 (the latter two rescore candidates at float32).
+# Only used by VECTOR_BACKEND=local: with the default "tidb" backend embeddings are stored, searched
+# and transferred as float32 VECTOR columns and this setting has no effect.
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "int8").lower()
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "4"))
+# Rows per transaction when deleting a document
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "1000"))
+# Tenant whose data a process reads and writes unless a workspace is passed explicitly
+DEFAULT_WORKSPACE = os.getenv("WORKSPACE", "default")
+
 # Data Configuration
 UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "uploaded")
+EVAL_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "eval_cache")
+# One exported model per EMBEDDING_MODEL, so switching models never loads a stale export
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "models", EMBEDDING_MODEL.replace("/", "--") + "-onnx-int8"
+)
+PAGE_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "page_cache")
+CHUNK_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "chunk_store")
+LOCAL_INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "local_index")
+ROUTER_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "router")
+# Per-workspace copies of the directories above (the default workspace uses the originals)
+WORKSPACES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "workspaces")
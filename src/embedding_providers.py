@@ -0,0 +1,184 @@
+import os
+import sys
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import (
+    EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_THREADS, EMBEDDING_BATCH_TOKENS,
+    EMBEDDING_MAX_LENGTH, EMBEDDING_ONNX_DIR, EMBEDDING_TOLERANCE
+)
+
+BACKENDS = ("huggingface", "onnx")
+ONNX_MODEL_FILE = "model_int8.onnx"
+# Upper bound on rows per batch, however short the texts are
+MAX_BATCH_ROWS = 256
+
+def length_batches(lengths, max_tokens=EMBEDDING_BATCH_TOKENS, max_rows=MAX_BATCH_ROWS):
+    """
+    Groups text indices by token length so each batch is padded to a similar length:
+    rows * longest_in_batch stays under max_tokens. Short chunks form large batches,
+    long chunks small ones.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches, current, longest = [], [], 0
+    for i in order:
+        candidate = max(longest, lengths[i])
+        if current and (candidate * (len(current) + 1) > max_tokens or len(current) >= max_rows):
+            batches.append(current)
+            current, candidate = [], lengths[i]
+        current.append(i)
+        longest = candidate
+    if current:
+        batches.append(current)
+    return batches
+
+def export_onnx(model_dir=EMBEDDING_ONNX_DIR, model_name=EMBEDDING_MODEL):
+    """
+    One-time export of the reference model to ONNX plus dynamic int8 quantization
+    (weights int8, activations quantized at runtime). Needs optimum[onnxruntime].
+    """
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from transformers import AutoTokenizer
+
+    fp32_dir = os.path.join(model_dir, "fp32")
+    print(f"Exporting {model_name} to ONNX...")
+    ORTModelForFeatureExtraction.from_pretrained(model_name, export=True).save_pretrained(fp32_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+    print("Quantizing to int8...")
+    quantize_dynamic(
+        os.path.join(fp32_dir, "model.onnx"),
+        os.path.join(model_dir, ONNX_MODEL_FILE),
+        weight_type=QuantType.QInt8,
+    )
+    print(f"ONNX model saved to {model_dir}")
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence-transformers compatible embeddings on ONNX Runtime (int8, CPU):
+    mean pooling over the attention mask and L2 normalization, like all-MiniLM-L6-v2.
+    """
+
+    def __init__(self, model_dir=EMBEDDING_ONNX_DIR, threads=EMBEDDING_THREADS,
+                 max_tokens=EMBEDDING_BATCH_TOKENS, max_length=EMBEDDING_MAX_LENGTH):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = os.path.join(model_dir, ONNX_MODEL_FILE)
+        if not os.path.exists(model_path):
+            export_onnx(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_tokens = max_tokens
+        self.max_length = max_length
+
+    def _encode(self, texts):
+        encoded = self.tokenizer(list(texts), truncation=True, max_length=self.max_length)
+        lengths = [len(ids) for ids in encoded["input_ids"]]
+        vectors = [None] * len(texts)
+        for batch in length_batches(lengths, self.max_tokens):
+            padded = self.tokenizer.pad(
+                {key: [encoded[key][i] for i in batch] for key in encoded.keys()},
+                return_tensors="np"
+            )
+            feeds = {key: padded[key].astype("int64") for key in padded.keys() if key in self.input_names}
+            if "token_type_ids" in self.input_names and "token_type_ids" not in feeds:
+                feeds["token_type_ids"] = np.zeros_like(feeds["input_ids"])
+            hidden = self.session.run(None, feeds)[0]
+            mask = padded["attention_mask"][..., None].astype("float32")
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            for row, i in enumerate(batch):
+                vectors[i] = pooled[row]
+        return vectors
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return [v.tolist() for v in self._encode(texts)]
+
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
+
+def create_embeddings(backend=None):
+    """Embedding model for EMBEDDING_BACKEND; every backend speaks the LangChain Embeddings interface."""
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend == "onnx":
+        return OnnxEmbeddings()
+    if backend == "huggingface":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        if EMBEDDING_THREADS:
+            import torch
+            torch.set_num_threads(EMBEDDING_THREADS)
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, encode_kwargs={"normalize_embeddings": True})
+    raise ValueError(f"Unknown embedding backend: {backend} (expected one of {BACKENDS})")
+
+def benchmark(texts, backends=BACKENDS, reference="huggingface"):
+    """
+    Chunks/sec per backend, and cosine similarity to the reference model's embeddings
+    (a backend passes when every text is within EMBEDDING_TOLERANCE of the reference).
+    """
+    results = []
+    reference_vectors = None
+    for backend in [reference] + [b for b in backends if b != reference]:
+        try:
+            model = create_embeddings(backend)
+        except Exception as e:
+            print(f"{backend}: unavailable ({e})")
+            continue
+        model.embed_documents(texts[:8])  # warm-up
+        start = time.time()
+        vectors = np.asarray(model.embed_documents(texts), dtype="float32")
+        elapsed = time.time() - start
+
+        result = {"backend": backend, "chunks_per_sec": len(texts) / elapsed, "seconds": elapsed}
+        if reference_vectors is None:
+            reference_vectors = vectors
+        cosine = (vectors * reference_vectors).sum(axis=1)
+        result.update({
+            "min_cosine": float(cosine.min()),
+            "mean_cosine": float(cosine.mean()),
+            "within_tolerance": bool(cosine.min() >= 1.0 - EMBEDDING_TOLERANCE),
+        })
+        results.append(result)
+
+    print(f"{len(texts)} chunks, threads={EMBEDDING_THREADS or 'default'}, batch tokens={EMBEDDING_BATCH_TOKENS}")
+    print(f"{'backend':<12} {'chunks/s':>9} {'min cos':>8} {'mean cos':>9}  ok")
+    for r in results:
+        print(f"{r['backend']:<12} {r['chunks_per_sec']:>9.1f} {r['min_cosine']:>8.4f} "
+              f"{r['mean_cosine']:>9.4f}  {'yes' if r['within_tolerance'] else 'NO'}")
+    return results
+
+def _sample_texts(limit, file_path=None):
+    if file_path:
+        from chunk_store import load_chunks
+        return [c["text"] for c in load_chunks(file_path)][:limit]
+    from resources import get_graph
+    graph = get_graph()
+    return [row["content"] for row in graph.query(
+        "SELECT content FROM chunks WHERE workspace_id = %s LIMIT %s", (graph.workspace, limit)
+    )]
+
+if __name__ == "__main__":
+    # Usage: python src/embedding_providers.py --export | --benchmark [--file report.pdf] [--n 1000]
+    if "--export" in sys.argv:
+        export_onnx()
+    elif "--benchmark" in sys.argv:
+        n = int(sys.argv[sys.argv.index("--n") + 1]) if "--n" in sys.argv else 1000
+        file_path = sys.argv[sys.argv.index("--file") + 1] if "--file" in sys.argv else None
+        texts = _sample_texts(n, file_path)
+        if not texts:
+            print("No chunks to benchmark. Ingest a document or pass --file.")
+        else:
+            benchmark(texts)
+    else:
+        print("Usage: python src/embedding_providers.py --export | --benchmark [--file report.pdf] [--n 1000]")
@@ -1,88 +1,244 @@
 import os
 import json
-from ragas import evaluate
-from ragas.metrics import (
-    faithfulness,
-    answer_relevancy,
-    context_precision,
-    context_recall
+import math
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import (
+    LLM_MODEL, EMBEDDING_MODEL, EMBEDDING_BACKEND, RETRIEVAL_TOP_K, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, EVAL_CACHE_DIR,
+    HYBRID_SEARCH, RRF_K, RERANK_ENABLED, RERANK_MODEL, RERANK_CANDIDATES,
+    VECTOR_BACKEND, VECTOR_CANDIDATE_FACTOR, VECTOR_MAX_CANDIDATES, EMBEDDING_DTYPE, RESCORE_FACTOR,
+    ADAPTIVE_RETRIEVAL, EVIDENCE_CONFIDENCE_THRESHOLD, RETRIEVAL_POOR_DISTANCE, RETRIEVAL_MAX_TOP_K
 )
-from datasets import Dataset
-from langchain_ollama import ChatOllama, OllamaEmbeddings
-from graph_agent import app # Import the agent
-
-# 1. Setup
-langchain_llm = ChatOllama(model="llama3", temperature=0)
-langchain_embeddings = OllamaEmbeddings(model="nomic-embed-text")
-
-# Ragas expects specific column names: question, answer, contexts, ground_truth
-# We will create a small Golden Dataset here or load it.
-
-golden_dataset = [
-    {
-        "question": "What is the strategic focus regarding AI?",
-        "ground_truth": " The company is focusing on autonomous agents and knowledge graphs to improve corporate research."
-    },
-    {
-        "question": "Who is the CEO?",
-        "ground_truth": "Sarah Connor is the CEO."
+from vector_store import retrieve_chunks
+from resources import get_graph
+
+# Golden set format (one JSON object per line):
+# {"question": "...", "ground_truth": "...", "relevant_chunk_ids": [12, 40]}
+# "relevant_chunk_ids" is optional; questions without labels only contribute latency.
+DEFAULT_GOLDEN_SET = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "golden_set.jsonl")
+
+# --- 1. Golden Set & Config ---
+
+def load_golden_set(path: str):
+    """Loads a JSONL golden set, skipping blank lines."""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if "question" not in item:
+                raise ValueError(f"{path}:{line_no} is missing 'question'")
+            items.append(item)
+    return items
+
+def corpus_fingerprint(graph=None):
+    """
+    Identifies the indexed corpus: chunk count, max id and an order-independent checksum of
+    the chunk keys. Re-ingesting, deleting or adding a document changes it.
+    """
+    graph = graph or get_graph()
+    row = graph.query(
+        "SELECT COUNT(*) AS n, MAX(id) AS max_id, BIT_XOR(CRC32(chunk_key)) AS keys_xor "
+        "FROM chunks WHERE workspace_id = %s",
+        (graph.workspace,)
+    )[0]
+    return f"{row['n']}:{row['max_id'] or 0}:{row['keys_xor'] or 0}"
+
+def current_settings(top_k: int, run_agent: bool, corpus: str = None, file_filters=None):
+    """Everything that can change the outputs of a run, corpus included. Its hash keys the cache."""
+    return {
+        "corpus": corpus,
+        "file_filters": sorted(file_filters) if file_filters else None,
+        "llm_model": LLM_MODEL,
+        "embedding_model": EMBEDDING_MODEL,
+        "embedding_backend": EMBEDDING_BACKEND,
+        "top_k": top_k,
+        "chunk_tokens": CHUNK_TOKENS,
+        "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS,
+        # Only the active backend's knobs: the other backend's don't change results
+        "vector": {"backend": "local", "dtype": EMBEDDING_DTYPE, "rescore": RESCORE_FACTOR}
+        if VECTOR_BACKEND == "local" else
+        {"backend": VECTOR_BACKEND, "candidates": f"{VECTOR_CANDIDATE_FACTOR}x/{VECTOR_MAX_CANDIDATES}"},
+        "hybrid": RRF_K if HYBRID_SEARCH else None,
+        "rerank": f"{RERANK_MODEL}@{RERANK_CANDIDATES}" if RERANK_ENABLED else None,
+        "agent": run_agent,
+        # top_k is fixed outside the agent, so adaptive retrieval only changes agent runs
+        "adaptive": {"confidence": EVIDENCE_CONFIDENCE_THRESHOLD, "poor_distance": RETRIEVAL_POOR_DISTANCE,
+                     "max_top_k": RETRIEVAL_MAX_TOP_K} if ADAPTIVE_RETRIEVAL and run_agent else None,
     }
-]
-
-def run_evaluation():
-    print("Starting Evaluation Run...")
-    
-    questions = []
-    answers = []
-    contexts = []
-    ground_truths = []
-    
-    for item in golden_dataset:
-        q = item["question"]
-        print(f"Evaluating: {q}")
-        
-        # Run Agent
-        inputs = {"question": q}
-        output = app.invoke(inputs)
-        
-        ans = output.get("answer", "No answer")
-        docs = output.get("documents", [])
-        
-        questions.append(q)
-        answers.append(ans)
-        contexts.append(docs)
-        ground_truths.append(item["ground_truth"])
-        
-    # Create Dataset
-    data = {
-        "question": questions,
-        "answer": answers,
-        "contexts": contexts,
-        "ground_truth": ground_truths
+
+def config_hash(settings: dict):
+    payload = json.dumps(settings, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+class EvalCache:
+    """Append-only JSONL cache of per-question records for one config hash."""
+
+    def __init__(self, settings: dict, enabled: bool = True):
+        self.enabled = enabled
+        self.path = os.path.join(EVAL_CACHE_DIR, f"{config_hash(settings)}.jsonl")
+        self.records = {}
+        self._lock = threading.Lock()
+        if enabled and os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.records[record["question"]] = record
+
+    def get(self, question: str):
+        return self.records.get(question) if self.enabled else None
+
+    def put(self, record: dict):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.records[record["question"]] = record
+            os.makedirs(EVAL_CACHE_DIR, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+# --- 2. Metrics ---
+
+def recall_at_k(retrieved_ids, relevant_ids, k: int):
+    if not relevant_ids:
+        return None
+    hits = set(retrieved_ids[:k]) & set(relevant_ids)
+    return len(hits) / len(set(relevant_ids))
+
+def reciprocal_rank(retrieved_ids, relevant_ids):
+    if not relevant_ids:
+        return None
+    relevant = set(relevant_ids)
+    for rank, chunk_id in enumerate(retrieved_ids, 1):
+        if chunk_id in relevant:
+            return 1.0 / rank
+    return 0.0
+
+def percentile(values, pct: float):
+    """Nearest-rank percentile; avoids pulling numpy in for a handful of numbers."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[index]
+
+def latency_summary(values):
+    if not values:
+        return None
+    return {
+        "mean_ms": round(sum(values) / len(values), 1),
+        "p50_ms": round(percentile(values, 50), 1),
+        "p90_ms": round(percentile(values, 90), 1),
+        "p99_ms": round(percentile(values, 99), 1),
+        "max_ms": round(max(values), 1),
+    }
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return round(sum(values) / len(values), 4) if values else None
+
+# --- 3. Runner ---
+
+def evaluate_question(item: dict, top_k: int, run_agent: bool, file_filters=None):
+    """Runs retrieval (and optionally the full agent) for one golden item."""
+    question = item["question"]
+    record = {"question": question}
+
+    start = time.perf_counter()
+    rows = retrieve_chunks(question, top_k=top_k, file_filters=file_filters)
+    record["retrieval_ms"] = (time.perf_counter() - start) * 1000
+    record["retrieved_ids"] = [row["id"] for row in rows]
+
+    if run_agent:
+        # Imported lazily: the agent connects to TiDB and Groq on import.
+        from graph_agent import app
+        start = time.perf_counter()
+        output = app.invoke({"question": question, "top_k": top_k, "selected_sources": file_filters or []})
+        record["agent_ms"] = (time.perf_counter() - start) * 1000
+        record["answer"] = output.get("answer", "No answer")
+        record["attempts"] = output.get("attempts", 0)
+        record["llm_calls_saved"] = output.get("llm_calls_saved", 0)
+
+    return record
+
+def run_evaluation(golden_path: str, top_k: int = RETRIEVAL_TOP_K, workers: int = 4,
+                   run_agent: bool = False, use_cache: bool = True, file_filters=None):
+    items = load_golden_set(golden_path)
+    settings = current_settings(top_k, run_agent, corpus_fingerprint(), file_filters)
+    cache = EvalCache(settings, enabled=use_cache)
+    print(f"Evaluating {len(items)} questions | config {config_hash(settings)} | {settings}")
+
+    records = []
+    pending = []
+    for item in items:
+        cached = cache.get(item["question"])
+        if cached:
+            records.append((item, cached))
+        else:
+            pending.append(item)
+    print(f"{len(records)} cached, {len(pending)} to run with {workers} workers.")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(evaluate_question, item, top_k, run_agent, file_filters): item for item in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            item = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                print(f"Error evaluating '{item['question']}': {e}")
+                continue
+            cache.put(record)
+            records.append((item, record))
+            print(f"[{done}/{len(pending)}] {item['question'][:60]}")
+
+    return summarize(records, top_k, settings)
+
+def summarize(records, top_k: int, settings: dict):
+    recalls, rrs = [], []
+    for item, record in records:
+        relevant = item.get("relevant_chunk_ids") or []
+        recalls.append(recall_at_k(record["retrieved_ids"], relevant, top_k))
+        rrs.append(reciprocal_rank(record["retrieved_ids"], relevant))
+
+    labeled = sum(1 for r in recalls if r is not None)
+    return {
+        "config": config_hash(settings),
+        "settings": settings,
+        "questions": len(records),
+        "labeled": labeled,
+        f"recall@{top_k}": _mean(recalls),
+        "mrr": _mean(rrs),
+        "retrieval_latency": latency_summary([r["retrieval_ms"] for _, r in records]),
+        "agent_latency": latency_summary([r["agent_ms"] for _, r in records if "agent_ms" in r]),
+        "agent_attempts": _mean([r.get("attempts") for _, r in records if "agent_ms" in r]),
+        "supervisor_llm_calls_saved": _mean([r.get("llm_calls_saved") for _, r in records if "agent_ms" in r]),
     }
-    dataset = Dataset.from_dict(data)
-    
-    # Run Ragas
-    print("Calculating Metrics...")
-    results = evaluate(
-        dataset=dataset,
-        metrics=[
-            faithfulness,
-            answer_relevancy,
-            context_precision,
-            context_recall
-        ],
-        llm=langchain_llm,
-        embeddings=langchain_embeddings
-    )
-    
-    print("\n=== Evaluation Results ===")
-    print(results)
-    
-    # Save results
-    df = results.to_pandas()
-    df.to_csv("evaluation_results.csv", index=False)
-    print("Results saved to evaluation_results.csv")
 
 if __name__ == "__main__":
-    run_evaluation()
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency evaluation.")
+    parser.add_argument("golden_set", nargs="?", default=DEFAULT_GOLDEN_SET)
+    parser.add_argument("--top-k", type=int, nargs="+", default=[RETRIEVAL_TOP_K],
+                        help="One or more top_k values to sweep.")
+    parser.add_argument("--workers", type=int, default=4, help="Max concurrent questions.")
+    parser.add_argument("--agent", action="store_true", help="Also run the full agent (LLM calls).")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore and do not write the cache.")
+    parser.add_argument("--output", help="Write the summaries to this JSON file.")
+    args = parser.parse_args()
+
+    summaries = []
+    for k in args.top_k:
+        summary = run_evaluation(args.golden_set, top_k=k, workers=args.workers,
+                                 run_agent=args.agent, use_cache=not args.no_cache)
+        summaries.append(summary)
+        print("\n=== Evaluation Results ===")
+        print(json.dumps(summary, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, indent=2)
+        print(f"Results saved to {args.output}")
@@ -0,0 +1,100 @@
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+CHUNK, GRAPH, SQL, COMMUNITY, ERROR = "chunk", "graph", "sql", "community", "error"
+
+@dataclass(frozen=True, slots=True)
+class Evidence:
+    """
+    One piece of retrieved context. Workers produce these instead of formatted strings;
+    text for the LLM is only built at prompt assembly (render / format_context).
+
+    chunk:     chunk_id, source, page, text (chunk content), score (cosine distance)
+    graph:     query, triples ((source, type, target), ...)
+    sql:       query, text (executed SQL), rows, truncated
+    community: source (title), text (summary), size (entities), score (cosine distance)
+    error:     text (message), query
+    """
+    kind: str
+    text: str = ""
+    source: Optional[str] = None
+    page: Optional[int] = None
+    chunk_id: Optional[int] = None
+    score: Optional[float] = None
+    query: Optional[str] = None
+    triples: Tuple[Tuple[str, str, str], ...] = ()
+    rows: Tuple[dict, ...] = ()
+    truncated: bool = False
+    size: Optional[int] = None
+
+    @property
+    def key(self):
+        """Identity for deduplication: a chunk id, or what the result was computed from."""
+        if self.kind == CHUNK:
+            return (CHUNK, self.chunk_id)
+        if self.kind == GRAPH:
+            return (GRAPH, self.triples)
+        if self.kind == COMMUNITY:
+            return (COMMUNITY, self.source)
+        return (self.kind, self.text)
+
+    @classmethod
+    def from_chunk(cls, row):
+        distance = row.get("distance")
+        return cls(CHUNK, text=row["content"], source=row["source"], page=row["page"], chunk_id=row["id"],
+                   score=float(distance) if distance is not None else None)
+
+    @classmethod
+    def error(cls, message, query=None):
+        return cls(ERROR, text=message, query=query)
+
+def add_evidence(existing, new):
+    """
+    Reducer for AgentState.documents. Workers return only their new records; records already
+    present (same key) are dropped. Lists are never mutated, so an update that adds nothing
+    returns the previous list itself and only an update that adds records builds a new one.
+    """
+    existing = existing or []
+    if not new:
+        return existing
+    seen = {e.key for e in existing}
+    added = []
+    for evidence in new:
+        if evidence.key not in seen:
+            seen.add(evidence.key)
+            added.append(evidence)
+    return existing + added if added else existing
+
+def chunk_ids(documents):
+    return [e.chunk_id for e in documents if e.kind == CHUNK]
+
+def chunk_distances(documents):
+    return [e.score for e in documents if e.kind == CHUNK and e.score is not None]
+
+def render(evidence):
+    """Prompt text of one record."""
+    if evidence.kind == CHUNK:
+        return f"Source: {evidence.source} (Page {evidence.page})\nContent: {evidence.text}"
+    if evidence.kind == GRAPH:
+        triples = "\n".join(f"{s} -[{t}]-> {o}" for s, t, o in evidence.triples)
+        return f"Knowledge Graph neighborhood for '{evidence.query}':\n{triples}"
+    if evidence.kind == SQL:
+        text = f"Graph Result for '{evidence.query}': {list(evidence.rows)}"
+        if evidence.truncated:
+            text += f" (truncated to the first {len(evidence.rows)} rows)"
+        return text
+    if evidence.kind == COMMUNITY:
+        return f"Community: {evidence.source} ({evidence.size} entities)\nSummary: {evidence.text}"
+    return evidence.text
+
+def format_context(documents, max_chars=None):
+    """Joins rendered records for a prompt; with max_chars, whole records are kept up to the limit."""
+    parts, total = [], 0
+    for evidence in documents:
+        text = render(evidence)
+        if max_chars is not None and parts and total + len(text) > max_chars:
+            break
+        parts.append(text)
+        total += len(text) + 2
+    context = "\n\n".join(parts)
+    return context[:max_chars] if max_chars is not None else context
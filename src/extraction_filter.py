@@ -0,0 +1,240 @@
+import os
+import re
+import glob
+import json
+import zlib
+import sqlite3
+import hashlib
+import threading
+from collections import Counter
+
+import numpy as np
+
+from config import (
+    CHUNK_STORE_DIR, WORKSPACES_DIR, FILTER_MIN_ENTITY_DENSITY, FILTER_DUPLICATE_THRESHOLD, FILTER_MIN_WORDS
+)
+from workspaces import workspace_dir
+
+# Sentences that never carry new entities or relationships
+BOILERPLATE_PATTERNS = [
+    re.compile(p, re.IGNORECASE) for p in (
+        r"forward[- ]looking statements?",
+        r"safe harbor",
+        r"all rights reserved",
+        r"this page (is )?intentionally left blank",
+        r"\btable of contents\b",
+        r"incorporated (herein )?by reference",
+        r"should not be (relied|construed)",
+        r"undertakes? no obligation to (publicly )?update",
+        r"(actual results|future performance) (may|could) differ materially",
+        r"for (informational|illustrative) purposes only",
+        r"does not constitute an offer",
+    )
+]
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+TOC_LINE = re.compile(r"(\.{3,}|…|\s{3,}|\t)\s*\d{1,4}\s*$|^\s*(item|part|note)\s+\d+[a-z]?\.?.{0,80}\d{1,4}\s*$", re.IGNORECASE)
+# Capitalized names / acronyms not at the start of a sentence
+ENTITY_CANDIDATE = re.compile(r"(?<![.!?]\s)(?<!^)\b(?:[A-Z][a-z]+[A-Za-z&.\-]*(?:\s+(?:of|and|&)?\s*[A-Z][A-Za-z&.\-]+)*|[A-Z]{2,}[a-z]?)\b", re.MULTILINE)
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+# Universal hashing (a * h + b) mod p with a, b, h < p < 2^32: every product fits in uint64
+_PRIME = (1 << 32) - 5
+_rng = np.random.default_rng(1)
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+# Stored signatures from another hashing scheme are not comparable and are dropped on open
+SIGNATURE_VERSION = 2
+
+def normalize_line(line: str):
+    return re.sub(r"\s+", " ", re.sub(r"\d+", "#", line.strip().lower()))
+
+def repeated_lines(windows, min_share=0.2, min_count=3, max_words=12):
+    """Short lines repeated across many windows of a document: running headers and footers."""
+    counts = Counter()
+    for window in windows:
+        counts.update({normalize_line(l) for l in window["text"].splitlines()
+                       if len(l.strip()) > 3 and len(l.split()) <= max_words})
+    threshold = max(min_count, int(len(windows) * min_share))
+    return {line for line, count in counts.items() if count >= threshold}
+
+def strip_lines(text: str, fingerprints):
+    if not fingerprints:
+        return text
+    return "\n".join(l for l in text.splitlines() if normalize_line(l) not in fingerprints)
+
+def is_table_of_contents(text: str):
+    lines = [l for l in text.splitlines() if l.strip()]
+    return len(lines) >= 4 and sum(bool(TOC_LINE.search(l)) for l in lines) / len(lines) >= 0.4
+
+def boilerplate_share(text: str):
+    sentences = [s for s in SENTENCE_SPLIT.split(text) if len(s.split()) >= 4]
+    if not sentences:
+        return 0.0
+    return sum(any(p.search(s) for p in BOILERPLATE_PATTERNS) for s in sentences) / len(sentences)
+
+def entity_density(text: str):
+    """Distinct capitalized-name / acronym candidates per 100 words: a cheap stand-in for NER."""
+    words = len(text.split())
+    if not words:
+        return 0.0
+    candidates = {m.group(0) for m in ENTITY_CANDIDATE.finditer(text)}
+    return 100.0 * len(candidates) / words
+
+def minhash(text: str):
+    words = re.findall(r"\w+", text.lower())
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.array([zlib.crc32(s.encode("utf-8")) % _PRIME for s in shingles], dtype=np.uint64)
+    # (a * h + b) mod p for every permutation (a * h + b < 2^64, no wrap-around); min over shingles
+    return ((np.outer(_A, hashes) + _B[:, None]) % _PRIME).min(axis=1)
+
+def jaccard_estimate(signature, other):
+    """Share of equal MinHash values: an unbiased estimate of the Jaccard similarity of the shingle sets."""
+    return float(np.mean(signature == other))
+
+def _band_keys(signature):
+    return [f"{b}:{hashlib.sha1(signature[b * ROWS:(b + 1) * ROWS].tobytes()).hexdigest()[:16]}" for b in range(BANDS)]
+
+class DuplicateIndex:
+    """
+    MinHash signatures of already-extracted windows with LSH banding, persisted in SQLite
+    so near-duplicate disclaimers are recognized across filings. One file per workspace:
+    a window extracted in one tenant's graph says nothing about another's.
+
+    Each signature keeps the window's extraction, so a near-duplicate in a new document is
+    linked to the same entities without another LLM call. Deferred windows are recorded per
+    document and extracted later on request.
+    """
+
+    def __init__(self, path=None, workspace=None):
+        self.path = path or os.path.join(workspace_dir(CHUNK_STORE_DIR, workspace), "minhash.sqlite")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS signatures (key TEXT PRIMARY KEY, document TEXT, signature BLOB, extraction TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS bands (band TEXT, key TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_band ON bands (band)")
+            conn.execute("CREATE TABLE IF NOT EXISTS deferred (document TEXT, key TEXT, PRIMARY KEY (document, key))")
+            # Files written before extractions were stored
+            if "extraction" not in {row[1] for row in conn.execute("PRAGMA table_info(signatures)")}:
+                conn.execute("ALTER TABLE signatures ADD COLUMN extraction TEXT")
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SIGNATURE_VERSION:
+                conn.execute("DELETE FROM bands")
+                conn.execute("DELETE FROM signatures")
+                conn.execute(f"PRAGMA user_version = {SIGNATURE_VERSION}")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def best_match(self, signature, exclude_document=None):
+        """
+        Highest estimated Jaccard similarity to a stored window of another document.
+        Returns (similarity, key of that window).
+        """
+        bands = _band_keys(signature)
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(f"""
+                SELECT DISTINCT s.key, s.document, s.signature FROM bands b JOIN signatures s ON s.key = b.key
+                WHERE b.band IN ({', '.join(['?'] * len(bands))})
+            """, bands).fetchall()
+        best, best_key = 0.0, None
+        for key, document, blob in rows:
+            if document == exclude_document:
+                continue
+            similarity = jaccard_estimate(np.frombuffer(blob, dtype=np.uint64), signature)
+            if similarity > best:
+                best, best_key = similarity, key
+        return best, best_key
+
+    def add(self, key, document, signature, extraction=None):
+        with self._lock, self._connect() as conn:
+            if conn.execute("SELECT 1 FROM signatures WHERE key = ?", (key,)).fetchone():
+                return
+            conn.execute("INSERT INTO signatures (key, document, signature, extraction) VALUES (?, ?, ?, ?)",
+                         (key, document, signature.astype(np.uint64).tobytes(),
+                          json.dumps(extraction) if extraction is not None else None))
+            conn.executemany("INSERT INTO bands (band, key) VALUES (?, ?)", [(b, key) for b in _band_keys(signature)])
+            conn.execute("DELETE FROM deferred WHERE document = ? AND key = ?", (document, key))
+
+    def extraction(self, key):
+        """The stored extraction of a window, or None (unknown key, or indexed before extractions were kept)."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT extraction FROM signatures WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def defer(self, document, keys):
+        with self._lock, self._connect() as conn:
+            conn.executemany("INSERT OR IGNORE INTO deferred (document, key) VALUES (?, ?)", [(document, k) for k in keys])
+
+    def deferred(self, document):
+        """Keys of the document's windows that were deferred and not extracted since."""
+        with self._lock, self._connect() as conn:
+            return {row[0] for row in conn.execute("SELECT key FROM deferred WHERE document = ?", (document,))}
+
+    def remove_document(self, document):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM bands WHERE key IN (SELECT key FROM signatures WHERE document = ?)", (document,))
+            conn.execute("DELETE FROM signatures WHERE document = ?", (document,))
+            conn.execute("DELETE FROM deferred WHERE document = ?", (document,))
+
+def clear_duplicate_indexes():
+    """Deletes the index files of every workspace; they describe a graph that no longer exists after a reset."""
+    paths = [os.path.join(CHUNK_STORE_DIR, "minhash.sqlite")] \
+        + glob.glob(os.path.join(WORKSPACES_DIR, "*", os.path.basename(CHUNK_STORE_DIR), "minhash.sqlite"))
+    removed = 0
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    return removed
+
+def window_key(window):
+    return hashlib.sha1("|".join(window["keys"]).encode("utf-8")).hexdigest()
+
+def classify(text, signature, dup_index, document):
+    """
+    Returns (decision, reason, match): "extract", "skip" (no useful content) or "defer"
+    (probably few entities; extracted only on request). match is the key of the stored window
+    a near-duplicate was matched to.
+    """
+    if len(text.split()) < FILTER_MIN_WORDS:
+        return "skip", "too_short", None
+    if is_table_of_contents(text):
+        return "skip", "table_of_contents", None
+    if boilerplate_share(text) >= 0.5:
+        return "skip", "boilerplate", None
+    if dup_index is not None:
+        similarity, match = dup_index.best_match(signature, exclude_document=document)
+        if similarity >= FILTER_DUPLICATE_THRESHOLD:
+            return "skip", "near_duplicate", match
+    if entity_density(text) < FILTER_MIN_ENTITY_DENSITY:
+        return "defer", "low_entity_density", None
+    return "extract", None, None
+
+def filter_windows(windows, document, dup_index, include_deferred=False):
+    """
+    Pre-filters extraction windows. Repeated header/footer lines are stripped from the text sent
+    to the LLM. Returns (selected [(index, window)], signatures {index: minhash}, stats,
+    duplicates {index: matched window key}, deferred [index] not selected).
+    """
+    fingerprints = repeated_lines(windows)
+    selected, signatures, duplicates, deferred = [], {}, {}, []
+    stats = Counter()
+    for i, window in enumerate(windows):
+        text = strip_lines(window["text"], fingerprints)
+        signature = minhash(text)
+        decision, reason, match = classify(text, signature, dup_index, document)
+        stats[decision] += 1
+        if reason:
+            stats[reason] += 1
+        if decision == "extract" or (decision == "defer" and include_deferred):
+            selected.append((i, {**window, "text": text}))
+            signatures[i] = signature
+        elif match is not None:
+            duplicates[i] = match
+            signatures[i] = signature
+        elif decision == "defer":
+            deferred.append(i)
+    return selected, signatures, dict(stats), duplicates, deferred
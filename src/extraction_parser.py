@@ -0,0 +1,170 @@
+import re
+import json
+
+# Column sizes of nodes.id / nodes.type / edges.type
+MAX_ID_CHARS = 255
+MAX_TYPE_CHARS = 100
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+CLOSERS = {"{": "}", "[": "]"}
+
+class IncrementalJSONParser:
+    """
+    Tolerant JSON reader for LLM output, fed piece by piece (streamed tokens or a whole response).
+
+    Text before the first "{" is skipped and text after the top-level object is ignored.
+    A single pass tracks open containers and remembers the last position where a value
+    was complete; if the output stops early, value() closes the open containers there,
+    so complete array elements are recovered and only the cut-off tail is lost.
+    Cut points are only taken between array elements (or top-level keys): an element
+    object that was still open is dropped whole, never closed with half its fields.
+    """
+
+    # Cut points kept for fallback when the latest one does not parse
+    MAX_CUTS = 32
+
+    def __init__(self):
+        self.text = ""
+        self.start = None
+        self.end = None
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.cuts = []  # [(position, closing characters)]
+        self._pos = 0
+
+    @property
+    def started(self):
+        return self.start is not None
+
+    @property
+    def complete(self):
+        return self.end is not None
+
+    def feed(self, piece: str):
+        if self.complete or not piece:
+            return
+        self.text += piece
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self.start is None:
+                if ch == "{":
+                    self.start = i
+                    self.stack.append(ch)
+                    self._cut(i + 1)
+                continue
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+            if ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.stack.append(ch)
+                self._cut(i + 1)
+            elif ch in "}]":
+                if self.stack:
+                    self.stack.pop()
+                if not self.stack:
+                    self.end = i + 1
+                    break
+                self._cut(i + 1)
+            elif ch == ",":
+                self._cut(i)
+        self._pos = len(text)
+
+    def _cut(self, position):
+        if len(self.stack) > 1 and self.stack[-1] == "{":
+            return
+        self.cuts.append((position, "".join(CLOSERS[c] for c in reversed(self.stack))))
+        if len(self.cuts) > self.MAX_CUTS:
+            del self.cuts[0]
+
+    def value(self):
+        """(parsed object or None, complete). complete is False when open containers had to be closed."""
+        if self.complete:
+            parsed = _loads(self.text[self.start:self.end])
+            if parsed is not None:
+                return parsed, True
+        for position, closers in reversed(self.cuts):
+            parsed = _loads(self.text[self.start:position] + closers)
+            if parsed is not None:
+                return parsed, False
+        return None, False
+
+def _loads(text):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(TRAILING_COMMA.sub(r"\1", text))
+    except json.JSONDecodeError:
+        return None
+
+def parse_partial(content: str):
+    """Tolerant parse of a whole response. Returns (object or None, complete)."""
+    parser = IncrementalJSONParser()
+    parser.feed(content or "")
+    return parser.value()
+
+def _clean(value, limit):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    return value if 0 < len(value) <= limit else None
+
+def validate_extraction(data):
+    """
+    Keeps only well-formed nodes ({"id", "type"}) and relationships ({"source", "target", "type"}).
+    Returns ({"nodes": [...], "relationships": [...]}, number of dropped items).
+    """
+    nodes, relationships, dropped = [], [], 0
+    if not isinstance(data, dict):
+        return {"nodes": nodes, "relationships": relationships}, 1
+
+    seen = set()
+    raw_nodes = data.get("nodes")
+    for node in raw_nodes if isinstance(raw_nodes, list) else []:
+        if isinstance(node, str):
+            node = {"id": node}
+        node_id = _clean(node.get("id") or node.get("name"), MAX_ID_CHARS) if isinstance(node, dict) else None
+        if node_id is None:
+            dropped += 1
+            continue
+        if node_id in seen:
+            continue
+        seen.add(node_id)
+        nodes.append({"id": node_id, "type": _clean(node.get("type"), MAX_TYPE_CHARS) or "Unknown"})
+
+    raw_relationships = data.get("relationships", data.get("edges"))
+    for rel in raw_relationships if isinstance(raw_relationships, list) else []:
+        if not isinstance(rel, dict):
+            dropped += 1
+            continue
+        source = _clean(rel.get("source"), MAX_ID_CHARS)
+        target = _clean(rel.get("target"), MAX_ID_CHARS)
+        if source is None or target is None:
+            dropped += 1
+            continue
+        relationships.append({
+            "source": source,
+            "target": target,
+            "type": _clean(rel.get("type"), MAX_TYPE_CHARS) or "RELATED_TO",
+        })
+    return {"nodes": nodes, "relationships": relationships}, dropped
+
+def failed_generation(error):
+    """Raw model output attached to a JSON-mode validation error (Groq's json_validate_failed), if any."""
+    body = getattr(error, "body", None)
+    if isinstance(body, dict):
+        body = body.get("error", body)
+        if isinstance(body, dict) and isinstance(body.get("failed_generation"), str):
+            return body["failed_generation"]
+    return None
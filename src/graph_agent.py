@@ -1,57 +1,120 @@
 import os
 import json
-from typing import TypedDict, List, Literal
+from typing import TypedDict, List, Literal, Annotated
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
-from tidb_store import TiDBGraph
+from resources import get_graph, get_llm, get_json_llm
 from langchain_core.output_parsers import JsonOutputParser
 from langgraph.graph import StateGraph, END
 from dotenv import load_dotenv
-from vector_store import search_vectors
+from vector_store import search_vectors, graphrag_search
+from sql_guard import run_guarded_query, UnsafeQueryError
+from plan_cache import get_plan_cache
+from communities import global_search
+from evidence import Evidence, SQL, add_evidence, chunk_ids, chunk_distances, format_context, render
 
 load_dotenv()
 
 # --- 1. State Definition ---
 class AgentState(TypedDict):
-    question: str
+    question: str # As asked: routing, answering, review and router training data use this
+    retrieval_query: str # Question condensed with earlier turns (session memory); searches default to it
     plan: str
-    documents: List[str] # Content from vector/graph
+    documents: Annotated[List[Evidence], add_evidence] # Evidence records; nodes return only new ones
     answer: str
     critique: str
     attempts: int
     selected_sources: List[str] # Filtering context
+    workspace: str # Tenant whose data is searched (DEFAULT_WORKSPACE if missing)
+    top_k: int # Optional override of RETRIEVAL_TOP_K (used by eval sweeps; disables adaptive top_k)
+    retrieval_k: int # top_k of the last chunk retrieval (widened when hits were far)
+    evidence_confidence: float # 1 - mean distance of the closest chunks (see retrieval_policy)
+    route_source: str # "memory", "rules", "classifier", "confidence" or "llm" for the last supervisor decision
+    llm_calls_saved: int # Supervisor LLM calls skipped by the fast router or session memory
+    review_verdict: str # "APPROVED" / "REJECTED" from the last review
+    review_source: str # "grounding" (local check) or "llm"
+    grounding_score: float # Share of answer sentences supported by the documents
+    recalled: int # Documents carried over from earlier turns (session memory)
+    memory_answerable: bool # Recalled evidence is close enough that one retrieval step should complete it
 
-from config import LLM_MODEL
+from config import ROUTER_ENABLED, REVIEWER_CONTEXT_CHARS, RETRIEVAL_TOP_K, ADAPTIVE_RETRIEVAL, EVIDENCE_CONFIDENCE_THRESHOLD
+from retrieval_policy import evidence_confidence, needs_widening, wider_top_k
+from grounding import grounding_check
+from router import fast_route, log_decision
 
 # --- 2. Tool Setup ---
-graph = TiDBGraph()
-llm = ChatGroq(model=LLM_MODEL, temperature=0)
-json_llm = ChatGroq(model=LLM_MODEL, temperature=0).bind(response_format={"type": "json_object"})
+# Clients are created lazily on first use and shared process-wide (see resources.py)
 
 # --- 3. Nodes ---
 
+# Plan steps whose result is ranked chunks, so evidence confidence describes them
+TEXT_RETRIEVAL_STEPS = ("VectorSearch", "GraphRAGSearch")
+
 def supervisor_node(state: AgentState):
     """
     Decides the research plan based on the question and previous attempts.
     """
     question = state["question"]
+    query = _retrieval_query(state)
     attempts = state.get("attempts", 0)
     print(f"--- [SUPERVISOR] Attempts: {attempts} | Question: {question} ---")
     
     # If we have an answer but it was rejected (critique exists), we need to adjust
     critique = state.get("critique", "")
     
+    # Follow-up largely covered by evidence from earlier turns: no planning call, but still one
+    # retrieval (which skips the recalled chunks) so the answer never rests on memory alone
+    if attempts == 0 and not critique and state.get("memory_answerable"):
+        print("--- [MEMORY] Recalled evidence is strong, completing it with one vector search ---")
+        return {
+            "plan": {"next_step": "VectorSearch", "query": query},
+            "attempts": attempts + 1,
+            "route_source": "memory",
+            "llm_calls_saved": state.get("llm_calls_saved", 0) + 1
+        }
+
+    # Chunks just retrieved are close enough to the question: stop searching and answer.
+    # Only after a text retrieval: chunk distance says nothing about a graph or SQL step's result.
+    confidence = state.get("evidence_confidence", 0.0)
+    last_step = (state.get("plan") or {}).get("next_step")
+    if ADAPTIVE_RETRIEVAL and attempts > 0 and not critique and last_step in TEXT_RETRIEVAL_STEPS \
+            and confidence >= EVIDENCE_CONFIDENCE_THRESHOLD:
+        print(f"--- [SUPERVISOR] Evidence confidence {confidence:.2f}, generating answer ---")
+        return {
+            "plan": {"next_step": "GenerateAnswer", "query": query},
+            "attempts": attempts + 1,
+            "route_source": "confidence",
+            "llm_calls_saved": state.get("llm_calls_saved", 0) + 1
+        }
+
+    # Fast path: the first step of an obvious question doesn't need an LLM call
+    # (recalled documents don't count: they were found for an earlier question)
+    first_step = attempts == 0 and not critique and len(state.get("documents", [])) <= state.get("recalled", 0)
+    if ROUTER_ENABLED and first_step:
+        step, source = fast_route(question)
+        if step:
+            print(f"--- [ROUTER] {step} via {source} ---")
+            return {
+                "plan": {"next_step": step, "query": query},
+                "attempts": attempts + 1,
+                "route_source": source,
+                "llm_calls_saved": state.get("llm_calls_saved", 0) + 1
+            }
+    
     system = """You are the Supervisor of a Corporate Research Team.
     Analyze the user question and decide on a research plan.
     
     Available Workers:
     1. VectorSearch: For finding specific documents, reports, risks, strategy content.
-    2. GraphSearch: For finding entity relationships, hierarchy, acquisitions, structure.
+    2. GraphSearch: For finding entity relationships, hierarchy, acquisitions, structure, and exact figures from report tables (e.g. Q3 revenue).
+    3. GraphRAGSearch: For questions about how entities discussed in the documents relate to others
+       (returns the matching text plus the surrounding knowledge graph).
+    4. GlobalSearch: For corpus-wide questions (main themes, overall strategy across all filings),
+       answered from precomputed summaries of the whole knowledge graph.
     
     Return JSON:
     {{
-        "next_step": "VectorSearch" or "GraphSearch" or "GenerateAnswer",
+        "next_step": "VectorSearch" or "GraphSearch" or "GraphRAGSearch" or "GlobalSearch" or "GenerateAnswer",
         "query": "The specific query for the worker"
     }}
     """
@@ -59,30 +122,75 @@ def supervisor_node(state: AgentState):
     if critique:
         system += f"\n\nPREVIOUS CRITIQUE: {{critique}}\nAdjust your plan to address this."
     
-    context_summary = f"Documents found so far: {{doc_count}}"
-    
     prompt = ChatPromptTemplate.from_messages([
         ("system", system),
         ("human", "Question: {question}\n\nContext: {context_summary}\n\nAttempts: {attempts}")
     ])
     
-    chain = prompt | json_llm
+    chain = prompt | get_json_llm()
     response = chain.invoke({
         "question": question, 
-        "context_summary": f"Documents found so far: {len(state.get('documents', []))}",
+        "context_summary": _context_summary(state),
         "attempts": attempts,
         "critique": critique
     })
     plan = json.loads(response.content)
     
-    return {"plan": plan, "attempts": attempts + 1}
+    if first_step:
+        log_decision(question, plan.get("next_step"))
+    
+    return {"plan": plan, "attempts": attempts + 1, "route_source": "llm"}
+
+def _retrieval_query(state):
+    return state.get("retrieval_query") or state["question"]
+
+def _context_summary(state):
+    found = len(state.get("documents", []))
+    recalled = state.get("recalled", 0)
+    summary = f"Documents found so far: {found}"
+    if _retrieval_query(state) != state["question"]:
+        summary += f"\nFollow-up question; with its conversation: {_retrieval_query(state)}"
+    if recalled:
+        summary += f" ({recalled} recalled from earlier questions in this conversation)"
+    distances = chunk_distances(state.get("documents", []))
+    if distances:
+        summary += (f"\nClosest chunk distance: {min(distances):.2f} (0 = identical, above 0.6 = weak match); "
+                    f"evidence confidence: {state.get('evidence_confidence', 0.0):.2f}")
+    return summary
+
+def _retrieve(state, search, query):
+    """
+    Runs a chunk search (search_vectors / graphrag_search) without the chunks already in context.
+    If even the best hit is far from the query, top_k is widened once: only the extra hits are
+    fetched, excluding the first results as well.
+    Returns the state update: new evidence records and the evidence confidence.
+    """
+    fixed_k = state.get("top_k")
+    top_k = fixed_k or state.get("retrieval_k") or RETRIEVAL_TOP_K
+    documents = state.get("documents", [])
+    kwargs = {"file_filters": state.get("selected_sources", []), "workspace": state.get("workspace")}
+    exclude_ids = chunk_ids(documents)
+
+    results = search(query, top_k=top_k, exclude_ids=exclude_ids, **kwargs)
+    distances = chunk_distances(results)
+    if ADAPTIVE_RETRIEVAL and not fixed_k and needs_widening(distances, top_k):
+        wider = wider_top_k(top_k)
+        print(f"    Best distance {min(distances):.2f} is weak, widening to top_k={wider}")
+        results = results + search(query, top_k=wider - top_k, exclude_ids=exclude_ids + chunk_ids(results), **kwargs)
+        top_k = wider
+
+    return {
+        "documents": results,
+        "evidence_confidence": evidence_confidence(chunk_distances(documents) + chunk_distances(results)),
+        "retrieval_k": top_k,
+    }
 
 def vector_search_node(state: AgentState):
     """
     Executes a vector search.
     """
     plan = state["plan"]
-    query = plan.get("query", state["question"])
+    query = plan.get("query") or _retrieval_query(state)
     
     
     print(f"--- [VECTOR SEARCH] {query} ---")
@@ -91,21 +199,9 @@ def vector_search_node(state: AgentState):
     if selected_sources:
         print(f"    Filtering by: {selected_sources}")
 
-    results = search_vectors(query, file_filters=selected_sources)
-
-    return {"documents": state.get("documents", []) + results}
+    return _retrieve(state, search_vectors, query)
 
-def graph_search_node(state: AgentState):
-    """
-    Executes a SQL query on TiDB.
-    """
-    plan = state["plan"]
-    query = plan.get("query", state["question"])
-    
-    print(f"--- [GRAPH SEARCH] {query} ---")
-    
-    # We use LLM to gen SQL
-    sql_prompt = """
+SQL_PROMPT = """
     Task: Generate SQL for: {query}
     Schema: {schema}
     
@@ -126,29 +222,101 @@ def graph_search_node(state: AgentState):
     JOIN nodes t ON e.target = t.id 
     WHERE s.id LIKE '%Keywords%';
     
+    Figures from tables in the reports are stored one value per row in 'table_cells'
+    (row_label, column_name, value_text, value_num), joined to 'pdf_tables' (document, page).
+    Example: "What was Q3 revenue?"
+    SELECT t.document, t.page, c.row_label, c.column_name, c.value_text
+    FROM table_cells c JOIN pdf_tables t ON c.table_id = t.id
+    WHERE c.row_label LIKE 'Revenue%' AND c.column_name LIKE '%Q3%';
+    
+    Only single read-only SELECT statements are executed. Never select the 'embedding' column.
+    Results are capped, so filter and aggregate instead of returning whole tables.
+    {failures}
     Return ONLY JSON: {{"sql": "SELECT ...", "reasoning": "..."}}
     """
+
+def _generate_sql(query, failures):
+    """Asks the LLM for SQL, showing it queries that already failed for this kind of question."""
+    failure_text = ""
+    if failures:
+        failure_text = "These queries already FAILED, do not repeat them:\n" + "\n".join(
+            f"- {sql} -> {error}" for sql, error in failures
+        ) + "\n"
+    prompt = ChatPromptTemplate.from_messages([
+         ("system", "You are a TiDB SQL expert. Use MySQL 8.0 JSON syntax."),
+         ("human", SQL_PROMPT)
+    ])
+    chain = prompt | get_json_llm()
+    response = chain.invoke({"query": query, "schema": get_graph().get_schema(), "failures": failure_text})
+    return json.loads(response.content).get("sql")
+
+def graph_search_node(state: AgentState):
+    """
+    Executes a SQL query on TiDB.
+    Validated SQL is reused from the plan cache; failed SQL is never executed twice.
+    """
+    plan = state["plan"]
+    query = plan.get("query") or _retrieval_query(state)
     
+    print(f"--- [GRAPH SEARCH] {query} ---")
+    
+    plan_cache = get_plan_cache()
+    sql = None
     try:
-        
-        prompt = ChatPromptTemplate.from_messages([
-             ("system", "You are a TiDB SQL expert. Use MySQL 8.0 JSON syntax."),
-             ("human", sql_prompt)
-        ])
-        chain = prompt | json_llm
-        response = chain.invoke({"query": query, "schema": graph.get_schema()})
-        
-        sql_json = json.loads(response.content)
-        sql = sql_json.get("sql")
+        sql = plan_cache.lookup(query)
+        if sql:
+            print("Plan cache hit, skipping SQL generation.")
+        else:
+            # We use LLM to gen SQL
+            sql = _generate_sql(query, plan_cache.failures_for(query))
+            known_error = plan_cache.known_failure(sql)
+            if known_error:
+                # Same broken SQL as before: one retry with the failure in the prompt
+                sql = _generate_sql(query, plan_cache.failures_for(query) + [(sql, known_error)])
+                known_error = plan_cache.known_failure(sql)
+                if known_error:
+                    raise UnsafeQueryError(f"Generated SQL already failed before: {known_error}")
         
         print(f"Executing: {sql}")
-        result = graph.query(sql)
-        doc = f"Graph Result for '{query}': {result}"
+        result, truncated = run_guarded_query(get_graph(state.get("workspace")), sql)
+        plan_cache.record_success(query, sql)
+        doc = Evidence(SQL, text=sql, query=query, rows=tuple(result), truncated=bool(truncated))
+        
+    except UnsafeQueryError as e:
+        if sql:
+            plan_cache.record_failure(query, sql, e)
+        doc = Evidence.error(f"Graph Search Rejected: {e}", query)
         
     except Exception as e:
-        doc = f"Graph Search Error: {e}"
+        if sql:
+            plan_cache.record_failure(query, sql, e)
+        doc = Evidence.error(f"Graph Search Error: {e}", query)
+
+    return {"documents": [doc]}
 
-    return {"documents": state.get("documents", []) + [doc]}
+def graphrag_search_node(state: AgentState):
+    """
+    Executes a vector search and expands the hits into their entity neighborhood.
+    """
+    plan = state["plan"]
+    query = plan.get("query") or _retrieval_query(state)
+
+    print(f"--- [GRAPHRAG SEARCH] {query} ---")
+
+    return _retrieve(state, graphrag_search, query)
+
+def global_search_node(state: AgentState):
+    """
+    Answers corpus-wide questions from precomputed community summaries.
+    """
+    plan = state["plan"]
+    query = plan.get("query") or _retrieval_query(state)
+
+    print(f"--- [GLOBAL SEARCH] {query} ---")
+
+    results = global_search(query, workspace=state.get("workspace"))
+
+    return {"documents": results}
 
 def generator_node(state: AgentState):
     """
@@ -161,7 +329,7 @@ def generator_node(state: AgentState):
         print("--- [GENERATOR] No documents found. ---")
         return {"answer": "I cannot answer this question because no relevant information was found in the knowledge base. Please upload a relevant document."}
 
-    docs = "\n\n".join(documents)
+    docs = format_context(documents)
     print(f"--- [GENERATOR] Generating Answer... ---")
     
     system = """You are a Corporate Analyst. Answer the question based ONLY on the provided context.
@@ -172,19 +340,28 @@ def generator_node(state: AgentState):
         ("human", "Context:\n{docs}\n\nQuestion: {question}")
     ])
     
-    chain = prompt | llm
+    chain = prompt | get_llm()
     response = chain.invoke({"docs": docs, "question": question})
     return {"answer": response.content}
 
 def reviewer_node(state: AgentState):
     """
     Reviews the answer for quality and hallucinations.
+    A local grounding check decides clear cases; the LLM reviewer only runs when it is inconclusive.
     """
     question = state["question"]
     answer = state.get("answer", "No answer generated.")
     docs = state.get("documents", [])
     print(f"--- [REVIEWER] Grading Answer... ---")
     
+    verdict, score, unsupported = grounding_check(answer, [render(e) for e in docs], question)
+    if verdict:
+        print(f"--- [REVIEWER] {verdict} by grounding check (score {score:.2f}) ---")
+        critique = None
+        if verdict == "REJECTED":
+            critique = "These statements are not supported by the retrieved documents: " + " | ".join(unsupported[:3])
+        return {"critique": critique, "review_verdict": verdict, "review_source": "grounding", "grounding_score": score}
+    
     system = """You are a Senior Editor. Grade the answer.
     1. Does it answer the question?
     2. Is it supported by context?
@@ -198,16 +375,18 @@ def reviewer_node(state: AgentState):
     
     prompt = ChatPromptTemplate.from_messages([
         ("system", system),
-        ("human", "Q: {question}\nA: {answer}")
+        ("human", "Context:\n{docs}\n\nQ: {question}\nA: {answer}")
     ])
     
-    chain = prompt | json_llm
-    response = json.loads(chain.invoke({"question": question, "answer": answer}).content)
+    chain = prompt | get_json_llm()
+    context = format_context(docs, max_chars=REVIEWER_CONTEXT_CHARS)
+    response = json.loads(chain.invoke({"docs": context, "question": question, "answer": answer}).content)
     
+    review = {"review_verdict": response["status"], "review_source": "llm", "grounding_score": score}
     if response["status"] == "APPROVED":
-        return {"critique": None}
+        return {"critique": None, **review}
     else:
-        return {"critique": response["critique"]}
+        return {"critique": response["critique"], **review}
 
 # --- 4. Graph Construction ---
 
@@ -216,6 +395,8 @@ workflow = StateGraph(AgentState)
 workflow.add_node("supervisor", supervisor_node)
 workflow.add_node("vector_search", vector_search_node)
 workflow.add_node("graph_search", graph_search_node)
+workflow.add_node("graphrag_search", graphrag_search_node)
+workflow.add_node("global_search", global_search_node)
 workflow.add_node("generator", generator_node)
 workflow.add_node("reviewer", reviewer_node)
 
@@ -232,6 +413,10 @@ def route_supervisor(state):
         return "vector_search"
     elif step == "GraphSearch":
         return "graph_search"
+    elif step == "GraphRAGSearch":
+        return "graphrag_search"
+    elif step == "GlobalSearch":
+        return "global_search"
     elif step == "GenerateAnswer":
         return "generator"
     else:
@@ -247,6 +432,8 @@ workflow.add_edge("vector_search", "supervisor") # Loop back for more steps? Or
 
 workflow.add_edge("vector_search", "supervisor") 
 workflow.add_edge("graph_search", "supervisor")
+workflow.add_edge("graphrag_search", "supervisor")
+workflow.add_edge("global_search", "supervisor")
 
 workflow.add_edge("generator", "reviewer")
 
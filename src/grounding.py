@@ -0,0 +1,109 @@
+import re
+import logging
+
+from config import GROUNDING_APPROVE_THRESHOLD, GROUNDING_REJECT_THRESHOLD, GROUNDING_EMBEDDING_SIMILARITY
+from lexical_index import tokenize
+from resources import get_embeddings
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+# A sentence counts as supported when this share of its n-grams appears in the documents
+SENTENCE_SUPPORT = 0.6
+MIN_SENTENCE_TERMS = 3
+# Share of the question's terms an answer must use before it can be approved locally
+QUESTION_RELEVANCE = 0.3
+# Abstentions ("not in the context", "I don't know") share no n-grams with the documents by design
+REFUSAL = re.compile(
+    r"\b(i (do not|don't|cannot|can't) (know|answer|find|determine)|(cannot|can't|unable to) (be )?(answer|determine|find)|"
+    r"(is|are) not (mentioned|provided|available|stated|included|specified)|"
+    r"(does|do) not (contain|mention|provide|include|specify|say)|no (relevant )?information)\b",
+    re.IGNORECASE
+)
+
+NUMBER = re.compile(r"\d")
+
+def _bigrams(terms):
+    return set(zip(terms, terms[1:]))
+
+def paraphrased(sentences, documents, doc_unigrams, threshold=GROUNDING_EMBEDDING_SIMILARITY):
+    """
+    Sentences the n-gram check missed that restate a document sentence in other words:
+    cosine similarity of their embeddings (the shared embedder) to the closest document
+    sentence is at least threshold. Figures are not paraphrased, so a sentence whose numbers
+    are missing from the documents never qualifies.
+    """
+    if threshold <= 0:
+        return []
+    candidates = [s for s in sentences
+                  if not any(NUMBER.search(t) and t not in doc_unigrams for t in tokenize(s))]
+    doc_sentences = [s.strip() for d in documents for s in SENTENCE_SPLIT.split(d)
+                     if len(tokenize(s)) >= MIN_SENTENCE_TERMS]
+    if not candidates or not doc_sentences:
+        return []
+    import numpy as np
+    try:
+        vectors = np.asarray(get_embeddings().embed_documents(candidates + doc_sentences), dtype="float32")
+    except Exception as e:
+        logger.warning(f"Embedding support check skipped: {e}")
+        return []
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = (vectors[:len(candidates)] @ vectors[len(candidates):].T).max(axis=1)
+    return [s for s, sim in zip(candidates, similarity) if sim >= threshold]
+
+def question_relevance(question: str, answer: str):
+    """Share of the question's terms that the answer uses (1.0 when the question has none)."""
+    question_terms = set(tokenize(question or ""))
+    if not question_terms:
+        return 1.0
+    return len(question_terms & set(tokenize(answer or ""))) / len(question_terms)
+
+def grounding_check(answer: str, documents, question: str = None):
+    """
+    Local n-gram overlap between answer sentences and retrieved documents; sentences it
+    misses can still be supported by embedding similarity (paraphrases, see paraphrased).
+    Returns (verdict, score, unsupported_sentences) where verdict is "APPROVED",
+    "REJECTED" or None when the check is inconclusive and the LLM reviewer should decide.
+    Refusal sentences are not scored, and an answer that abstains is never rejected locally.
+    Approval also needs the answer to be about the question (QUESTION_RELEVANCE).
+    """
+    doc_terms = tokenize("\n".join(documents))
+    doc_unigrams = set(doc_terms)
+    doc_bigrams = _bigrams(doc_terms)
+
+    considered = 0
+    supported = 0
+    unsupported = []
+    refusal = False
+    for sentence in SENTENCE_SPLIT.split(answer or ""):
+        if REFUSAL.search(sentence):
+            refusal = True
+            continue
+        terms = tokenize(sentence)
+        if len(terms) < MIN_SENTENCE_TERMS:
+            continue
+        considered += 1
+        unigram_cov = sum(t in doc_unigrams for t in terms) / len(terms)
+        bigrams = _bigrams(terms)
+        bigram_cov = len(bigrams & doc_bigrams) / len(bigrams) if bigrams else unigram_cov
+        if 0.5 * unigram_cov + 0.5 * bigram_cov >= SENTENCE_SUPPORT:
+            supported += 1
+        else:
+            unsupported.append(sentence.strip())
+
+    if considered == 0 or not doc_unigrams:
+        return None, 0.0, unsupported
+
+    if unsupported:
+        restated = set(paraphrased(unsupported, documents, doc_unigrams, GROUNDING_EMBEDDING_SIMILARITY))
+        supported += len(restated)
+        unsupported = [s for s in unsupported if s not in restated]
+
+    score = supported / considered
+    if score >= GROUNDING_APPROVE_THRESHOLD:
+        if question is not None and question_relevance(question, answer) < QUESTION_RELEVANCE:
+            return None, score, unsupported
+        return "APPROVED", score, unsupported
+    if score <= GROUNDING_REJECT_THRESHOLD and not refusal:
+        return "REJECTED", score, unsupported
+    return None, score, unsupported
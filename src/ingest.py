@@ -1,21 +1,18 @@
 import os
-import json
-import re
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_community.graphs import Neo4jGraph # Keeping for reference if needed, but we use TiDBGraph now
-from tidb_store import TiDBGraph
+from config import (
+    GRAPH_WINDOW_TOKENS, GRAPH_PACK_TOKENS, GRAPH_PACK_MAX_CHUNKS, EXTRACTION_FILTER, EXTRACTION_STREAMING
+)
+from chunk_store import load_chunks
+from chunker import group_windows
+from extraction_filter import DuplicateIndex, filter_windows, window_key
+from extraction_parser import IncrementalJSONParser, validate_extraction, failed_generation
+from resources import get_graph, get_json_llm
 
 # 1. Setup
-from config import LLM_MODEL
-
-# Initialize Graph
-graph = TiDBGraph()
-
-# 2. The Llama 3 Model (Structured Output Mode)
-llm = ChatGroq(model=LLM_MODEL, temperature=0).bind(response_format={"type": "json_object"})
+# The graph store and the Llama 3 model (Structured Output Mode) are created lazily
+# on first use via resources.get_graph() / resources.get_json_llm().
 
 # 3. The Extraction Prompt
 system_prompt = """
@@ -37,10 +34,36 @@ Ensure "id" is the specific name. "type" should be generic (Person, Organization
 RELATIONSHIPS should be UPPERCASE (e.g., LOCATED_IN, MANAGED_BY).
 """
 
+# Appended to the system prompt when several chunks share one request
+packed_prompt = """
+The input contains several chunks, each wrapped in <chunk index="N">...</chunk>.
+Extract each chunk separately and return ONE JSON object keyed by chunk index:
+{{
+  "chunks": [
+    {{"index": 0, "nodes": [...], "relationships": [...]}},
+    {{"index": 1, "nodes": [...], "relationships": [...]}}
+  ]
+}}
+Include every index, with empty lists if a chunk has nothing to extract.
+"""
+
+# Appended to the system prompt when a one-chunk extraction was cut off
+continuation_prompt = """
+A previous extraction of this text was cut off. These entities were already extracted:
+{extracted}
+Return only entities and relationships that are not covered yet, in the same JSON format.
+"""
+MAX_CONTINUATIONS = 2
+
 import sys
 
-def process_document(file_path: str = None, status_callback=None):
-    msg = "Loading PDF using PyPDFLoader (Fallback)..."
+def process_document(file_path: str = None, status_callback=None, include_deferred=False, workspace=None,
+                     deferred_only=False):
+    """
+    Extracts the document's knowledge graph. With include_deferred, low-entity-density windows
+    are extracted too; with deferred_only, only the windows deferred by an earlier run are.
+    """
+    msg = "Loading PDF pages..."
     print(msg)
     if status_callback: status_callback(msg)
     
@@ -61,104 +84,287 @@ def process_document(file_path: str = None, status_callback=None):
         if status_callback: status_callback(msg)
         return
 
-    loader = PyPDFLoader(file_path)
-    docs = loader.load()
-    
-    # Split text into chunks (LLMs can't read whole books at once)
-    splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=200)
-    chunks = splitter.split_documents(docs)
+    graph = get_graph(workspace)
+    llm = get_json_llm()
+
+    # Same chunks (and chunk keys) as the vector index, grouped into larger windows
+    # for the LLM, so every extracted fact maps back to retrieval chunks
+    chunks = group_windows(load_chunks(file_path), GRAPH_WINDOW_TOKENS)
     
     msg = f"Processing {len(chunks)} chunks..."
     print(msg)
     if status_callback: status_callback(msg)
     
-    for i, chunk in enumerate(chunks):
-        msg = f"Extracting graph from chunk {i+1}/{len(chunks)}..."
+    doc_name = os.path.basename(file_path)
+    selected = list(enumerate(chunks))
+    signatures = {}
+    dup_index = None
+    if EXTRACTION_FILTER:
+        # Cheap local checks first: no LLM call for windows that can't yield new entities
+        dup_index = DuplicateIndex(workspace=graph.workspace)
+        include = include_deferred or deferred_only
+        selected, signatures, filter_stats, duplicates, deferred = filter_windows(chunks, doc_name, dup_index, include)
+        if deferred_only:
+            # The rest of the document was handled by the earlier run
+            pending = dup_index.deferred(doc_name)
+            selected = [(i, w) for i, w in selected if window_key(chunks[i]) in pending]
+            duplicates, deferred = {}, []
+        else:
+            dup_index.defer(doc_name, [window_key(chunks[i]) for i in deferred])
+        selected += replay_duplicates(graph, doc_name, chunks, duplicates, signatures, dup_index)
+        selected.sort(key=lambda item: item[0])
+        avoided = len(pack_windows(list(enumerate(chunks)), GRAPH_PACK_TOKENS, GRAPH_PACK_MAX_CHUNKS)) \
+            - len(pack_windows(selected, GRAPH_PACK_TOKENS, GRAPH_PACK_MAX_CHUNKS))
+        reasons = ", ".join(f"{k}={v}" for k, v in sorted(filter_stats.items()) if k not in ("extract", "skip", "defer"))
+        msg = (f"Pre-filter: {len(selected)}/{len(chunks)} chunks selected, {filter_stats.get('skip', 0)} skipped, "
+               f"{filter_stats.get('defer', 0)} deferred{' (included)' if include else ''} "
+               f"({reasons or 'none filtered'}); ~{avoided} LLM requests avoided.")
+        if deferred_only:
+            msg += f" Extracting the {len(selected)} windows deferred earlier."
         print(msg)
         if status_callback: status_callback(msg)
-        
-        # Invoke Llama 3
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            ("human", "Extract info from this text:\n\n{text}")
-        ])
-        chain = prompt | llm
-        try:
-            response = chain.invoke({"text": chunk.page_content})
-            print(f"DEBUG RESPONSE: {response.content[:100]}...") # Truncate log
-            
-            # Since we requested JSON format, the content should be JSON
-            try:
-                data = json.loads(response.content)
-            except json.JSONDecodeError:
-                # Fallback regex if Llama3 decides to chat
-                match = re.search(r'\{.*\}', response.content, re.DOTALL)
-                if match:
-                    data = json.loads(match.group(0))
-                else:
-                    raise ValueError("No JSON found in response")
-            
-            # Write to Neo4j
-            # We use Cypher queries to merge nodes and relationships
-            
-            # Write to TiDB (Graph)
-            # We collect all nodes and edges for this chunk and insert in one batch
-            
-            batch_nodes = []
-            batch_edges = []
-            
-            # 1. Document Node
-            doc_name = os.path.basename(file_path)
-            batch_nodes.append({
-                "id": doc_name,
-                "type": "Document",
-                "properties": {"name": doc_name}
-            })
 
-            # 2. Extracted Nodes
-            for node in data.get("nodes", []):
-                # Sanitize inputs
-                node_type = node.get('type', 'Unknown').replace(" ", "_")
-                node_id = node.get('id', 'Unknown')
-                
-                batch_nodes.append({
-                    "id": node_id,
-                    "type": node_type,
-                    "properties": {"id": node_id}
-                })
-                
-                # Link to Document
-                batch_edges.append({
-                    "source": node_id,
-                    "target": doc_name,
-                    "type": "MENTIONED_IN",
-                    "properties": {}
-                })
-
-            # 3. Extracted Relationships
-            for rel in data.get("relationships", []):
-                source = rel.get('source', '')
-                target = rel.get('target', '')
-                rel_type = rel.get('type', 'RELATED_TO').upper().replace(" ", "_")
-                
-                if source and target:
-                    batch_edges.append({
-                        "source": source,
-                        "target": target,
-                        "type": rel_type,
-                        "properties": {}
-                    })
-            
-            # Execute Batch Insert covering all nodes and edges for this chunk
+    # Several chunks share one request (and one copy of the system prompt)
+    packs = pack_windows(selected, GRAPH_PACK_TOKENS, GRAPH_PACK_MAX_CHUNKS)
+    stats = {"requests": 0, "splits": 0, "remainders": 0, "continuations": 0, "dropped": 0}
+
+    for p, pack in enumerate(packs):
+        first, last = pack[0][0] + 1, pack[-1][0] + 1
+        msg = f"Extracting graph from chunks {first}-{last}/{len(chunks)} (request {p+1}/{len(packs)})..."
+        print(msg)
+        if status_callback: status_callback(msg)
+
+        for i, data in extract_with_split(llm, pack, stats):
+            if data is None:
+                print(f"Error processing chunk {i+1}: no valid extraction")
+                continue
             try:
-                graph.batch_insert_graph_data(batch_nodes, batch_edges)
-                msg = f"Chunk {i+1} saved to Graph linked to {doc_name}!"
-                print(msg)
+                save_extraction(graph, doc_name, chunks[i], data)
+                if dup_index is not None:
+                    dup_index.add(window_key(chunks[i]), doc_name, signatures[i], data)
+                print(f"Chunk {i+1} saved to Graph linked to {doc_name}!")
             except Exception as e:
                 print(f"Error saving batch for chunk {i+1}: {e}")
 
+    msg = (f"Extracted {len(selected)} chunks in {stats['requests']} LLM requests ({stats['splits']} split retries, "
+           f"{stats['remainders']} remainder and {stats['continuations']} continuation requests, "
+           f"{stats['dropped']} invalid items dropped).")
+    print(msg)
+    if status_callback: status_callback(msg)
+
+def replay_duplicates(graph, doc_name, chunks, duplicates, signatures, dup_index):
+    """
+    Near-duplicate windows reuse the extraction of the window they matched, so the new document
+    still gets its provenance, MENTIONED_IN edges and chunk links without an LLM call.
+    Returns the (index, window) pairs that have no stored extraction and must be extracted.
+    """
+    missing = []
+    for i, match in duplicates.items():
+        data = dup_index.extraction(match)
+        if data is None:
+            missing.append((i, chunks[i]))
+            continue
+        try:
+            save_extraction(graph, doc_name, chunks[i], data)
+            dup_index.add(window_key(chunks[i]), doc_name, signatures[i], data)
         except Exception as e:
-            print(f"Error processing chunk {i+1}: {e}")
+            print(f"Error linking duplicate chunk {i+1}: {e}")
+    if duplicates:
+        print(f"Linked {len(duplicates) - len(missing)} near-duplicate chunks from earlier extractions.")
+    return missing
+
+def pack_windows(windows, max_tokens, max_chunks):
+    """Groups consecutive (index, window) pairs into requests of at most max_tokens / max_chunks."""
+    packs, current, tokens = [], [], 0
+    for i, window in windows:
+        if current and (tokens + window["tokens"] > max_tokens or len(current) >= max_chunks):
+            packs.append(current)
+            current, tokens = [], 0
+        current.append((i, window))
+        tokens += window["tokens"]
+    if current:
+        packs.append(current)
+    return packs
+
+def _finish_reason(message):
+    return (getattr(message, "response_metadata", None) or {}).get("finish_reason")
+
+def _invoke_json(llm, prompt, inputs):
+    """
+    Runs one extraction request through the tolerant parser (streamed if EXTRACTION_STREAMING).
+    Returns (parsed object or None, complete). Output cut off by the token limit, an interrupted
+    stream or a rejected JSON-mode generation still yields whatever was complete.
+    """
+    parser = IncrementalJSONParser()
+    chain = prompt | llm
+    finish_reason = None
+    try:
+        if EXTRACTION_STREAMING:
+            for piece in chain.stream(inputs):
+                parser.feed(piece.content or "")
+                finish_reason = _finish_reason(piece) or finish_reason
+        else:
+            response = chain.invoke(inputs)
+            parser.feed(response.content or "")
+            finish_reason = _finish_reason(response)
+    except Exception as e:
+        generated = failed_generation(e)
+        if generated is None and not parser.started:
+            raise
+        print(f"Recovering partial output after error: {e}")
+        if generated is not None:
+            parser = IncrementalJSONParser()
+            parser.feed(generated)
+        finish_reason = "error"
+    print(f"DEBUG RESPONSE: {parser.text[:100]}...") # Truncate log
+    data, complete = parser.value()
+    return data, complete and finish_reason not in ("length", "error")
+
+def _merge_extraction(result, more):
+    ids = {n["id"] for n in result["nodes"]}
+    result["nodes"] += [n for n in more["nodes"] if n["id"] not in ids]
+    rels = {(r["source"], r["target"], r["type"]) for r in result["relationships"]}
+    result["relationships"] += [r for r in more["relationships"] if (r["source"], r["target"], r["type"]) not in rels]
+
+def _extract_single(llm, window, stats):
+    """One chunk. If the output is cut off, keeps what parsed and asks only for the rest."""
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", system_prompt),
+        ("human", "Extract info from this text:\n\n{text}")
+    ])
+    data, complete = _invoke_json(llm, prompt, {"text": window["text"]})
+    if data is None:
+        raise ValueError("No JSON found in response")
+    # Cut-off output only yields elements that were closed by the model (see IncrementalJSONParser)
+    result, dropped = validate_extraction(data)
+
+    rounds = 0
+    while not complete and rounds < MAX_CONTINUATIONS:
+        rounds += 1
+        stats["requests"] += 1
+        stats["continuations"] += 1
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", system_prompt + continuation_prompt),
+            ("human", "Extract info from this text:\n\n{text}")
+        ])
+        extracted = ", ".join(n["id"] for n in result["nodes"]) or "(none)"
+        data, complete = _invoke_json(llm, prompt, {"text": window["text"], "extracted": extracted})
+        if data is None:
+            break
+        more, more_dropped = validate_extraction(data)
+        _merge_extraction(result, more)
+        dropped += more_dropped
+    stats["dropped"] += dropped
+    return result
+
+def _extract_pack(llm, pack, stats):
+    """
+    One request for several chunks. Returns ([(chunk_index, data)], remainder): chunks whose
+    output was complete and valid, and the pack entries that still need a request.
+    """
+    text = "\n\n".join(f'<chunk index="{n}">\n{window["text"]}\n</chunk>' for n, (_, window) in enumerate(pack))
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", system_prompt + packed_prompt),
+        ("human", "Extract info from each of these {count} chunks:\n\n{text}")
+    ])
+    data, complete = _invoke_json(llm, prompt, {"text": text, "count": len(pack)})
+    if not isinstance(data, dict):
+        raise ValueError("No JSON found in response")
+
+    items = [item for item in data.get("chunks", []) if isinstance(item, dict) and isinstance(item.get("index"), int)]
+    if not complete and items:
+        items = items[:-1]  # the last item may have been cut off mid-way
+    results = {}
+    for item in items:
+        if 0 <= item["index"] < len(pack) and item["index"] not in results:
+            results[item["index"]], dropped = validate_extraction(item)
+            stats["dropped"] += dropped
+    remainder = [entry for n, entry in enumerate(pack) if n not in results]
+    return [(pack[n][0], result) for n, result in sorted(results.items())], remainder
+
+def extract_with_split(llm, pack, stats):
+    """
+    Extracts a pack. Chunks recovered from the output are kept and only the remainder is
+    re-requested; if nothing was usable the pack is split in half. A single chunk uses the
+    one-chunk prompt. Returns [(chunk_index, data or None)].
+    """
+    stats["requests"] += 1
+    try:
+        if len(pack) == 1:
+            return [(pack[0][0], _extract_single(llm, pack[0][1], stats))]
+        results, remainder = _extract_pack(llm, pack, stats)
+    except Exception as e:
+        if len(pack) == 1:
+            print(f"Extraction failed for chunk {pack[0][0]+1}: {e}")
+            return [(pack[0][0], None)]
+        print(f"Packed extraction of {len(pack)} chunks failed ({e}), splitting...")
+        results, remainder = [], pack
+
+    if not remainder:
+        return results
+    if results:
+        print(f"Recovered {len(results)}/{len(pack)} chunks, re-requesting the other {len(remainder)}...")
+        stats["remainders"] += 1
+        return results + extract_with_split(llm, remainder, stats)
+    stats["splits"] += 1
+    middle = len(remainder) // 2
+    return extract_with_split(llm, remainder[:middle], stats) + extract_with_split(llm, remainder[middle:], stats)
+
+def save_extraction(graph, doc_name, chunk, data):
+    """Writes one chunk's extracted entities and relationships, linked to the document and its chunks."""
+    # Write to TiDB (Graph)
+    # We collect all nodes and edges for this chunk and insert in one batch
+    
+    batch_nodes = []
+    batch_edges = []
+    
+    # 1. Document Node
+    batch_nodes.append({
+        "id": doc_name,
+        "type": "Document",
+        "properties": {"name": doc_name}
+    })
+
+    # 2. Extracted Nodes
+    for node in data.get("nodes", []):
+        # Sanitize inputs
+        node_type = node.get('type', 'Unknown').replace(" ", "_")
+        node_id = node.get('id', 'Unknown')
+        
+        batch_nodes.append({
+            "id": node_id,
+            "type": node_type,
+            "properties": {"id": node_id}
+        })
+        
+        # Link to Document
+        batch_edges.append({
+            "source": node_id,
+            "target": doc_name,
+            "type": "MENTIONED_IN",
+            "properties": {}
+        })
+
+    # 3. Extracted Relationships
+    for rel in data.get("relationships", []):
+        source = rel.get('source', '')
+        target = rel.get('target', '')
+        rel_type = rel.get('type', 'RELATED_TO').upper().replace(" ", "_")
+        
+        if source and target:
+            batch_edges.append({
+                "source": source,
+                "target": target,
+                "type": rel_type,
+                "properties": {}
+            })
+    
+    # Execute Batch Insert covering all nodes and edges for this chunk
+    graph.batch_insert_graph_data(batch_nodes, batch_edges, document=doc_name)
+
+    # 4. Chunk -> Entity mentions (links vector hits to graph neighborhoods)
+    entity_ids = [n["id"] for n in batch_nodes if n["type"] != "Document"]
+    graph.link_chunk_entities(chunk["keys"], entity_ids)
 
 if __name__ == "__main__":
     # Clear DB first (Optional, good for testing)
@@ -169,4 +375,8 @@ if __name__ == "__main__":
     #     graph.query("MATCH (n) DETACH DELETE n")
     #     print("Database cleared.")
     
-    process_document()
+    # Usage: python src/ingest.py [file.pdf] [--include-deferred | --deferred-only]
+    flags = {flag for flag in ("--include-deferred", "--deferred-only") if flag in sys.argv}
+    for flag in flags:
+        sys.argv.remove(flag)
+    process_document(include_deferred="--include-deferred" in flags, deferred_only="--deferred-only" in flags)
@@ -0,0 +1,112 @@
+import re
+import sys
+from collections import Counter
+
+# Tokens keep internal separators so tickers, form names and contract numbers
+# ("10-K", "C-2023-0045", "AT&T") survive as single exact-match terms.
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-/&][a-z0-9]+)*")
+MAX_TERM_LENGTH = 64
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in",
+    "is", "it", "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "what",
+    "which", "who", "will", "with", "how", "does", "do", "did", "their", "they", "about",
+}
+
+def tokenize(text: str):
+    """Lowercased terms for indexing and querying. Compound tokens also emit their parts."""
+    terms = []
+    for token in TOKEN_RE.findall((text or "").lower()):
+        if len(token) > MAX_TERM_LENGTH:
+            continue
+        if token not in STOPWORDS:
+            terms.append(token)
+        parts = re.split(r"[.\-/&]", token)
+        if len(parts) > 1:
+            terms.extend(p for p in parts if len(p) > 1 and p not in STOPWORDS)
+    return terms
+
+# Legal-form suffixes ignored when looking for an entity in text ("Acme Corp." ~ "Acme's")
+LEGAL_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "ltd", "limited", "llc", "plc",
+    "group", "holdings", "sa", "ag", "nv", "gmbh",
+}
+
+def entity_terms(name: str):
+    """Distinctive terms of an entity name: no stopwords and, if anything else is left, no legal suffixes."""
+    terms = [t for t in TOKEN_RE.findall((name or "").lower()) if t not in STOPWORDS]
+    return [t for t in terms if t not in LEGAL_SUFFIXES] or terms
+
+def mentions(name: str, text: str, words=None):
+    """
+    Whether text mentions an extracted entity: its name verbatim, all of its distinctive terms
+    (in any form the tokenizer splits them into), or the acronym of a name of three or more terms.
+    words: set(tokenize(text)), when the same text is checked for many names.
+    """
+    if not name or not text:
+        return False
+    if name.lower() in text.lower():
+        return True
+    terms = entity_terms(name)
+    if not terms:
+        return False
+    words = words if words is not None else set(tokenize(text))
+    if all(term in words for term in terms):
+        return True
+    if len(terms) >= 3:
+        acronym = "".join(term[0] for term in terms).upper()
+        return re.search(rf"\b{acronym}\b", text) is not None
+    return False
+
+def term_postings(text: str):
+    """Returns (term, tf) pairs and the document length for one chunk."""
+    terms = tokenize(text)
+    return list(Counter(terms).items()), len(terms)
+
+def reciprocal_rank_fusion(ranked_lists, k: int = 60, key="id"):
+    """
+    Fuses several ranked lists of row dicts into one, scoring each row by
+    sum(1 / (k + rank)). Rows seen in several lists are merged (first one wins).
+    """
+    scores = {}
+    rows = {}
+    for ranked in ranked_lists:
+        for rank, row in enumerate(ranked, 1):
+            row_id = row[key]
+            scores[row_id] = scores.get(row_id, 0.0) + 1.0 / (k + rank)
+            merged = rows.setdefault(row_id, dict(row))
+            for field, value in row.items():
+                if merged.get(field) is None:
+                    merged[field] = value
+
+    fused = sorted(rows.values(), key=lambda r: scores[r[key]], reverse=True)
+    for row in fused:
+        row["rrf_score"] = scores[row[key]]
+    return fused
+
+def rebuild_index(batch_size: int = 500, workspace=None):
+    """Re-indexes every chunk of a workspace. Needed once for chunks ingested before hybrid search existed."""
+    from tidb_store import TiDBGraph
+    graph = TiDBGraph(workspace=workspace)
+
+    last_id = 0
+    total = 0
+    while True:
+        rows = graph.query(
+            "SELECT id, content FROM chunks WHERE workspace_id = %s AND id > %s ORDER BY id LIMIT %s",
+            (graph.workspace, last_id, batch_size)
+        )
+        if not rows:
+            break
+        graph.index_chunk_terms([(row["id"], row["content"]) for row in rows])
+        last_id = rows[-1]["id"]
+        total += len(rows)
+        print(f"Indexed {total} chunks...")
+
+    print(f"Lexical index rebuilt for {total} chunks.")
+
+if __name__ == "__main__":
+    if "--rebuild" in sys.argv:
+        rebuild_index()
+    else:
+        print("Usage: python src/lexical_index.py --rebuild")
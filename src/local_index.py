@@ -0,0 +1,368 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from config import LOCAL_INDEX_DIR, WORKSPACES_DIR, EMBEDDING_DTYPE, RESCORE_FACTOR
+from quantization import (
+    DTYPES, parse_vector, normalize, quantize, approximate_scores,
+    bytes_per_vector, footprint, recall_at_k
+)
+
+META_FILE = "meta.json"
+TOMBSTONES_FILE = "tombstones.npy"
+# Rows fetched from TiDB per page, ids listed per page, and rows per segment file
+SYNC_PAGE_ROWS = 2000
+ID_PAGE_ROWS = 50_000
+SEGMENT_ROWS = 100_000
+# Share of deleted rows at which sync rebuilds the index instead of masking them
+TOMBSTONE_REBUILD_SHARE = 0.25
+# Rows scored at a time, bounds temporary memory during a scan
+SCAN_BLOCK_ROWS = 65_536
+
+def clear_local_indexes():
+    """Deletes the local index of every workspace; its chunk ids refer to tables that were dropped."""
+    paths = [LOCAL_INDEX_DIR] + glob.glob(os.path.join(WORKSPACES_DIR, "*", os.path.basename(LOCAL_INDEX_DIR)))
+    removed = 0
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+            removed += 1
+    return removed
+
+class LocalVectorIndex:
+    """
+    Memory-mapped copy of the chunk embeddings for local vector search.
+
+    The index is a list of append-only segments, each holding
+      ids.npy    chunk ids (int64)
+      docs.npy   index into meta["documents"] (int32), for file filters
+      full.npy   normalized float32 vectors (only candidate rows are read when rescoring)
+      codes.npy  vectors in the configured dtype (float16 / int8); scanned on every search
+      scales.npy per-vector int8 scales
+    Ids of chunks deleted from TiDB since they were indexed are kept in tombstones.npy and
+    never returned. Chunk text stays in TiDB; search returns (chunk_id, cosine_distance) pairs.
+    """
+
+    def __init__(self, root=LOCAL_INDEX_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._meta = None
+        self._mtime = None
+        self._segments = []
+        self._tombstones = np.empty(0, dtype="int64")
+
+    # --- Storage ---
+
+    def _meta_path(self):
+        return os.path.join(self.root, META_FILE)
+
+    def _load(self):
+        """(Re)opens the segments when meta.json changes on disk."""
+        path = self._meta_path()
+        if not os.path.exists(path):
+            self._meta, self._segments, self._mtime = None, [], None
+            self._tombstones = np.empty(0, dtype="int64")
+            return
+        mtime = os.path.getmtime(path)
+        if mtime == self._mtime:
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        segments = []
+        for name in meta["segments"]:
+            seg_dir = os.path.join(self.root, name)
+
+            def load(file):
+                file_path = os.path.join(seg_dir, file)
+                return np.load(file_path, mmap_mode="r") if os.path.exists(file_path) else None
+
+            full = load("full.npy")
+            codes = load("codes.npy")
+            segments.append({
+                "ids": load("ids.npy"),
+                "docs": load("docs.npy"),
+                "full": full,
+                "codes": codes if codes is not None else full,
+                "scales": load("scales.npy"),
+            })
+        tombstones_path = os.path.join(self.root, TOMBSTONES_FILE)
+        self._tombstones = np.load(tombstones_path) if os.path.exists(tombstones_path) else np.empty(0, dtype="int64")
+        self._meta, self._segments, self._mtime = meta, segments, mtime
+
+    def _write_meta(self, meta):
+        tmp = self._meta_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, self._meta_path())
+
+    def _write_segment(self, meta, ids, docs, vectors):
+        name = f"seg_{len(meta['segments']):05d}"
+        seg_dir = os.path.join(self.root, name)
+        os.makedirs(seg_dir, exist_ok=True)
+        full = normalize(np.stack(vectors))
+        np.save(os.path.join(seg_dir, "ids.npy"), np.asarray(ids, dtype="int64"))
+        np.save(os.path.join(seg_dir, "docs.npy"), np.asarray(docs, dtype="int32"))
+        np.save(os.path.join(seg_dir, "full.npy"), full)
+        if meta["dtype"] != "float32":
+            codes, scales = quantize(full, meta["dtype"])
+            np.save(os.path.join(seg_dir, "codes.npy"), codes)
+            if scales is not None:
+                np.save(os.path.join(seg_dir, "scales.npy"), scales)
+        meta["segments"].append(name)
+        meta["dim"] = full.shape[1]
+        meta["count"] += len(ids)
+        meta["max_id"] = max(meta["max_id"], int(max(ids)))
+
+    def _remote_ids(self, graph):
+        """Ids of the workspace's embedded chunks in TiDB, listed with keyset pagination."""
+        pages, last_id = [], 0
+        while True:
+            rows = graph.query(
+                "SELECT id FROM chunks WHERE workspace_id = %s AND id > %s AND embedding IS NOT NULL "
+                "ORDER BY id LIMIT %s",
+                (graph.workspace, last_id, ID_PAGE_ROWS)
+            )
+            if not rows:
+                break
+            pages.append(np.array([row["id"] for row in rows], dtype="int64"))
+            last_id = rows[-1]["id"]
+        return np.concatenate(pages) if pages else np.empty(0, dtype="int64")
+
+    @staticmethod
+    def _table_created(graph):
+        rows = graph.query(
+            "SELECT CREATE_TIME AS created FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = 'chunks'"
+        )
+        return str(rows[0]["created"]) if rows else None
+
+    def sync(self, graph, dtype=None, rebuild=False, status_callback=None):
+        """
+        Brings the index in line with the chunks of the graph's workspace by id set difference:
+        ids missing locally are fetched and appended (one segment per SEGMENT_ROWS), ids no longer
+        in TiDB are tombstoned. TiDB auto-increment ids are not monotonic, so "newer than the last
+        id" would miss rows. Ids are only comparable within one chunks table: the index is rebuilt
+        when the table was recreated (clear_data) or its max id dropped, when tombstones exceed
+        TOMBSTONE_REBUILD_SHARE, and on rebuild=True (e.g. to change dtype).
+        """
+        def report(msg):
+            print(msg)
+            if status_callback: status_callback(msg)
+
+        with self._lock:
+            self._load()
+            meta = self._meta
+            remote = self._remote_ids(graph)
+            created = self._table_created(graph)
+            if meta is not None and not rebuild:
+                if meta.get("table_created") != created:
+                    report("Local index: chunks table was recreated, rebuilding.")
+                    rebuild = True
+                elif remote.size and int(remote.max()) < meta["max_id"]:
+                    report("Local index: chunk ids went backwards, rebuilding.")
+                    rebuild = True
+            local = np.concatenate([np.asarray(seg["ids"]) for seg in self._segments]) \
+                if meta is not None and not rebuild and self._segments else np.empty(0, dtype="int64")
+            tombstones = np.setdiff1d(local, remote)
+            if local.size and tombstones.size > local.size * TOMBSTONE_REBUILD_SHARE:
+                report(f"Local index: {tombstones.size} of {local.size} vectors deleted, rebuilding.")
+                rebuild = True
+            if rebuild or meta is None or (dtype and dtype != meta["dtype"]):
+                if os.path.exists(self.root):
+                    shutil.rmtree(self.root)
+                meta = {"dtype": dtype or EMBEDDING_DTYPE, "dim": None, "count": 0, "max_id": 0,
+                        "documents": [], "segments": []}
+                local, tombstones = np.empty(0, dtype="int64"), np.empty(0, dtype="int64")
+            if meta["dtype"] not in DTYPES:
+                raise ValueError(f"Unknown embedding dtype: {meta['dtype']} (expected one of {DTYPES})")
+            meta["table_created"] = created
+            os.makedirs(self.root, exist_ok=True)
+            doc_index = {doc: i for i, doc in enumerate(meta["documents"])}
+
+            missing = np.setdiff1d(remote, local)
+            ids, docs, vectors = [], [], []
+            added = 0
+            for start in range(0, len(missing), SYNC_PAGE_ROWS):
+                page = missing[start:start + SYNC_PAGE_ROWS].tolist()
+                rows = graph.query(
+                    "SELECT id, document, CAST(embedding AS CHAR) AS embedding FROM chunks "
+                    f"WHERE workspace_id = %s AND id IN ({', '.join(['%s'] * len(page))}) AND embedding IS NOT NULL",
+                    (graph.workspace, *page)
+                )
+                for row in rows:
+                    doc = row["document"] or ""
+                    if doc not in doc_index:
+                        doc_index[doc] = len(meta["documents"])
+                        meta["documents"].append(doc)
+                    ids.append(row["id"])
+                    docs.append(doc_index[doc])
+                    vectors.append(parse_vector(row["embedding"]))
+                last_page = start + SYNC_PAGE_ROWS >= len(missing)
+                if len(ids) >= SEGMENT_ROWS or (last_page and ids):
+                    self._write_segment(meta, ids, docs, vectors)
+                    added += len(ids)
+                    ids, docs, vectors = [], [], []
+                    report(f"Local index: {meta['count']} vectors ({meta['dtype']})")
+
+            np.save(os.path.join(self.root, TOMBSTONES_FILE), tombstones.astype("int64"))
+            meta["deleted"] = int(tombstones.size)
+            meta["synced_at"] = datetime.utcnow().isoformat()
+            self._write_meta(meta)
+            self._mtime = None
+            self._load()
+        return added
+
+    # --- Search ---
+
+    def search(self, query_embedding, top_k=5, file_filters=None, rescore=True):
+        """
+        Returns [(chunk_id, cosine_distance)] best first. Quantized codes are scanned block by block;
+        with rescoring, top_k * RESCORE_FACTOR candidates are re-ranked on their float32 rows.
+        """
+        with self._lock:
+            self._load()
+            meta, segments, tombstones = self._meta, list(self._segments), self._tombstones
+        if not meta or not segments:
+            return []
+
+        query = normalize(query_embedding)
+        allowed = None
+        if file_filters:
+            allowed = np.array([i for i, doc in enumerate(meta["documents"])
+                                if any(doc.endswith(f) for f in file_filters)], dtype="int32")
+            if allowed.size == 0:
+                return []
+
+        quantized = meta["dtype"] != "float32"
+        n_candidates = top_k * max(RESCORE_FACTOR, 1) if quantized and rescore else top_k
+        cand_scores, cand_seg, cand_row = [], [], []
+        for s, seg in enumerate(segments):
+            for start in range(0, len(seg["ids"]), SCAN_BLOCK_ROWS):
+                stop = start + SCAN_BLOCK_ROWS
+                scales = seg["scales"][start:stop] if seg["scales"] is not None else None
+                scores = approximate_scores(seg["codes"][start:stop], scales, query)
+                if allowed is not None:
+                    scores[~np.isin(seg["docs"][start:stop], allowed)] = -np.inf
+                if tombstones.size:
+                    scores[np.isin(seg["ids"][start:stop], tombstones)] = -np.inf
+                keep = min(n_candidates, len(scores))
+                best = np.argpartition(-scores, keep - 1)[:keep]
+                cand_scores.append(scores[best])
+                cand_seg.append(np.full(keep, s))
+                cand_row.append(best + start)
+
+        scores = np.concatenate(cand_scores)
+        seg_idx = np.concatenate(cand_seg)
+        row_idx = np.concatenate(cand_row)
+        order = np.argsort(-scores)[:n_candidates]
+        order = order[np.isfinite(scores[order])]
+
+        if quantized and rescore:
+            exact = np.array([
+                float(segments[seg_idx[i]]["full"][row_idx[i]] @ query) for i in order
+            ], dtype="float32")
+            ranked = np.argsort(-exact)
+            order, final = order[ranked], exact[ranked]
+        else:
+            final = scores[order]
+
+        return [
+            (int(segments[seg_idx[i]]["ids"][row_idx[i]]), 1.0 - float(score))
+            for i, score in zip(order[:top_k].tolist(), final[:top_k])
+        ]
+
+    def stats(self):
+        with self._lock:
+            self._load()
+            meta = self._meta
+        if not meta or not meta["count"]:
+            return {"count": 0}
+        return {
+            "count": meta["count"] - meta.get("deleted", 0),
+            "deleted": meta.get("deleted", 0),
+            "dim": meta["dim"],
+            "dtype": meta["dtype"],
+            "segments": len(meta["segments"]),
+            "synced_at": meta.get("synced_at"),
+            **footprint(meta["count"], meta["dim"], meta["dtype"]),
+        }
+
+    # --- Benchmark ---
+
+    def benchmark(self, n_queries=100, k=10, seed=42):
+        """
+        Compares float32 / float16 / int8 on this corpus: bytes per vector, memory footprint,
+        recall@k against exact float32 search (with and without rescoring) and scan latency.
+        Queries are sampled chunk embeddings; each query's own chunk is excluded.
+        """
+        with self._lock:
+            self._load()
+            meta, segments = self._meta, list(self._segments)
+        if not meta or not meta["count"]:
+            print("Local index is empty. Run: python src/local_index.py --sync")
+            return []
+
+        full = np.concatenate([np.asarray(seg["full"]) for seg in segments])
+        rng = np.random.default_rng(seed)
+        query_rows = rng.choice(len(full), size=min(n_queries, len(full)), replace=False)
+        queries = full[query_rows]
+
+        def top(scores):
+            scores[np.arange(len(query_rows)), query_rows] = -np.inf
+            return np.argsort(-scores, axis=1)[:, :k]
+
+        exact = top(queries @ full.T)
+        results = []
+        for dtype in DTYPES:
+            codes, scales = quantize(full, dtype)
+            start = time.time()
+            approx = codes.astype("float32") @ queries.T
+            if scales is not None:
+                approx *= scales[:, None]
+            scan_ms = (time.time() - start) * 1000 / len(query_rows)
+            approx = approx.T
+            plain = top(approx.copy())
+            # Rescore RESCORE_FACTOR * k candidates at full precision
+            approx[np.arange(len(query_rows)), query_rows] = -np.inf
+            cands = np.argsort(-approx, axis=1)[:, :k * max(RESCORE_FACTOR, 1)]
+            exact_cand = np.einsum("qd,qcd->qc", queries, full[cands])
+            rescored = np.take_along_axis(cands, np.argsort(-exact_cand, axis=1)[:, :k], axis=1)
+
+            results.append({
+                **footprint(len(full), full.shape[1], dtype),
+                "bytes_per_vector": bytes_per_vector(dtype, full.shape[1]),
+                f"recall@{k}": float(np.mean([recall_at_k(e, a) for e, a in zip(exact, plain)])),
+                f"recall@{k}_rescored": float(np.mean([recall_at_k(e, a) for e, a in zip(exact, rescored)])),
+                "scan_ms_per_query": scan_ms,
+            })
+
+        print(f"{len(full)} vectors x {full.shape[1]} dims, {len(query_rows)} queries, k={k}, rescore x{RESCORE_FACTOR}")
+        print(f"{'dtype':<8} {'B/vec':>6} {'scanned MB':>11} {'stored MB':>10} {'recall':>7} {'rescored':>9} {'ms/q':>7}")
+        for r in results:
+            print(f"{r['dtype']:<8} {r['bytes_per_vector']:>6} {r['scanned_bytes'] / 1e6:>11.1f} "
+                  f"{r['stored_bytes'] / 1e6:>10.1f} {r[f'recall@{k}']:>7.3f} "
+                  f"{r[f'recall@{k}_rescored']:>9.3f} {r['scan_ms_per_query']:>7.2f}")
+        return results
+
+if __name__ == "__main__":
+    # Usage: python src/local_index.py --sync [--rebuild] [--dtype int8] | --stats | --benchmark [--k 10]
+    from resources import get_graph, get_local_index
+    index = get_local_index()
+    if "--sync" in sys.argv or "--rebuild" in sys.argv:
+        dtype = sys.argv[sys.argv.index("--dtype") + 1] if "--dtype" in sys.argv else None
+        index.sync(get_graph(), dtype=dtype, rebuild="--rebuild" in sys.argv)
+        print(index.stats())
+    elif "--benchmark" in sys.argv:
+        k = int(sys.argv[sys.argv.index("--k") + 1]) if "--k" in sys.argv else 10
+        index.benchmark(k=k)
+    elif "--stats" in sys.argv:
+        print(index.stats())
+    else:
+        print("Usage: python src/local_index.py --sync [--rebuild] [--dtype int8] | --stats | --benchmark [--k 10]")
@@ -1,33 +1,50 @@
 import os
-import shutil
-from tidb_store import TiDBGraph
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-from config import UPLOAD_DIR
+from config import UPLOAD_DIR, DELETE_BATCH_SIZE
+from resources import get_graph
+from extraction_filter import DuplicateIndex
+from workspaces import workspace_dir
 
-# Initialize Graph
-graph = TiDBGraph()
+# Deletions run one at a time in the background so the UI never blocks on a large document
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="delete")
+_jobs = {}
+_jobs_lock = threading.Lock()
+# Finished jobs stay pollable this long, then are evicted
+FINISHED_JOB_TTL = 600
 
-def list_documents():
+def upload_dir(workspace=None):
+    """Directory holding a workspace's uploaded files."""
+    return workspace_dir(UPLOAD_DIR, workspace)
+
+def list_documents(workspace=None):
     """
-    Returns a list of documents found in the upload directory.
+    Returns a list of documents found in the workspace's upload directory.
     Returns: List[str] filenames
     """
-    if not os.path.exists(UPLOAD_DIR):
+    directory = upload_dir(workspace)
+    if not os.path.exists(directory):
         return []
-    return [f for f in os.listdir(UPLOAD_DIR) if f.endswith(".pdf")]
+    return [f for f in os.listdir(directory) if f.endswith(".pdf")]
 
-def delete_document(filename: str):
+def delete_document(filename: str, progress_callback=None, workspace=None):
     """
-    Deletes a document from:
+    Deletes a document of a workspace from:
     1. Disk
-    2. TiDB Vector Store (Chunks)
-    3. TiDB Knowledge Graph (Document node)
+    2. TiDB Vector Store (Chunks, with their lexical postings and entity links)
+    3. TiDB Knowledge Graph (Document node, plus entities and relations no other document mentions)
+
+    Deletion is batched by the `document` column, so no single transaction grows with the document.
     """
-    results = {"disk": False, "vector": False, "graph": False}
+    results = {"disk": False, "vector": False, "graph": False, "deleted": {}}
+    graph = get_graph(workspace)
     
     # 1. Delete from Disk
-    file_path = os.path.join(UPLOAD_DIR, filename)
+    file_path = os.path.join(upload_dir(workspace), filename)
     if os.path.exists(file_path):
         try:
             os.remove(file_path)
@@ -35,24 +52,66 @@ def delete_document(filename: str):
         except Exception as e:
             print(f"Error deleting file: {e}")
     
-    # 2. Delete from Vector Store
+    # 2. + 3. Delete from Vector Store and Knowledge Graph
+    deleted = results["deleted"]
     try:
-        # Delete chunks where source matches filename (suffix match)
-        sql = "DELETE FROM chunks WHERE source LIKE %s"
-        # In Cypher we used ENDS WITH. In SQL: '%filename'
-        graph.query(sql, (f"%{filename}",))
+        for stage, count in graph.delete_document_batches(filename, batch_size=DELETE_BATCH_SIZE):
+            deleted[stage] = deleted.get(stage, 0) + count
+            if progress_callback:
+                progress_callback(stage, deleted)
         results["vector"] = True
+        results["graph"] = True
     except Exception as e:
-        print(f"Error deleting vectors: {e}")
+        print(f"Error deleting {filename} from TiDB: {e}")
 
-    # 3. Delete from Knowledge Graph
+    # Forget its extraction fingerprints, or re-uploads elsewhere would be skipped as duplicates
     try:
-        # Delete Document Node. Edges will be deleted via CASCADE.
-        # In ingest.py, we used doc_name as the ID.
-        sql = "DELETE FROM nodes WHERE id = %s"
-        graph.query(sql, (filename,))
-        results["graph"] = True
+        DuplicateIndex(workspace=graph.workspace).remove_document(filename)
     except Exception as e:
-        print(f"Error deleting graph node: {e}")
+        print(f"Error clearing extraction fingerprints: {e}")
         
     return results
+
+def _update_job(job_id, **fields):
+    with _jobs_lock:
+        _jobs[job_id].update(fields)
+        if fields.get("state") in ("done", "failed"):
+            _jobs[job_id]["finished_at"] = time.time()
+
+def _evict_finished_jobs():
+    """Drops jobs finished more than FINISHED_JOB_TTL ago. Caller holds _jobs_lock."""
+    cutoff = time.time() - FINISHED_JOB_TTL
+    for job_id in [j for j, job in _jobs.items() if job.get("finished_at") and job["finished_at"] < cutoff]:
+        del _jobs[job_id]
+
+def _run_delete_job(job_id, filename, workspace):
+    _update_job(job_id, state="running", message=f"Deleting {filename}...")
+
+    def on_progress(stage, deleted):
+        summary = ", ".join(f"{count} {name}" for name, count in deleted.items())
+        _update_job(job_id, stage=stage, deleted=dict(deleted), message=f"Removed {summary}")
+
+    try:
+        result = delete_document(filename, progress_callback=on_progress, workspace=workspace)
+        ok = result["vector"] and result["graph"]
+        _update_job(job_id, state="done" if ok else "failed", result=result,
+                    message=f"Deleted {filename}" if ok else f"Could not fully delete {filename}")
+    except Exception as e:
+        _update_job(job_id, state="failed", message=str(e))
+
+def start_delete_job(filename: str, workspace=None):
+    """Queues a background deletion and returns its job id (poll it with get_job)."""
+    job_id = uuid.uuid4().hex
+    with _jobs_lock:
+        _evict_finished_jobs()
+        _jobs[job_id] = {"id": job_id, "filename": filename, "workspace": workspace, "state": "queued",
+                         "stage": None, "deleted": {}, "message": f"Queued deletion of {filename}", "result": None}
+    _executor.submit(_run_delete_job, job_id, filename, workspace)
+    return job_id
+
+def get_job(job_id: str):
+    """Snapshot of a deletion job, or None if unknown (or finished and evicted)."""
+    with _jobs_lock:
+        _evict_finished_jobs()
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
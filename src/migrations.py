@@ -0,0 +1,564 @@
+import re
+import sys
+import time
+import logging
+import threading
+from mysql.connector import Error
+
+logger = logging.getLogger(__name__)
+
+class Migration:
+    """
+    One schema version. Statements must be idempotent (IF NOT EXISTS) so a migration
+    interrupted halfway can simply be re-run. Optional migrations (e.g. features the
+    cluster may not support) are recorded as 'skipped' instead of blocking later ones.
+    A statement can also be a callable (cursor, report) for steps that have to inspect
+    the schema or copy data in batches.
+    """
+
+    def __init__(self, version, description, statements, optional=False):
+        self.version = version
+        self.description = description
+        self.statements = statements
+        self.optional = optional
+
+# Tables whose primary key gains workspace_id, in foreign-key order:
+# (table, DDL with the workspace-leading keys, copied columns, key columns of the old table)
+WORKSPACE_TABLES = [
+    ("nodes", """
+        CREATE TABLE IF NOT EXISTS nodes (
+            workspace_id VARCHAR(64) NOT NULL DEFAULT 'default',
+            id VARCHAR(255) NOT NULL,
+            type VARCHAR(100),
+            properties JSON,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (workspace_id, id),
+            INDEX idx_nodes_ws_type (workspace_id, type)
+        );
+    """, ["id", "type", "properties", "created_at"], ["id"]),
+    ("edges", """
+        CREATE TABLE IF NOT EXISTS edges (
+            workspace_id VARCHAR(64) NOT NULL DEFAULT 'default',
+            source VARCHAR(255) NOT NULL,
+            target VARCHAR(255) NOT NULL,
+            type VARCHAR(100) NOT NULL,
+            properties JSON,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (workspace_id, source, target, type),
+            INDEX idx_edges_ws_target (workspace_id, target, type),
+            FOREIGN KEY (workspace_id, source) REFERENCES nodes(workspace_id, id) ON DELETE CASCADE,
+            FOREIGN KEY (workspace_id, target) REFERENCES nodes(workspace_id, id) ON DELETE CASCADE
+        );
+    """, ["source", "target", "type", "properties", "created_at"], ["source", "target", "type"]),
+    ("chunk_terms", """
+        CREATE TABLE IF NOT EXISTS chunk_terms (
+            workspace_id VARCHAR(64) NOT NULL DEFAULT 'default',
+            term VARCHAR(64) NOT NULL,
+            chunk_id INT NOT NULL,
+            tf INT,
+            doc_len INT,
+            PRIMARY KEY (workspace_id, term, chunk_id),
+            INDEX idx_chunk_terms_chunk (chunk_id),
+            FOREIGN KEY (chunk_id) REFERENCES chunks(id) ON DELETE CASCADE
+        );
+    """, ["term", "chunk_id", "tf", "doc_len"], ["term", "chunk_id"]),
+    ("chunk_entities", """
+        CREATE TABLE IF NOT EXISTS chunk_entities (
+            workspace_id VARCHAR(64) NOT NULL DEFAULT 'default',
+            chunk_id INT NOT NULL,
+            node_id VARCHAR(255) NOT NULL,
+            PRIMARY KEY (workspace_id, chunk_id, node_id),
+            INDEX idx_chunk_entities_ws_node (workspace_id, node_id),
+            FOREIGN KEY (chunk_id) REFERENCES chunks(id) ON DELETE CASCADE,
+            FOREIGN KEY (workspace_id, node_id) REFERENCES nodes(workspace_id, id) ON DELETE CASCADE
+        );
+    """, ["chunk_id", "node_id"], ["chunk_id", "node_id"]),
+    ("communities", """
+        CREATE TABLE IF NOT EXISTS communities (
+            workspace_id VARCHAR(64) NOT NULL DEFAULT 'default',
+            id VARCHAR(40) NOT NULL,
+            title VARCHAR(255),
+            summary TEXT,
+            node_count INT,
+            embedding VECTOR(384),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (workspace_id, id)
+        );
+    """, ["id", "title", "summary", "node_count", "embedding", "created_at"], ["id"]),
+    ("community_members", """
+        CREATE TABLE IF NOT EXISTS community_members (
+            workspace_id VARCHAR(64) NOT NULL DEFAULT 'default',
+            community_id VARCHAR(40) NOT NULL,
+            node_id VARCHAR(255) NOT NULL,
+            PRIMARY KEY (workspace_id, community_id, node_id),
+            FOREIGN KEY (workspace_id, community_id) REFERENCES communities(workspace_id, id) ON DELETE CASCADE
+        );
+    """, ["community_id", "node_id"], ["community_id", "node_id"]),
+    ("node_sources", """
+        CREATE TABLE IF NOT EXISTS node_sources (
+            workspace_id VARCHAR(64) NOT NULL DEFAULT 'default',
+            node_id VARCHAR(255) NOT NULL,
+            document VARCHAR(255) NOT NULL,
+            PRIMARY KEY (workspace_id, node_id, document),
+            INDEX idx_node_sources_ws_document (workspace_id, document),
+            FOREIGN KEY (workspace_id, node_id) REFERENCES nodes(workspace_id, id) ON DELETE CASCADE
+        );
+    """, ["node_id", "document"], ["node_id", "document"]),
+    ("edge_sources", """
+        CREATE TABLE IF NOT EXISTS edge_sources (
+            workspace_id VARCHAR(64) NOT NULL DEFAULT 'default',
+            source VARCHAR(255) NOT NULL,
+            target VARCHAR(255) NOT NULL,
+            type VARCHAR(100) NOT NULL,
+            document VARCHAR(255) NOT NULL,
+            PRIMARY KEY (workspace_id, source, target, type, document),
+            INDEX idx_edge_sources_ws_document (workspace_id, document),
+            FOREIGN KEY (workspace_id, source, target, type)
+                REFERENCES edges(workspace_id, source, target, type) ON DELETE CASCADE
+        );
+    """, ["source", "target", "type", "document"], ["source", "target", "type", "document"]),
+]
+LEGACY_SUFFIX = "_v6"
+COPY_BATCH_ROWS = 5000
+
+def _existing_columns(cursor):
+    cursor.execute("""
+        SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.columns WHERE TABLE_SCHEMA = DATABASE()
+    """)
+    columns = {}
+    for table, column in cursor.fetchall():
+        columns.setdefault(table.lower(), set()).add(column.lower())
+    return columns
+
+def _copy_legacy(cursor, legacy, table, columns, keys, report):
+    """INSERT IGNORE ... SELECT in keyset-bounded batches, one transaction each."""
+    column_list = ", ".join(columns)
+    key_list = ", ".join(keys)
+    key_params = ", ".join(["%s"] * len(keys))
+    copied = 0
+    last = None
+    while True:
+        lower = f"({key_list}) > ({key_params})" if last else "1 = 1"
+        cursor.execute(
+            f"SELECT {key_list} FROM {legacy} WHERE {lower} ORDER BY {key_list} LIMIT 1 OFFSET %s",
+            tuple(last or ()) + (COPY_BATCH_ROWS - 1,)
+        )
+        upper = cursor.fetchone()
+        cursor.fetchall()
+        condition, params = lower, tuple(last or ())
+        if upper:
+            condition += f" AND ({key_list}) <= ({key_params})"
+            params += tuple(upper)
+        cursor.execute(
+            f"INSERT IGNORE INTO {table} (workspace_id, {column_list}) "
+            f"SELECT 'default', {column_list} FROM {legacy} WHERE {condition}",
+            params
+        )
+        copied += max(cursor.rowcount, 0)
+        cursor.execute("COMMIT")
+        if not upper:
+            break
+        last = upper
+        report(f"  {table}: {copied} rows copied")
+    return copied
+
+def rebuild_with_workspace(cursor, report):
+    """
+    Moves tables without workspace_id aside (<table>_v6), recreates them with workspace-leading
+    keys and copies the rows into the 'default' workspace. Safe to re-run at any point.
+    """
+    columns = _existing_columns(cursor)
+    legacy = [t for t, _, _, _ in WORKSPACE_TABLES if t in columns and "workspace_id" not in columns[t]]
+    if legacy:
+        cursor.execute("RENAME TABLE " + ", ".join(f"{t} TO {t}{LEGACY_SUFFIX}" for t in legacy))
+        columns = _existing_columns(cursor)
+
+    cursor.execute("SET SESSION foreign_key_checks = 0")
+    try:
+        for table, ddl, _, _ in WORKSPACE_TABLES:
+            cursor.execute(ddl)
+        for table, _, copy_columns, keys in WORKSPACE_TABLES:
+            if table + LEGACY_SUFFIX in columns:
+                report(f"  copying {table} into workspace 'default'...")
+                _copy_legacy(cursor, table + LEGACY_SUFFIX, table, copy_columns, keys, report)
+        for table, _, _, _ in reversed(WORKSPACE_TABLES):
+            cursor.execute(f"DROP TABLE IF EXISTS {table}{LEGACY_SUFFIX}")
+    finally:
+        cursor.execute("SET SESSION foreign_key_checks = 1")
+
+MIGRATIONS = [
+    Migration(1, "Baseline graph, vector, lexical and community tables", [
+        # Nodes Table
+        """
+        CREATE TABLE IF NOT EXISTS nodes (
+            id VARCHAR(255) PRIMARY KEY,
+            type VARCHAR(100),
+            properties JSON,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        # Edges Table
+        """
+        CREATE TABLE IF NOT EXISTS edges (
+            source VARCHAR(255),
+            target VARCHAR(255),
+            type VARCHAR(100),
+            properties JSON,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (source, target, type),
+            FOREIGN KEY (source) REFERENCES nodes(id) ON DELETE CASCADE,
+            FOREIGN KEY (target) REFERENCES nodes(id) ON DELETE CASCADE
+        );
+        """,
+        # Chunks Table for Vector Search
+        """
+        CREATE TABLE IF NOT EXISTS chunks (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            content TEXT,
+            source VARCHAR(255),
+            page INT,
+            embedding VECTOR(384),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        # Inverted index for lexical (BM25) search, filled at ingest
+        """
+        CREATE TABLE IF NOT EXISTS chunk_terms (
+            term VARCHAR(64),
+            chunk_id INT,
+            tf INT,
+            doc_len INT,
+            PRIMARY KEY (term, chunk_id),
+            FOREIGN KEY (chunk_id) REFERENCES chunks(id) ON DELETE CASCADE
+        );
+        """,
+        # Chunk -> entity mentions, links vector hits to graph nodes
+        """
+        CREATE TABLE IF NOT EXISTS chunk_entities (
+            chunk_id INT,
+            node_id VARCHAR(255),
+            PRIMARY KEY (chunk_id, node_id),
+            FOREIGN KEY (chunk_id) REFERENCES chunks(id) ON DELETE CASCADE,
+            FOREIGN KEY (node_id) REFERENCES nodes(id) ON DELETE CASCADE
+        );
+        """,
+        # Precomputed community summaries for global questions
+        """
+        CREATE TABLE IF NOT EXISTS communities (
+            id VARCHAR(40) PRIMARY KEY,
+            title VARCHAR(255),
+            summary TEXT,
+            node_count INT,
+            embedding VECTOR(384),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS community_members (
+            community_id VARCHAR(40),
+            node_id VARCHAR(255),
+            PRIMARY KEY (community_id, node_id),
+            FOREIGN KEY (community_id) REFERENCES communities(id) ON DELETE CASCADE
+        );
+        """,
+    ]),
+    Migration(2, "Index chunks by (source, page) for per-page lookups", [
+        "ALTER TABLE chunks ADD INDEX IF NOT EXISTS idx_chunks_source_page (source, page);",
+    ]),
+    Migration(3, "HNSW vector index on chunks.embedding (needs TiFlash)", [
+        "ALTER TABLE chunks SET TIFLASH REPLICA 1;",
+        "ALTER TABLE chunks ADD VECTOR INDEX IF NOT EXISTS idx_chunks_embedding ((VEC_COSINE_DISTANCE(embedding))) USING HNSW;",
+    ], optional=True),
+    Migration(4, "Per-document provenance of chunks, nodes and edges", [
+        "ALTER TABLE chunks ADD COLUMN IF NOT EXISTS document VARCHAR(255);",
+        "ALTER TABLE chunks ADD INDEX IF NOT EXISTS idx_chunks_document (document);",
+        # Non-transactional (batched) backfill keeps the transaction size bounded
+        """
+        BATCH ON id LIMIT 5000
+        UPDATE chunks SET document = SUBSTRING_INDEX(REPLACE(source, '\\\\', '/'), '/', -1)
+        WHERE document IS NULL;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS node_sources (
+            node_id VARCHAR(255),
+            document VARCHAR(255),
+            PRIMARY KEY (node_id, document),
+            INDEX idx_node_sources_document (document),
+            FOREIGN KEY (node_id) REFERENCES nodes(id) ON DELETE CASCADE
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS edge_sources (
+            source VARCHAR(255),
+            target VARCHAR(255),
+            type VARCHAR(100),
+            document VARCHAR(255),
+            PRIMARY KEY (source, target, type, document),
+            INDEX idx_edge_sources_document (document),
+            FOREIGN KEY (source, target, type) REFERENCES edges(source, target, type) ON DELETE CASCADE
+        );
+        """,
+        # Entities ingested before provenance existed are known through their MENTIONED_IN edges
+        """
+        INSERT IGNORE INTO node_sources (node_id, document)
+        SELECT source, target FROM edges WHERE type = 'MENTIONED_IN';
+        """,
+    ]),
+    Migration(5, "Structured rows of tables extracted from PDFs", [
+        """
+        CREATE TABLE IF NOT EXISTS pdf_tables (
+            id VARCHAR(40) PRIMARY KEY,
+            document VARCHAR(255),
+            page INT,
+            table_index INT,
+            headers JSON,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_pdf_tables_document (document)
+        );
+        """,
+        # One row per (table row, value column); label/column indexes serve direct lookups
+        """
+        CREATE TABLE IF NOT EXISTS table_cells (
+            table_id VARCHAR(40),
+            row_index INT,
+            col_index INT,
+            row_label VARCHAR(255),
+            column_name VARCHAR(255),
+            value_text VARCHAR(255),
+            value_num DOUBLE,
+            PRIMARY KEY (table_id, row_index, col_index),
+            INDEX idx_table_cells_label (row_label, column_name),
+            INDEX idx_table_cells_column (column_name),
+            FOREIGN KEY (table_id) REFERENCES pdf_tables(id) ON DELETE CASCADE
+        );
+        """,
+    ]),
+    Migration(6, "Stable chunk keys and persisted chunk boundaries", [
+        "ALTER TABLE chunks ADD COLUMN IF NOT EXISTS chunk_key VARCHAR(40);",
+        "ALTER TABLE chunks ADD COLUMN IF NOT EXISTS heading VARCHAR(255);",
+        "ALTER TABLE chunks ADD COLUMN IF NOT EXISTS start_char INT;",
+        "ALTER TABLE chunks ADD COLUMN IF NOT EXISTS end_char INT;",
+        "ALTER TABLE chunks ADD COLUMN IF NOT EXISTS token_count INT;",
+        "ALTER TABLE chunks ADD UNIQUE INDEX IF NOT EXISTS idx_chunks_key (chunk_key);",
+    ]),
+    Migration(7, "Workspace (tenant) id as the leading key column of every table", [
+        # Adding a column with a constant default is a metadata-only change on TiDB
+        "ALTER TABLE chunks ADD COLUMN IF NOT EXISTS workspace_id VARCHAR(64) NOT NULL DEFAULT 'default';",
+        "ALTER TABLE chunks ADD INDEX IF NOT EXISTS idx_chunks_ws_document (workspace_id, document);",
+        "ALTER TABLE chunks ADD INDEX IF NOT EXISTS idx_chunks_ws_source_page (workspace_id, source, page);",
+        "ALTER TABLE chunks ADD UNIQUE INDEX IF NOT EXISTS idx_chunks_ws_key (workspace_id, chunk_key);",
+        "ALTER TABLE chunks DROP INDEX IF EXISTS idx_chunks_key;",
+        "ALTER TABLE chunks DROP INDEX IF EXISTS idx_chunks_document;",
+        "ALTER TABLE chunks DROP INDEX IF EXISTS idx_chunks_source_page;",
+        "ALTER TABLE pdf_tables ADD COLUMN IF NOT EXISTS workspace_id VARCHAR(64) NOT NULL DEFAULT 'default';",
+        "ALTER TABLE pdf_tables ADD INDEX IF NOT EXISTS idx_pdf_tables_ws_document (workspace_id, document);",
+        "ALTER TABLE pdf_tables DROP INDEX IF EXISTS idx_pdf_tables_document;",
+        "ALTER TABLE table_cells ADD COLUMN IF NOT EXISTS workspace_id VARCHAR(64) NOT NULL DEFAULT 'default';",
+        "ALTER TABLE table_cells ADD INDEX IF NOT EXISTS idx_table_cells_ws_label (workspace_id, row_label, column_name);",
+        "ALTER TABLE table_cells ADD INDEX IF NOT EXISTS idx_table_cells_ws_column (workspace_id, column_name);",
+        "ALTER TABLE table_cells DROP INDEX IF EXISTS idx_table_cells_label;",
+        "ALTER TABLE table_cells DROP INDEX IF EXISTS idx_table_cells_column;",
+        # Primary keys can't be changed in place (clustered indexes): rebuild and copy
+        rebuild_with_workspace,
+    ]),
+    Migration(8, "HNSW vector index on communities.embedding (needs TiFlash)", [
+        "ALTER TABLE communities SET TIFLASH REPLICA 1;",
+        "ALTER TABLE communities ADD VECTOR INDEX IF NOT EXISTS idx_communities_embedding ((VEC_COSINE_DISTANCE(embedding))) USING HNSW;",
+    ], optional=True),
+    Migration(9, "Backfill edge provenance and relationship endpoint provenance", [
+        # MENTIONED_IN edges point at their document
+        """
+        INSERT IGNORE INTO edge_sources (workspace_id, source, target, type, document)
+        SELECT workspace_id, source, target, type, target FROM edges WHERE type = 'MENTIONED_IN';
+        """,
+        # Other edges without provenance: the documents that mention both endpoints...
+        """
+        INSERT IGNORE INTO edge_sources (workspace_id, source, target, type, document)
+        SELECT DISTINCT e.workspace_id, e.source, e.target, e.type, s.document
+        FROM edges e
+        JOIN node_sources s ON s.workspace_id = e.workspace_id AND s.node_id = e.source
+        JOIN node_sources t ON t.workspace_id = e.workspace_id AND t.node_id = e.target AND t.document = s.document
+        WHERE e.type <> 'MENTIONED_IN' AND NOT EXISTS (
+            SELECT 1 FROM edge_sources x WHERE x.workspace_id = e.workspace_id AND x.source = e.source
+              AND x.target = e.target AND x.type = e.type
+        );
+        """,
+        # ...or, if none does, every document that mentions either one (kept until all are deleted)
+        """
+        INSERT IGNORE INTO edge_sources (workspace_id, source, target, type, document)
+        SELECT DISTINCT e.workspace_id, e.source, e.target, e.type, s.document
+        FROM edges e
+        JOIN node_sources s ON s.workspace_id = e.workspace_id AND s.node_id IN (e.source, e.target)
+        WHERE e.type <> 'MENTIONED_IN' AND NOT EXISTS (
+            SELECT 1 FROM edge_sources x WHERE x.workspace_id = e.workspace_id AND x.source = e.source
+              AND x.target = e.target AND x.type = e.type
+        );
+        """,
+        # An edge keeps both of its endpoints alive for as long as its document exists
+        """
+        INSERT IGNORE INTO node_sources (workspace_id, node_id, document)
+        SELECT workspace_id, source, document FROM edge_sources WHERE type <> 'MENTIONED_IN'
+        UNION
+        SELECT workspace_id, target, document FROM edge_sources WHERE type <> 'MENTIONED_IN';
+        """,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+INDEX_DDL = re.compile(r"\bADD\s+(VECTOR\s+)?INDEX\b|\bCREATE\s+(UNIQUE\s+)?INDEX\b", re.IGNORECASE)
+DDL_TABLE = re.compile(r"\b(?:ALTER\s+TABLE|ON)\s+`?(\w+)`?", re.IGNORECASE)
+LOCK_NAME = "corporate_analyst_schema_migration"
+LOCK_TIMEOUT = 300
+PROGRESS_INTERVAL = 2.0
+
+def _ensure_version_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(255),
+            status VARCHAR(20),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+def applied_versions(graph):
+    """Returns {version: status} for every recorded migration."""
+    conn = graph.get_connection()
+    try:
+        cursor = conn.cursor()
+        _ensure_version_table(cursor)
+        cursor.execute("SELECT version, status FROM schema_version")
+        return {version: status for version, status in cursor.fetchall()}
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+def current_version(graph):
+    """Highest recorded version, or 0 for a fresh database. One cheap query."""
+    try:
+        rows = graph.query("SELECT MAX(version) AS v FROM schema_version")
+        return rows[0]["v"] or 0
+    except Error:
+        return 0
+
+def _run_index_ddl(graph, cursor, statement, report):
+    """
+    Index builds run in the background on TiDB (online, no table lock) but the statement
+    blocks until done, so progress is polled from ADMIN SHOW DDL JOBS on a second connection.
+    """
+    match = DDL_TABLE.search(statement)
+    table = match.group(1) if match else None
+    errors = []
+
+    def run():
+        try:
+            cursor.execute(statement)
+        except Error as e:
+            errors.append(e)
+
+    worker = threading.Thread(target=run)
+    worker.start()
+    monitor = graph.get_connection()
+    try:
+        poll = monitor.cursor(dictionary=True)
+        while worker.is_alive():
+            worker.join(PROGRESS_INTERVAL)
+            if not worker.is_alive() or not table:
+                break
+            try:
+                poll.execute("ADMIN SHOW DDL JOBS 20")
+                for job in poll.fetchall():
+                    if job.get("TABLE_NAME") == table and job.get("STATE") in ("running", "queueing"):
+                        report(f"  building index on {table}: {job.get('ROW_COUNT', 0)} rows "
+                               f"({job.get('SCHEMA_STATE')}, {job.get('STATE')})")
+            except Error:
+                # Progress is best-effort (e.g. missing privileges)
+                table = None
+        poll.close()
+    finally:
+        monitor.close()
+    worker.join()
+    if errors:
+        raise errors[0]
+
+def migrate(graph, target=None, retry_skipped=False, status_callback=None):
+    """
+    Applies pending migrations in order, each exactly once. A named lock serializes
+    concurrent processes; versions are re-read after acquiring it.
+    """
+    def report(msg):
+        logger.info(msg)
+        if status_callback: status_callback(msg)
+
+    target = target or LATEST_VERSION
+    conn = graph.get_connection()
+    try:
+        cursor = conn.cursor()
+        _ensure_version_table(cursor)
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT))
+        if not cursor.fetchone()[0]:
+            raise RuntimeError("Timed out waiting for another process to finish migrating")
+        try:
+            cursor.execute("SELECT version, status FROM schema_version")
+            applied = {version: status for version, status in cursor.fetchall()}
+
+            for migration in MIGRATIONS:
+                if migration.version > target:
+                    break
+                status = applied.get(migration.version)
+                if status == "applied" or (status == "skipped" and not retry_skipped):
+                    continue
+
+                report(f"Applying migration {migration.version}: {migration.description}")
+                start = time.time()
+                try:
+                    for statement in migration.statements:
+                        if callable(statement):
+                            statement(cursor, report)
+                        elif INDEX_DDL.search(statement):
+                            _run_index_ddl(graph, cursor, statement, report)
+                        else:
+                            cursor.execute(statement)
+                            if cursor.with_rows:
+                                # e.g. the summary row of a BATCH (non-transactional) DML
+                                cursor.fetchall()
+                    new_status = "applied"
+                except Error as e:
+                    if not migration.optional:
+                        report(f"Migration {migration.version} failed: {e}")
+                        raise
+                    new_status = "skipped"
+                    report(f"Optional migration {migration.version} skipped: {e}")
+
+                cursor.execute(
+                    "REPLACE INTO schema_version (version, description, status) VALUES (%s, %s, %s)",
+                    (migration.version, migration.description, new_status)
+                )
+                conn.commit()
+                report(f"Migration {migration.version} {new_status} in {time.time() - start:.1f}s")
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            cursor.fetchall()
+        return True
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+def print_status(graph):
+    applied = applied_versions(graph)
+    for migration in MIGRATIONS:
+        status = applied.get(migration.version, "pending")
+        print(f"{migration.version:>3}  {status:<8}  {migration.description}")
+
+if __name__ == "__main__":
+    # Usage: python src/migrations.py [status | migrate [--retry-skipped] [--to N]]
+    from tidb_store import TiDBGraph
+    graph = TiDBGraph(auto_migrate=False)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "migrate":
+        target = int(sys.argv[sys.argv.index("--to") + 1]) if "--to" in sys.argv else None
+        migrate(graph, target=target, retry_skipped="--retry-skipped" in sys.argv, status_callback=print)
+    print_status(graph)
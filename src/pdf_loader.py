@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+from config import PDF_WORKERS, PDF_PAGES_PER_TASK, PAGE_CACHE_DIR, TABLE_EXTRACTION
+
+def file_hash(file_path: str):
+    """sha256 of the file contents; the cache key survives renames and re-uploads."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _page_path(cache_key, page, ext="txt"):
+    return os.path.join(PAGE_CACHE_DIR, cache_key, f"{page:05d}.{ext}")
+
+def _write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+def _read_cached(cache_key, page, with_tables):
+    """Returns (text, tables) or None. tables is None unless extracted with table detection."""
+    try:
+        with open(_page_path(cache_key, page), "r", encoding="utf-8") as f:
+            text = f.read()
+        tables = None
+        if with_tables:
+            with open(_page_path(cache_key, page, "tables.json"), "r", encoding="utf-8") as f:
+                tables = json.load(f)
+        return text, tables
+    except FileNotFoundError:
+        return None
+
+def _write_cached(cache_key, page, text, tables):
+    if tables is not None:
+        _write_file(_page_path(cache_key, page, "tables.json"), json.dumps(tables))
+    # The text file is written last: its presence marks the page as complete
+    _write_file(_page_path(cache_key, page), text)
+
+def _is_data_table(rows):
+    return len(rows) >= 2 and max(len(row) for row in rows) >= 2
+
+def _extract_pages_with_tables(file_path, pages):
+    """Worker: pdfplumber table detection; table regions are cut out of the page text."""
+    import pdfplumber
+    results = []
+    with pdfplumber.open(file_path) as pdf:
+        for page_number in pages:
+            page = pdf.pages[page_number]
+            tables = []
+            text_page = page
+            for table in page.find_tables():
+                rows = table.extract()
+                if _is_data_table(rows):
+                    tables.append(rows)
+                    text_page = text_page.outside_bbox(table.bbox)
+            results.append((page_number, text_page.extract_text() or "", tables))
+    return results
+
+def _extract_pages(file_path, pages, with_tables=False):
+    """Worker: extracts the given page numbers (same text as PyPDFLoader, which also uses pypdf)."""
+    if with_tables:
+        return _extract_pages_with_tables(file_path, pages)
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    return [(page, reader.pages[page].extract_text() or "", None) for page in pages]
+
+def _tables_supported():
+    if not TABLE_EXTRACTION:
+        return False
+    try:
+        import pdfplumber  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def page_text_mode():
+    """
+    "tables" when table regions are cut out of the page text (TABLE_EXTRACTION on and pdfplumber
+    installed), else "plain". Page text, and everything derived from it, differs between the two.
+    """
+    return "tables" if _tables_supported() else "plain"
+
+def page_count(file_path: str):
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+def _ranges(pages, size):
+    for i in range(0, len(pages), size):
+        yield pages[i:i + size]
+
+def iter_pages(file_path: str, workers: int = None, pages_per_task: int = None):
+    """
+    Yields (page_number, text, tables) in page order. Cached pages are read from disk; the
+    missing ones are split into ranges and parsed by a process pool, and each range is yielded
+    as soon as it and all earlier ranges are done. tables (raw cell rows per detected table)
+    is None when table extraction is off or pdfplumber is not installed.
+    """
+    workers = workers if workers is not None else (PDF_WORKERS or os.cpu_count() or 1)
+    pages_per_task = pages_per_task or PDF_PAGES_PER_TASK
+    with_tables = page_text_mode() == "tables"
+    # Text differs between extraction modes, so each mode has its own cache
+    cache_key = file_hash(file_path) + ("-tables" if with_tables else "")
+    total = page_count(file_path)
+
+    cached = {}
+    missing = []
+    for page in range(total):
+        entry = _read_cached(cache_key, page, with_tables)
+        if entry is None:
+            missing.append(page)
+        else:
+            cached[page] = entry
+
+    if not missing:
+        for page in range(total):
+            yield (page,) + cached[page]
+        return
+
+    tasks = list(_ranges(missing, pages_per_task))
+    if workers <= 1 or len(tasks) == 1:
+        results = (_extract_pages(file_path, task, with_tables) for task in tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(tasks)))
+        futures = [executor.submit(_extract_pages, file_path, task, with_tables) for task in tasks]
+        results = (future.result() for future in futures)
+
+    def contiguous():
+        nonlocal next_page
+        while next_page < total and next_page in cached:
+            yield (next_page,) + cached.pop(next_page)
+            next_page += 1
+
+    next_page = 0
+    try:
+        yield from contiguous()
+        for extracted in results:
+            for page, text, tables in extracted:
+                _write_cached(cache_key, page, text, tables)
+                cached[page] = (text, tables)
+            # Emit everything that is now contiguous from the start
+            yield from contiguous()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def load_tables(file_path: str, workers: int = None):
+    """Yields (page_number, [table rows]) for pages with detected tables (served from the page cache)."""
+    for page, _, tables in iter_pages(file_path, workers=workers):
+        if tables:
+            yield page, tables
+
+if __name__ == "__main__":
+    # Usage: python src/pdf_loader.py <file.pdf> [--workers N]  (parses and warms the page cache)
+    import time
+    if len(sys.argv) < 2:
+        print("Usage: python src/pdf_loader.py <file.pdf> [--workers N]")
+        sys.exit(1)
+    n_workers = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else None
+    start = time.time()
+    n_pages = sum(1 for _ in iter_pages(sys.argv[1], workers=n_workers))
+    print(f"{n_pages} pages in {time.time() - start:.2f}s")
@@ -0,0 +1,186 @@
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from mysql.connector import ProgrammingError
+
+from config import PLAN_CACHE_SIZE
+from sql_guard import UnsafeQueryError
+
+# Entities in a graph sub-query: quoted values, multi-word capitalized names, tickers and numbers.
+ENTITY_RE = re.compile(
+    r"'([^']+)'|\"([^\"]+)\"|"
+    r"\b([A-Z][\w&.\-]*(?:\s+(?:of|and|&)?\s*[A-Z][\w&.\-]*)*)\b|"
+    r"\b(\d[\d,.\-]*)\b"
+)
+# Question words that are capitalized only because they start the sentence
+LEADING_WORDS = {"Who", "What", "Which", "Where", "When", "How", "Why", "List", "Find", "Show", "Does", "Is", "Are", "Give"}
+SQL_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+
+def extract_entities(question: str):
+    entities = []
+    for match in ENTITY_RE.finditer(question):
+        value = next(g for g in match.groups() if g)
+        words = value.split()
+        if words and words[0] in LEADING_WORDS:
+            value = " ".join(words[1:])
+        if value and value not in entities:
+            entities.append(value)
+    return entities
+
+def normalize_question(question: str):
+    """
+    Returns (template_key, entities): entity values replaced by <e0>, <e1>... and the rest
+    lowercased, so "Who owns NovaSystems?" and "Who owns CyberDyne?" share a key.
+    """
+    entities = extract_entities(question)
+    template = question
+    for i, value in enumerate(entities):
+        template = template.replace(value, f"<e{i}>")
+    template = re.sub(r"\s+", " ", template.strip().lower()).rstrip("?.! ")
+    return template, entities
+
+def _escape_literal(value: str):
+    return value.replace("\\", "\\\\").replace("'", "''")
+
+def _exact_key(question: str):
+    return "=" + re.sub(r"\s+", " ", question.strip().lower())
+
+def is_deterministic_failure(error):
+    """
+    Guard rejections and SQL syntax/semantic errors fail the same way every time.
+    Connection drops, lock waits and execution timeouts (OperationalError, InterfaceError,
+    other DatabaseErrors) say nothing about the SQL itself.
+    """
+    return isinstance(error, (UnsafeQueryError, ProgrammingError))
+
+def _sql_key(sql: str):
+    return hashlib.sha1(re.sub(r"\s+", " ", sql.strip().rstrip(";")).lower().encode("utf-8")).hexdigest()
+
+class QueryPlanCache:
+    """
+    Maps normalized graph sub-queries to SQL that already executed successfully.
+
+    - Positive entries store the SQL with entity values replaced by @@eN@@ placeholders inside
+      string literals; a hit substitutes the new question's entities back in.
+    - Each entry keeps success/failure counts; an entry whose last run failed is not served
+      until the SQL is regenerated and succeeds again.
+    - Failed SQL is negatively cached (by normalized SQL hash) together with the error,
+      so the same broken query is never executed twice. Only deterministic failures are
+      cached; transient database errors are counted and otherwise ignored.
+    """
+
+    def __init__(self, max_entries=PLAN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._plans = OrderedDict()
+        self._failed_sql = OrderedDict()
+        self._failures_by_template = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "negative_hits": 0, "transient_failures": 0}
+
+    def _templatize_sql(self, sql: str, entities):
+        """Replaces entity values inside string literals with placeholders. None if any entity is missing."""
+        if not entities:
+            return sql
+        found = set()
+
+        def replace(match):
+            literal = match.group(0)
+            for i, value in enumerate(entities):
+                escaped = _escape_literal(value)
+                if escaped in literal:
+                    literal = literal.replace(escaped, f"@@e{i}@@")
+                    found.add(i)
+            return literal
+
+        templated = SQL_LITERAL.sub(replace, sql)
+        return templated if len(found) == len(entities) else None
+
+    def lookup(self, question: str):
+        """Returns executable SQL for the question, or None."""
+        template, entities = normalize_question(question)
+        with self._lock:
+            entry = self._plans.get(template)
+            if entry is None or len(entry["entities"]) != len(entities):
+                template, entities = _exact_key(question), []
+                entry = self._plans.get(template)
+            if entry is None or not entry["last_ok"]:
+                self.stats["misses"] += 1
+                return None
+            self._plans.move_to_end(template)
+            self.stats["hits"] += 1
+            sql = entry["sql"]
+        for i, value in enumerate(entities):
+            sql = sql.replace(f"@@e{i}@@", _escape_literal(value))
+        return sql
+
+    def record_success(self, question: str, sql: str):
+        template, entities = normalize_question(question)
+        templated = self._templatize_sql(sql, entities)
+        if templated is None:
+            # The SQL doesn't use the entities verbatim: only reusable for this exact question
+            template, entities, templated = _exact_key(question), [], sql
+        with self._lock:
+            entry = self._plans.get(template)
+            if entry and entry["sql"] == templated:
+                entry["successes"] += 1
+            else:
+                failures = entry["failures"] if entry else 0
+                self._plans[template] = {"sql": templated, "entities": entities, "successes": 1, "failures": failures}
+                self.stats["stored"] += 1
+            self._plans[template]["last_ok"] = True
+            self._plans[template]["last_used"] = time.time()
+            self._plans.move_to_end(template)
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+
+    def record_failure(self, question: str, sql: str, error):
+        if not is_deterministic_failure(error):
+            with self._lock:
+                self.stats["transient_failures"] += 1
+            return
+        template, _ = normalize_question(question)
+        with self._lock:
+            for key in (template, _exact_key(question)):
+                entry = self._plans.get(key)
+                if entry:
+                    entry["failures"] += 1
+                    entry["last_ok"] = False
+            self._failed_sql[_sql_key(sql)] = str(error)
+            while len(self._failed_sql) > self.max_entries:
+                self._failed_sql.popitem(last=False)
+            failures = self._failures_by_template.pop(template, [])
+            failures.append((sql, str(error)))
+            self._failures_by_template[template] = failures[-3:]
+            while len(self._failures_by_template) > self.max_entries:
+                del self._failures_by_template[next(iter(self._failures_by_template))]
+
+    def known_failure(self, sql: str):
+        """Returns the cached error if this exact SQL already failed, else None."""
+        with self._lock:
+            error = self._failed_sql.get(_sql_key(sql))
+            if error is not None:
+                self.stats["negative_hits"] += 1
+            return error
+
+    def summary(self):
+        """Counters plus per-plan success/failure statistics."""
+        with self._lock:
+            plans = [
+                {"template": key, "successes": e["successes"], "failures": e["failures"], "last_ok": e["last_ok"]}
+                for key, e in self._plans.items()
+            ]
+        return {**self.stats, "plans": plans, "failed_sql": len(self._failed_sql)}
+
+    def failures_for(self, question: str):
+        """Recent (sql, error) failures for structurally identical questions, for prompt feedback."""
+        template, _ = normalize_question(question)
+        with self._lock:
+            return list(self._failures_by_template.get(template, []))
+
+_plan_cache = QueryPlanCache()
+
+def get_plan_cache():
+    return _plan_cache
@@ -0,0 +1,70 @@
+import numpy as np
+
+# Storage formats for embeddings. int8 and float16 are searched approximately and the best
+# candidates are rescored against the float32 vectors.
+DTYPES = ("float32", "float16", "int8")
+
+def parse_vector(text):
+    """TiDB VECTOR text ("[0.1,0.2,...]") -> float32 array, None for NULL."""
+    if text is None:
+        return None
+    return np.array(text.strip("[]").split(","), dtype="float32")
+
+def normalize(vectors):
+    """Unit-length rows, so cosine similarity is a dot product."""
+    vectors = np.asarray(vectors, dtype="float32")
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def quantize(vectors, dtype):
+    """
+    Returns (codes, scales). int8 uses symmetric per-vector scaling (x ~= codes * scale);
+    scales is None for the float formats.
+    """
+    vectors = np.asarray(vectors, dtype="float32")
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype("float16"), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales = np.maximum(scales, 1e-12).astype("float32")
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype("int8")
+        return codes, scales
+    raise ValueError(f"Unknown embedding dtype: {dtype} (expected one of {DTYPES})")
+
+def dequantize(codes, scales=None):
+    if scales is not None:
+        return codes.astype("float32") * scales[:, None]
+    return np.asarray(codes, dtype="float32")
+
+def approximate_scores(codes, scales, query):
+    """Dot products of quantized rows with a float32 query."""
+    scores = codes.astype("float32") @ query
+    if scales is not None:
+        scores *= scales
+    return scores
+
+def bytes_per_vector(dtype, dim):
+    """Stored bytes for one embedding (int8 carries its float32 scale)."""
+    if dtype == "float32":
+        return 4 * dim
+    if dtype == "float16":
+        return 2 * dim
+    if dtype == "int8":
+        return dim + 4
+    raise ValueError(f"Unknown embedding dtype: {dtype} (expected one of {DTYPES})")
+
+def footprint(n_vectors, dim, dtype, rescore=True):
+    """
+    Bytes that must be scanned (hot, ideally in RAM) and stored in total for n vectors.
+    Rescoring keeps a float32 copy on disk; only the few candidate rows are read from it.
+    """
+    scanned = n_vectors * bytes_per_vector(dtype, dim)
+    stored = scanned + (n_vectors * 4 * dim if rescore and dtype != "float32" else 0)
+    return {"dtype": dtype, "scanned_bytes": scanned, "stored_bytes": stored}
+
+def recall_at_k(exact_ids, approx_ids):
+    """Share of the exact top-k found by the approximate search."""
+    exact = set(exact_ids)
+    return len(exact & set(approx_ids)) / len(exact) if exact else 1.0
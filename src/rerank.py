@@ -0,0 +1,122 @@
+import time
+import threading
+from collections import OrderedDict
+
+from config import RERANK_MODEL, RERANK_BUDGET_MS, RERANK_CACHE_SIZE
+
+class Reranker:
+    """
+    Cross-encoder reranking of retrieved chunks on CPU.
+
+    - All uncached (query, chunk) pairs are scored in a single batched forward pass.
+    - Scores are cached per (query, chunk id) in an LRU of RERANK_CACHE_SIZE entries.
+    - The cost per pair is tracked as a moving average; if scoring all uncached pairs
+      is expected to exceed the latency budget, only the longest prefix of the retrieved
+      order that fits the budget is reranked and the rest keeps its order. Every call
+      still scores some pairs, so the estimate keeps tracking the real cost.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL, budget_ms=RERANK_BUDGET_MS, cache_size=RERANK_CACHE_SIZE):
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self._model = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._ms_per_pair = None
+        self.stats = {"reranked": 0, "partial": 0, "cache_hits": 0, "scored_pairs": 0}
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                # Imported lazily so the app starts without loading torch when reranking is off
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name, device="cpu")
+            return self._model
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def _budget_pairs(self):
+        """Uncached pairs that fit the latency budget (unbounded until the cost is measured)."""
+        with self._lock:
+            if self._ms_per_pair is None:
+                return None
+            return max(1, int(self.budget_ms / max(self._ms_per_pair, 1e-6)))
+
+    def _cache_get(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        return None
+
+    def _cache_put(self, key, score):
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank(self, query: str, rows: list, top_k: int):
+        """Returns the top_k rows by cross-encoder score (rows need 'id' and 'content')."""
+        if len(rows) <= 1:
+            return rows[:top_k]
+
+        query_key = query.strip()
+        scores = {}
+        missing = []
+        for row in rows:
+            score = self._cache_get((query_key, row["id"]))
+            if score is None:
+                missing.append(row)
+            else:
+                scores[row["id"]] = score
+        self._count("cache_hits", len(rows) - len(missing))
+
+        prefix = len(rows)
+        budget = self._budget_pairs()
+        if budget is not None and len(missing) > budget:
+            # Rerank the longest prefix of the retrieved order whose uncached pairs fit the budget
+            cutoff = missing[budget]["id"]
+            prefix = next(i for i, row in enumerate(rows) if row["id"] == cutoff)
+            missing = missing[:budget]
+            print(f"--- [RERANK] Over the {self.budget_ms:.0f}ms budget: reranking the first {prefix} of {len(rows)} rows ---")
+            self._count("partial")
+
+        if missing:
+            model = self._get_model()
+            start = time.perf_counter()
+            predicted = model.predict(
+                [(query_key, row["content"]) for row in missing],
+                batch_size=len(missing)
+            )
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            per_pair = elapsed_ms / len(missing)
+            with self._lock:
+                self._ms_per_pair = per_pair if self._ms_per_pair is None else 0.8 * self._ms_per_pair + 0.2 * per_pair
+                self.stats["scored_pairs"] += len(missing)
+
+            for row, score in zip(missing, predicted):
+                scores[row["id"]] = float(score)
+                self._cache_put((query_key, row["id"]), float(score))
+
+        self._count("reranked")
+        head = sorted(rows[:prefix], key=lambda r: scores[r["id"]], reverse=True)
+        ranked = (head + rows[prefix:])[:top_k]
+        for row in ranked:
+            if row["id"] in scores:
+                row["rerank_score"] = scores[row["id"]]
+        return ranked
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+def get_reranker():
+    """Process-wide reranker so the model and score cache are shared across requests."""
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = Reranker()
+    return _reranker
@@ -4,9 +4,10 @@ import sys
 # Add src to path if running from root
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from src.config import UPLOAD_DIR
+from src.config import UPLOAD_DIR, WORKSPACES_DIR
 from src.tidb_store import TiDBGraph
 import shutil
+import glob
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,10 +25,13 @@ def reset_db():
             print("Database cleared successfully.")
             
             # 2. Clear Local Files
-            if os.path.exists(UPLOAD_DIR):
-                for filename in os.listdir(UPLOAD_DIR):
+            upload_dirs = [UPLOAD_DIR] + glob.glob(os.path.join(WORKSPACES_DIR, "*", os.path.basename(UPLOAD_DIR)))
+            for upload_dir in upload_dirs:
+                if not os.path.exists(upload_dir):
+                    continue
+                for filename in os.listdir(upload_dir):
                     if filename.endswith(".pdf"):
-                        file_path = os.path.join(UPLOAD_DIR, filename)
+                        file_path = os.path.join(upload_dir, filename)
                         try:
                             os.remove(file_path)
                             print(f"Deleted {filename}")
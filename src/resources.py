@@ -0,0 +1,70 @@
+import threading
+
+from config import LLM_MODEL
+
+# Process-wide, lazily created clients (the same idea as Streamlit's st.cache_resource).
+# Importing a module no longer connects to TiDB or builds LLM clients; the first caller does,
+# and every later caller (including Streamlit reruns) reuses the instance.
+_instances = {}
+_lock = threading.Lock()
+
+def _get_or_create(name, factory):
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = factory()
+                _instances[name] = instance
+    return instance
+
+def get_graph(workspace=None):
+    """Shared TiDBGraph of a workspace (DEFAULT_WORKSPACE if None). Schema initialization runs once, on first use."""
+    from workspaces import normalize_workspace
+    workspace = normalize_workspace(workspace)
+    def factory():
+        from tidb_store import TiDBGraph
+        return TiDBGraph(workspace=workspace)
+    return _get_or_create(f"graph:{workspace}", factory)
+
+def get_llm():
+    def factory():
+        from langchain_groq import ChatGroq
+        return ChatGroq(model=LLM_MODEL, temperature=0)
+    return _get_or_create("llm", factory)
+
+def get_json_llm():
+    def factory():
+        from langchain_groq import ChatGroq
+        return ChatGroq(model=LLM_MODEL, temperature=0).bind(response_format={"type": "json_object"})
+    return _get_or_create("json_llm", factory)
+
+def get_embeddings():
+    """Shared embedding model (EMBEDDING_BACKEND); loading it is the most expensive step of a cold start."""
+    def factory():
+        from embedding_providers import create_embeddings
+        return create_embeddings()
+    return _get_or_create("embeddings", factory)
+
+def get_tokenizer():
+    """Tokenizer of the embedding model; chunk sizes are measured in its tokens."""
+    def factory():
+        from transformers import AutoTokenizer
+        from config import EMBEDDING_MODEL
+        return AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+    return _get_or_create("tokenizer", factory)
+
+def get_local_index(workspace=None):
+    """Shared memory-mapped vector index of a workspace (VECTOR_BACKEND=local)."""
+    from workspaces import normalize_workspace, workspace_dir
+    workspace = normalize_workspace(workspace)
+    def factory():
+        from config import LOCAL_INDEX_DIR
+        from local_index import LocalVectorIndex
+        return LocalVectorIndex(root=workspace_dir(LOCAL_INDEX_DIR, workspace))
+    return _get_or_create(f"local_index:{workspace}", factory)
+
+def reset_resources():
+    """Drops all cached clients (e.g. after the database was reset)."""
+    with _lock:
+        _instances.clear()
@@ -0,0 +1,24 @@
+from config import RETRIEVAL_TOP_K, RETRIEVAL_MAX_TOP_K, RETRIEVAL_POOR_DISTANCE
+
+# Evidence confidence looks at this many of the closest chunks
+CONFIDENCE_TOP_N = 3
+
+def evidence_confidence(distances, top_n=CONFIDENCE_TOP_N):
+    """
+    1 - mean cosine distance of the closest top_n chunks found so far, in [0, 1].
+    Fewer than top_n chunks count the missing ones as unrelated (distance 1).
+    """
+    best = sorted(distances)[:top_n]
+    if not best:
+        return 0.0
+    best += [1.0] * (top_n - len(best))
+    return max(0.0, 1.0 - sum(best) / len(best))
+
+def needs_widening(distances, top_k):
+    """The best hit (of the given cosine distances) is still far from the query and a wider search is allowed."""
+    if top_k >= RETRIEVAL_MAX_TOP_K or not distances:
+        return False
+    return min(distances) > RETRIEVAL_POOR_DISTANCE
+
+def wider_top_k(top_k=None):
+    return min((top_k or RETRIEVAL_TOP_K) * 2, RETRIEVAL_MAX_TOP_K)
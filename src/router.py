@@ -0,0 +1,152 @@
+import os
+import re
+import sys
+import json
+import threading
+from datetime import datetime
+
+from config import ROUTER_DIR, ROUTER_MIN_SIMILARITY, ROUTER_MIN_MARGIN, ROUTER_MIN_EXAMPLES
+from resources import get_embeddings
+
+DECISIONS_PATH = os.path.join(ROUTER_DIR, "decisions.jsonl")
+MODEL_PATH = os.path.join(ROUTER_DIR, "centroids.json")
+
+# Only the first research step is routed locally; later steps need the supervisor's judgement.
+ROUTABLE_STEPS = ("VectorSearch", "GraphSearch", "GraphRAGSearch", "GlobalSearch")
+
+# Keyword rules. A rule only fires when exactly one step matches.
+RULES = {
+    "GlobalSearch": re.compile(
+        r"\b(main|key|common|recurring|overall)\s+(themes?|topics|trends)\b|\bacross\s+(all|the)\s+(filings|documents|reports)\b"
+        r"|\bsummari[sz]e\s+(everything|all|the\s+corpus)\b",
+        re.IGNORECASE
+    ),
+    "GraphSearch": re.compile(
+        r"\b(subsidiar(y|ies)|parent\s+company|reports?\s+to|org(anization(al)?)?\s+chart|hierarchy"
+        r"|who\s+(owns|runs|leads|works\s+for)|acquired\s+by|owned\s+by)\b"
+        # Figures for a period are looked up in the extracted table rows
+        r"|^(?=.*\b(what|how\s+much)\s+(was|were|is|are)\b)"
+        r"(?=.*\b(revenue|sales|income|margin|eps|earnings|expenses?|cash)\b)"
+        r"(?=.*\b(q[1-4]|fy\s?\d{2,4}|(19|20)\d\d)\b)",
+        re.IGNORECASE
+    ),
+    "VectorSearch": re.compile(
+        r"\b(risks?|strategy|strategic|outlook|guidance|describe|explain|summary\s+of)\b",
+        re.IGNORECASE
+    ),
+}
+
+def rule_route(question: str):
+    matched = [step for step, pattern in RULES.items() if pattern.search(question)]
+    return matched[0] if len(matched) == 1 else None
+
+def log_decision(question: str, step: str):
+    """Appends a supervisor decision; these are the classifier's training data."""
+    if step not in ROUTABLE_STEPS:
+        return
+    try:
+        os.makedirs(ROUTER_DIR, exist_ok=True)
+        with open(DECISIONS_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"question": question, "next_step": step, "at": datetime.utcnow().isoformat()}) + "\n")
+    except OSError as e:
+        print(f"Could not log routing decision: {e}")
+
+class EmbeddingRouter:
+    """
+    Nearest-centroid classifier over normalized question embeddings.
+    A prediction is only trusted when the best centroid is similar enough and clearly
+    ahead of the runner-up; otherwise the LLM supervisor decides.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._centroids = None
+        self._mtime = None
+
+    def _embed(self, texts):
+        import numpy as np
+        vectors = np.asarray(get_embeddings().embed_documents(texts), dtype="float32")
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _load(self):
+        """(Re)loads centroids when the model file changes on disk."""
+        import numpy as np
+        if not os.path.exists(MODEL_PATH):
+            self._centroids = None
+            return
+        mtime = os.path.getmtime(MODEL_PATH)
+        if mtime != self._mtime:
+            with open(MODEL_PATH, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._centroids = (data["labels"], np.asarray(data["centroids"], dtype="float32"))
+            self._mtime = mtime
+
+    def predict(self, question: str):
+        """Returns (step, confidence) or (None, confidence) when not confident."""
+        with self._lock:
+            self._load()
+            if self._centroids is None:
+                return None, 0.0
+            labels, centroids = self._centroids
+            query = self._embed([question])[0]
+        sims = centroids @ query
+        order = sims.argsort()[::-1]
+        best = float(sims[order[0]])
+        margin = best - float(sims[order[1]]) if len(order) > 1 else best
+        if best >= ROUTER_MIN_SIMILARITY and margin >= ROUTER_MIN_MARGIN:
+            return labels[order[0]], best
+        return None, best
+
+    def train(self):
+        """Builds one centroid per step from the logged supervisor decisions."""
+        import numpy as np
+        if not os.path.exists(DECISIONS_PATH):
+            print("No logged decisions yet.")
+            return
+        by_step = {}
+        with open(DECISIONS_PATH, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    by_step.setdefault(row["next_step"], set()).add(row["question"])
+
+        labels, centroids = [], []
+        for step, questions in sorted(by_step.items()):
+            if len(questions) < ROUTER_MIN_EXAMPLES:
+                print(f"Skipping {step}: {len(questions)} examples (< {ROUTER_MIN_EXAMPLES}).")
+                continue
+            centroid = self._embed(sorted(questions)).mean(axis=0)
+            centroids.append((centroid / np.linalg.norm(centroid)).tolist())
+            labels.append(step)
+            print(f"{step}: {len(questions)} examples")
+
+        if len(labels) < 2:
+            print("Need at least two steps with enough examples to train.")
+            return
+        os.makedirs(ROUTER_DIR, exist_ok=True)
+        with open(MODEL_PATH, "w", encoding="utf-8") as f:
+            json.dump({"labels": labels, "centroids": centroids, "trained_at": datetime.utcnow().isoformat()}, f)
+        print(f"Router model saved to {MODEL_PATH}")
+
+_router = EmbeddingRouter()
+
+def fast_route(question: str):
+    """
+    Fast path in front of the supervisor. Returns (next_step, source) where source is
+    "rules" or "classifier", or (None, None) to fall back to the LLM.
+    """
+    step = rule_route(question)
+    if step:
+        return step, "rules"
+    try:
+        step, _ = _router.predict(question)
+    except Exception as e:
+        print(f"Router classifier unavailable: {e}")
+        step = None
+    return (step, "classifier") if step else (None, None)
+
+if __name__ == "__main__":
+    if "--train" in sys.argv:
+        _router.train()
+    else:
+        print("Usage: python src/router.py --train")
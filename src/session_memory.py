@@ -0,0 +1,155 @@
+import re
+import threading
+from dataclasses import replace
+from collections import OrderedDict, deque
+
+from config import (
+    MEMORY_TOKEN_BUDGET, MEMORY_RECALL_SIMILARITY, MEMORY_ANSWER_SIMILARITY, MEMORY_MAX_RECALL, MEMORY_CONDENSE_TURNS
+)
+from resources import get_embeddings
+from evidence import CHUNK, ERROR, render
+
+def _normalize(vectors):
+    import numpy as np
+    vectors = np.asarray(vectors, dtype="float32")
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+def _tokens(text):
+    return max(1, round(len(text.split()) * 4 / 3))
+
+# Questions that lean on an earlier turn: a leading connective or personal pronoun ("And the
+# margin?", "Their CEO?"), or a pronoun / demonstrative in a question that names nothing itself
+LEADING_REFERENCE = re.compile(
+    r"^\s*(and|also|what about|how about|then|so|but|it|its|they|them|their|he|she|his|her|these|those)\b",
+    re.IGNORECASE
+)
+REFERENCE = re.compile(r"\b(it|its|they|them|their|theirs|this|that|these|those|he|she|his|her|the same)\b", re.IGNORECASE)
+# A capitalized word or acronym after the first word ("Acme", "NVIDIA", "Q3"), "I" excepted
+NAMED = re.compile(r"\b(?!I\b)[A-Z][\w&.-]*")
+
+def is_follow_up(question):
+    """Whether the question needs an earlier turn to stand alone."""
+    if LEADING_REFERENCE.search(question):
+        return True
+    rest = question.strip().partition(" ")[2]
+    if NAMED.search(rest):
+        return False
+    return bool(REFERENCE.search(question)) or len(question.split()) < 4
+
+def condense_question(question, previous):
+    """
+    Standalone form of a follow-up question for recall and retrieval: the earlier questions
+    (oldest first) are appended when the question refers back to them. The question itself
+    is left as asked for routing, answering and review.
+    """
+    if not previous or not is_follow_up(question):
+        return question
+    return f"{question} (earlier in this conversation: {'; '.join(previous)})"
+
+class SessionMemory:
+    """
+    Evidence gathered by earlier turns of one chat session (chunks, graph and SQL results),
+    kept with its embedding so a follow-up question can reuse what is relevant instead of
+    retrieving it again. Bounded by a token budget; the least recently used evidence goes first.
+    Memory is bound to a scope (workspace + document filter) and cleared when the scope changes.
+    Recalled evidence seeds a turn; it never replaces retrieval (see graph_agent.supervisor_node).
+    """
+
+    def __init__(self, budget_tokens=MEMORY_TOKEN_BUDGET):
+        self.budget_tokens = budget_tokens
+        self.entries = OrderedDict()  # evidence key -> {"evidence", "embedding", "tokens", "turn"}
+        self.tokens = 0
+        self.turn = 0
+        self.scope = None
+        self.questions = deque(maxlen=MEMORY_CONDENSE_TURNS)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def bind(self, workspace, sources):
+        scope = (workspace, tuple(sorted(sources or [])))
+        if scope != self.scope:
+            self.clear()
+            self.scope = scope
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.tokens = 0
+            self.questions.clear()
+
+    def recall(self, question, limit=MEMORY_MAX_RECALL):
+        """
+        Remembered evidence records relevant to the question, most similar first.
+        Returns (records, best similarity). Recalled chunks are re-scored against this question
+        (cosine distance of their remembered embedding), since their distance was for an earlier one.
+        """
+        with self._lock:
+            if not self.entries:
+                return [], 0.0
+            keys = list(self.entries)
+            matrix = _normalize([self.entries[k]["embedding"] for k in keys])
+        query = _normalize(get_embeddings().embed_query(question))
+        sims = matrix @ query
+        order = [i for i in sims.argsort()[::-1][:limit] if sims[i] >= MEMORY_RECALL_SIMILARITY]
+        documents = []
+        with self._lock:
+            for i in order:
+                entry = self.entries.get(keys[i])
+                if entry is not None:
+                    self.entries.move_to_end(keys[i])
+                    evidence = entry["evidence"]
+                    if evidence.kind == CHUNK:
+                        evidence = replace(evidence, score=1.0 - float(sims[i]))
+                    documents.append(evidence)
+        return documents, float(sims[order[0]]) if order else 0.0
+
+    def remember(self, documents):
+        """Stores the evidence records of a finished turn; only records not seen before are embedded."""
+        self.turn += 1
+        with self._lock:
+            new = {}
+            for evidence in documents:
+                if evidence.key in self.entries:
+                    self.entries.move_to_end(evidence.key)
+                elif evidence.kind != ERROR:
+                    new.setdefault(evidence.key, evidence)
+        if not new:
+            return 0
+        texts = [render(e) for e in new.values()]
+        vectors = get_embeddings().embed_documents(texts)
+        with self._lock:
+            for (key, evidence), text, vector in zip(new.items(), texts, vectors):
+                tokens = _tokens(text)
+                if tokens > self.budget_tokens:
+                    continue
+                self.entries[key] = {"evidence": evidence, "embedding": vector, "tokens": tokens, "turn": self.turn}
+                self.tokens += tokens
+            self._evict()
+        return len(new)
+
+    def _evict(self):
+        while self.tokens > self.budget_tokens and self.entries:
+            _, entry = self.entries.popitem(last=False)
+            self.tokens -= entry["tokens"]
+
+    def start_turn(self, question, workspace, sources):
+        """
+        Initial agent state for a new question: the retrieval query (the question condensed
+        with the previous turns), the documents recalled for it, and whether they are strong enough that one retrieval
+        step (which skips them) should complete the evidence.
+        """
+        self.bind(workspace, sources)
+        condensed = condense_question(question, list(self.questions))
+        self.questions.append(question)
+        if condensed != question:
+            print(f"--- [MEMORY] Follow-up condensed to: {condensed} ---")
+        documents, best = self.recall(condensed)
+        print(f"--- [MEMORY] Recalled {len(documents)} of {len(self.entries)} documents (best {best:.2f}) ---")
+        return {
+            "retrieval_query": condensed,
+            "documents": documents,
+            "recalled": len(documents),
+            "memory_answerable": len(documents) >= 2 and best >= MEMORY_ANSWER_SIMILARITY,
+        }
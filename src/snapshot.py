@@ -0,0 +1,344 @@
+import os
+import sys
+import json
+import shutil
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from mysql.connector import Error
+
+from config import EMBEDDING_MODEL
+from workspaces import BASE_WORKSPACE
+from manage_data import upload_dir
+from lexical_index import term_postings
+from migrations import current_version
+from quantization import parse_vector
+
+# Rows per Parquet row group / INSERT transaction
+BATCH_ROWS = 2000
+MANIFEST = "manifest.json"
+
+# (table, key columns for keyset pagination, [(column, kind)]) in foreign-key order.
+# kind: "str", "int", "float", "json" (stored as text) or "vector" (raw float32).
+# chunk_terms is not exported: it is rebuilt from chunk content on import.
+# Every table carries workspace_id; snapshots taken before workspaces load into "default".
+TABLES = [
+    ("nodes", ["workspace_id", "id"], [("workspace_id", "str"), ("id", "str"), ("type", "str"), ("properties", "json")]),
+    ("edges", ["workspace_id", "source", "target", "type"],
+     [("workspace_id", "str"), ("source", "str"), ("target", "str"), ("type", "str"), ("properties", "json")]),
+    ("chunks", ["id"],
+     [("id", "int"), ("workspace_id", "str"), ("content", "str"), ("source", "str"), ("document", "str"), ("page", "int"),
+      ("chunk_key", "str"), ("heading", "str"), ("start_char", "int"), ("end_char", "int"), ("token_count", "int"),
+      ("embedding", "vector")]),
+    ("chunk_entities", ["workspace_id", "chunk_id", "node_id"],
+     [("workspace_id", "str"), ("chunk_id", "int"), ("node_id", "str")]),
+    ("node_sources", ["workspace_id", "node_id", "document"],
+     [("workspace_id", "str"), ("node_id", "str"), ("document", "str")]),
+    ("edge_sources", ["workspace_id", "source", "target", "type", "document"],
+     [("workspace_id", "str"), ("source", "str"), ("target", "str"), ("type", "str"), ("document", "str")]),
+    ("communities", ["workspace_id", "id"],
+     [("workspace_id", "str"), ("id", "str"), ("title", "str"), ("summary", "str"), ("node_count", "int"), ("embedding", "vector")]),
+    ("community_members", ["workspace_id", "community_id", "node_id"],
+     [("workspace_id", "str"), ("community_id", "str"), ("node_id", "str")]),
+    ("pdf_tables", ["id"],
+     [("id", "str"), ("workspace_id", "str"), ("document", "str"), ("page", "int"), ("table_index", "int"), ("headers", "json")]),
+    ("table_cells", ["table_id", "row_index", "col_index"],
+     [("table_id", "str"), ("workspace_id", "str"), ("row_index", "int"), ("col_index", "int"), ("row_label", "str"),
+      ("column_name", "str"), ("value_text", "str"), ("value_num", "float")]),
+]
+
+def _arrow_type(kind, dim=None):
+    import pyarrow as pa
+    if kind == "int":
+        return pa.int64()
+    if kind == "float":
+        return pa.float64()
+    if kind == "vector":
+        return pa.list_(pa.float32(), dim)
+    return pa.string()
+
+def _select_sql(table, keys, columns):
+    """Returns (first_page_sql, next_page_sql); the next page starts after the last key seen."""
+    exprs = ", ".join(
+        f"CAST({name} AS CHAR) AS {name}" if kind in ("vector", "json") else name
+        for name, kind in columns
+    )
+    key_list = ", ".join(keys)
+    after_key = f"({key_list}) > ({', '.join(['%s'] * len(keys))})"
+    return (
+        f"SELECT {exprs} FROM {table} ORDER BY {key_list} LIMIT %s",
+        f"SELECT {exprs} FROM {table} WHERE {after_key} ORDER BY {key_list} LIMIT %s",
+    )
+
+def _to_record_batch(rows, columns, dim):
+    import numpy as np
+    import pyarrow as pa
+    arrays = []
+    for name, kind in columns:
+        values = [row[name] for row in rows]
+        if kind == "vector":
+            vectors = [parse_vector(v) for v in values]
+            flat = pa.array(np.concatenate([v if v is not None else np.zeros(dim, dtype="float32") for v in vectors]))
+            mask = pa.array([v is None for v in vectors])
+            arrays.append(pa.FixedSizeListArray.from_arrays(flat, dim, mask=mask))
+        else:
+            arrays.append(pa.array(values, type=_arrow_type(kind)))
+    return pa.RecordBatch.from_arrays(arrays, names=[name for name, _ in columns])
+
+def export_table(graph, table, keys, columns, path, report):
+    """Streams one table to Parquet with keyset pagination; memory stays at one batch."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    first_sql, next_sql = _select_sql(table, keys, columns)
+    writer = None
+    dim = None
+    total = 0
+    last_key = None
+    try:
+        while True:
+            if last_key is None:
+                rows = graph.query(first_sql, (BATCH_ROWS,))
+            else:
+                rows = graph.query(next_sql, tuple(last_key) + (BATCH_ROWS,))
+            if not rows:
+                break
+            if writer is None:
+                for name, kind in columns:
+                    if kind == "vector":
+                        sample = next((r[name] for r in rows if r[name] is not None), None)
+                        dim = len(parse_vector(sample)) if sample else 384
+                schema = pa.schema([(name, _arrow_type(kind, dim)) for name, kind in columns])
+                writer = pq.ParquetWriter(path, schema, compression="zstd")
+            writer.write_batch(_to_record_batch(rows, columns, dim))
+            total += len(rows)
+            last_key = [rows[-1][k] for k in keys]
+            report(f"  {table}: {total} rows")
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+def export_snapshot(out_dir, with_files=False, status_callback=None):
+    """
+    Writes every knowledge-base table to <out_dir>/<table>.parquet plus a manifest.
+    Embeddings are stored as fixed-size float32 lists, so a restore skips embedding and extraction.
+    """
+    from resources import get_graph
+
+    def report(msg):
+        print(msg)
+        if status_callback: status_callback(msg)
+
+    graph = get_graph()
+    os.makedirs(out_dir, exist_ok=True)
+    counts = {}
+    for table, keys, columns in TABLES:
+        report(f"Exporting {table}...")
+        counts[table] = export_table(graph, table, keys, columns, os.path.join(out_dir, f"{table}.parquet"), report)
+
+    if with_files:
+        # files/<name> for the default workspace, files/<workspace>/<name> for the others
+        for ws in graph.list_workspaces():
+            source_dir = upload_dir(ws)
+            if not os.path.isdir(source_dir):
+                continue
+            files_dir = os.path.join(out_dir, "files", *([] if ws == BASE_WORKSPACE else [ws]))
+            os.makedirs(files_dir, exist_ok=True)
+            for filename in os.listdir(source_dir):
+                if os.path.isfile(os.path.join(source_dir, filename)):
+                    shutil.copy2(os.path.join(source_dir, filename), files_dir)
+
+    manifest = {
+        "created_at": datetime.utcnow().isoformat(),
+        "schema_version": current_version(graph),
+        "embedding_model": EMBEDDING_MODEL,
+        "counts": counts,
+        "with_files": with_files,
+    }
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    report(f"Snapshot written to {out_dir}: {counts}")
+    return manifest
+
+def _format_vector(vector):
+    # 9 significant digits round-trip every float32 exactly
+    return "[" + ",".join(map("{:.9g}".format, vector)) + "]"
+
+def _batch_rows(batch, columns):
+    """Arrow record batch -> list of tuples ready for executemany."""
+    data = []
+    names = batch.schema.names
+    for name, kind in columns:
+        if name == "workspace_id" and name not in names:
+            data.append([BASE_WORKSPACE] * batch.num_rows)
+            continue
+        column = batch.column(name)
+        if kind == "vector":
+            dim = column.type.list_size
+            # .values keeps the slots of null vectors (flatten() would drop them)
+            values = column.values.slice(column.offset * dim, len(column) * dim)
+            matrix = values.to_numpy(zero_copy_only=False).reshape(-1, dim)
+            valid = column.is_valid().to_pylist()
+            data.append([_format_vector(v) if ok else None for v, ok in zip(matrix, valid)])
+        else:
+            data.append(column.to_pylist())
+    return list(zip(*data))
+
+def _insert_sql(table, columns):
+    values = ", ".join("VEC_FROM_TEXT(%s)" if kind == "vector" else "%s" for _, kind in columns)
+    return f"INSERT INTO {table} ({', '.join(name for name, _ in columns)}) VALUES ({values})"
+
+class _BulkLoader:
+    """
+    One connection per worker thread, foreign key checks off (parents are loaded first).
+    Each batch is one multi-row INSERT. TiDB's bulk DML mode only applies to autocommit
+    statements, so where the server supports it the connection runs in autocommit and every
+    statement commits on its own; otherwise each batch is one regular transaction.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.graph.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SET SESSION foreign_key_checks = 0")
+            try:
+                cursor.execute("SET SESSION tidb_dml_type = 'bulk'")
+                conn.autocommit = True
+            except Error:
+                pass  # TiDB < 8.0: regular transactions
+            cursor.close()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def load(self, table, columns, rows):
+        conn = self._connection()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(_insert_sql(table, columns), rows)
+            if table == "chunks":
+                # Rebuild lexical postings from content instead of shipping them
+                names = [name for name, _ in columns]
+                id_idx, ws_idx, content_idx = names.index("id"), names.index("workspace_id"), names.index("content")
+                postings = []
+                for row in rows:
+                    terms, doc_len = term_postings(row[content_idx] or "")
+                    postings.extend((row[ws_idx], term, row[id_idx], tf, doc_len) for term, tf in terms)
+                if postings:
+                    cursor.executemany(
+                        "INSERT INTO chunk_terms (workspace_id, term, chunk_id, tf, doc_len) VALUES (%s, %s, %s, %s, %s)",
+                        postings
+                    )
+            if not conn.autocommit:
+                conn.commit()
+        except Error:
+            if not conn.autocommit:
+                conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        return len(rows)
+
+    def close(self):
+        for conn in self._connections:
+            if conn.is_connected():
+                conn.close()
+
+def import_snapshot(in_dir, workers=4, force=False, status_callback=None):
+    """
+    Restores a snapshot into an empty database. Parquet files are read batch by batch and
+    loaded by `workers` parallel connections, with a bounded number of batches in flight.
+    The snapshot's schema version must match the database's (force skips the check).
+    """
+    import pyarrow.parquet as pq
+    from resources import get_graph
+
+    def report(msg):
+        print(msg)
+        if status_callback: status_callback(msg)
+
+    with open(os.path.join(in_dir, MANIFEST), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest["embedding_model"] != EMBEDDING_MODEL and not force:
+        raise ValueError(
+            f"Snapshot embeddings come from {manifest['embedding_model']}, but EMBEDDING_MODEL is "
+            f"{EMBEDDING_MODEL}. Use --force to import anyway."
+        )
+
+    graph = get_graph()
+    target_version = current_version(graph)
+    if manifest.get("schema_version") != target_version and not force:
+        newer = (manifest.get("schema_version") or 0) > target_version
+        raise ValueError(
+            f"Snapshot has schema version {manifest.get('schema_version')}, the database {target_version}. "
+            + ("Update the code and migrate the database (python src/migrations.py migrate) first."
+               if newer else "Its data predates later migrations; re-export it from a migrated database.")
+            + " Use --force to import anyway."
+        )
+    for table in ("chunks", "nodes"):
+        if graph.query(f"SELECT 1 FROM {table} LIMIT 1"):
+            raise ValueError(f"Table {table} is not empty. Clear the database first (clear_db.py).")
+
+    loader = _BulkLoader(graph)
+    counts = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for table, _, columns in TABLES:
+                path = os.path.join(in_dir, f"{table}.parquet")
+                if not os.path.exists(path):
+                    continue
+                report(f"Importing {table}...")
+                total = 0
+                pending = set()
+                for batch in pq.ParquetFile(path).iter_batches(batch_size=BATCH_ROWS):
+                    pending.add(executor.submit(loader.load, table, columns, _batch_rows(batch, columns)))
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            total += future.result()
+                        report(f"  {table}: {total} rows")
+                # Children reference this table, so finish it before moving on
+                for future in pending:
+                    total += future.result()
+                counts[table] = total
+                report(f"  {table}: {total} rows")
+    finally:
+        loader.close()
+
+    files_dir = os.path.join(in_dir, "files")
+    if os.path.isdir(files_dir):
+        for entry in os.listdir(files_dir):
+            path = os.path.join(files_dir, entry)
+            if os.path.isfile(path):
+                os.makedirs(upload_dir(BASE_WORKSPACE), exist_ok=True)
+                shutil.copy2(path, upload_dir(BASE_WORKSPACE))
+            else:
+                target_dir = upload_dir(entry)
+                os.makedirs(target_dir, exist_ok=True)
+                for filename in os.listdir(path):
+                    shutil.copy2(os.path.join(path, filename), target_dir)
+
+    report(f"Snapshot restored from {in_dir}: {counts}")
+    return counts
+
+if __name__ == "__main__":
+    # Usage: python src/snapshot.py export <dir> [--with-files]
+    #        python src/snapshot.py import <dir> [--workers N] [--force]
+    if len(sys.argv) < 3 or sys.argv[1] not in ("export", "import"):
+        print("Usage: python src/snapshot.py export <dir> [--with-files] | import <dir> [--workers N] [--force]")
+        sys.exit(1)
+    command, directory = sys.argv[1], sys.argv[2]
+    if command == "export":
+        export_snapshot(directory, with_files="--with-files" in sys.argv)
+    else:
+        workers = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else 4
+        import_snapshot(directory, workers=workers, force="--force" in sys.argv)
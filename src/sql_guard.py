@@ -0,0 +1,184 @@
+import re
+import logging
+
+from config import SQL_MAX_ROWS, SQL_MAX_EXECUTION_MS, SQL_MAX_EST_ROWS, SQL_MAX_CELL_CHARS
+
+logger = logging.getLogger(__name__)
+
+# Tables the graph worker may read. chunk_terms is internal to lexical search.
+ALLOWED_TABLES = {
+    "nodes", "edges", "chunks", "chunk_entities", "communities", "community_members", "pdf_tables", "table_cells"
+}
+
+# Every table of the schema; used to spot references outside FROM/JOIN (e.g. comma joins)
+KNOWN_TABLES = ALLOWED_TABLES | {"chunk_terms", "node_sources", "edge_sources", "schema_version"}
+
+# INSERT(...) and REPLACE(...) are also string functions, so only the statement forms are rejected
+FORBIDDEN_KEYWORDS = re.compile(
+    r"\b(INSERT(?!\s*\()|REPLACE(?!\s*\()|UPDATE|DELETE|DROP|ALTER|CREATE|TRUNCATE|GRANT|REVOKE|RENAME|"
+    r"LOAD|CALL|HANDLER|LOCK|UNLOCK|SET|PREPARE|EXECUTE|SLEEP|BENCHMARK|INTO|OUTFILE|DUMPFILE)\b",
+    re.IGNORECASE
+)
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+TABLE_REF = re.compile(r"\b(?:FROM|JOIN)\s+(`?[\w.]+`?)", re.IGNORECASE)
+CTE_NAME = re.compile(r"(?:\bWITH|,)\s*(?:RECURSIVE\s+)?`?(\w+)`?\s+AS\s*\(", re.IGNORECASE)
+# FROM/JOIN <table> [[AS] alias]
+SCOPED_REF = re.compile(
+    r"\b(FROM|JOIN)\s+`?(\w+)`?(?:\s+(?:AS\s+)?(?!(?:ON|USING|WHERE|JOIN|INNER|LEFT|RIGHT|OUTER|CROSS|NATURAL|"
+    r"STRAIGHT_JOIN|GROUP|ORDER|HAVING|LIMIT|UNION|WINDOW|FOR)\b)`?(\w+)`?)?",
+    re.IGNORECASE
+)
+TABLE_NAME = re.compile(
+    r"(?<![\w.`])`?(" + "|".join(sorted(KNOWN_TABLES)) + r")`?(?![\w`])(?!\s*\.)", re.IGNORECASE
+)
+ALIAS_BEFORE = re.compile(r"\bAS\s*$", re.IGNORECASE)
+TRAILING_LIMIT = re.compile(r"\bLIMIT\s+(\d+)(?:\s*,\s*(\d+)|\s+OFFSET\s+(\d+))?\s*$", re.IGNORECASE)
+
+class UnsafeQueryError(ValueError):
+    """Raised when generated SQL is rejected before or instead of execution."""
+
+def validate_sql(sql: str):
+    """
+    Whitelists a single read-only SELECT over ALLOWED_TABLES. Returns the normalized SQL.
+    Raises UnsafeQueryError with a reason the LLM can act on.
+    """
+    if not sql or not sql.strip():
+        raise UnsafeQueryError("Empty SQL")
+
+    sql = sql.strip().rstrip(";").strip()
+    # Scan with string literals blanked so values like '%Drop%' don't trip the checks
+    scrubbed = STRING_LITERAL.sub("''", sql)
+
+    if ";" in scrubbed:
+        raise UnsafeQueryError("Only a single statement is allowed")
+    if "--" in scrubbed or "/*" in scrubbed or "#" in scrubbed:
+        raise UnsafeQueryError("Comments are not allowed")
+    if not re.match(r"^\s*(SELECT|WITH)\b", scrubbed, re.IGNORECASE):
+        raise UnsafeQueryError("Only SELECT queries are allowed")
+
+    match = FORBIDDEN_KEYWORDS.search(scrubbed)
+    if match:
+        raise UnsafeQueryError(f"Keyword not allowed: {match.group(1).upper()}")
+    if re.search(r"\bembedding\b", scrubbed, re.IGNORECASE):
+        raise UnsafeQueryError("Selecting or filtering on embedding vectors is not allowed")
+
+    cte_names = {name.lower() for name in CTE_NAME.findall(scrubbed)}
+    tables = set()
+    for ref in TABLE_REF.findall(scrubbed):
+        name = ref.strip("`").lower()
+        if name not in cte_names:
+            tables.add(name)
+    if not tables:
+        raise UnsafeQueryError("Query must read from at least one table")
+    disallowed = tables - ALLOWED_TABLES
+    if disallowed:
+        raise UnsafeQueryError(f"Tables not allowed: {', '.join(sorted(disallowed))}")
+    if "chunks" in tables and re.search(r"(^|[\s,.])\*", scrubbed):
+        raise UnsafeQueryError("SELECT * on chunks is not allowed; list the columns (content, source, page)")
+
+    return sql
+
+def scope_to_workspace(sql: str, workspace: str):
+    """
+    Rewrites every table reference into a derived table filtered on the workspace:
+    "FROM nodes n" -> "FROM (SELECT * FROM nodes WHERE workspace_id = 'ws') AS n". The filter
+    is the leading column of every table's keys, so the query only reads the tenant's ranges.
+    References outside FROM/JOIN (comma joins) are rejected rather than left unscoped.
+    """
+    # Same-length blanking keeps offsets valid for the original SQL
+    scrubbed = STRING_LITERAL.sub(lambda m: "'" + " " * (len(m.group(0)) - 2) + "'", sql)
+    cte_names = {name.lower() for name in CTE_NAME.findall(scrubbed)}
+
+    refs = [m for m in SCOPED_REF.finditer(scrubbed)
+            if m.group(2).lower() in KNOWN_TABLES and m.group(2).lower() not in cte_names]
+    scoped_starts = {m.start(2) for m in refs}
+    for m in TABLE_NAME.finditer(scrubbed):
+        if m.group(1).lower() in cte_names or ALIAS_BEFORE.search(scrubbed[:m.start()]):
+            continue
+        if m.start(1) not in scoped_starts:
+            raise UnsafeQueryError(f"Table {m.group(1)} must be read with FROM or JOIN ... ON (no comma joins)")
+
+    for m in reversed(refs):
+        keyword, table, alias = m.group(1), m.group(2), m.group(3)
+        scoped = f"{keyword} (SELECT * FROM {table} WHERE workspace_id = '{workspace}') AS {alias or table}"
+        sql = sql[:m.start()] + scoped + sql[m.end():]
+    return sql
+
+def apply_limits(sql: str, max_rows: int = SQL_MAX_ROWS, max_execution_ms: int = SQL_MAX_EXECUTION_MS):
+    """Adds/clamps the outer LIMIT and adds a MAX_EXECUTION_TIME hint to a leading SELECT."""
+    match = TRAILING_LIMIT.search(sql)
+    if match:
+        if match.group(2):
+            offset, count = int(match.group(1)), int(match.group(2))
+        else:
+            offset, count = int(match.group(3) or 0), int(match.group(1))
+        if count > max_rows:
+            sql = sql[:match.start()] + f"LIMIT {max_rows} OFFSET {offset}"
+    else:
+        sql = f"{sql} LIMIT {max_rows}"
+
+    # For WITH queries the session-level max_execution_time still applies
+    sql = re.sub(r"^\s*SELECT\b", f"SELECT /*+ MAX_EXECUTION_TIME({max_execution_ms}) */", sql,
+                 count=1, flags=re.IGNORECASE)
+    return sql
+
+def check_cost(cursor, sql: str, max_est_rows: int = SQL_MAX_EST_ROWS):
+    """EXPLAIN-based rejection of cartesian joins and plans estimated to touch too many rows."""
+    cursor.execute(f"EXPLAIN {sql}")
+    plan = cursor.fetchall()
+    for row in plan:
+        operator = " ".join(str(v) for v in row.values())
+        if "CARTESIAN" in operator.upper():
+            raise UnsafeQueryError("Query plan contains a cartesian join; add a join condition")
+        est_rows = float(row.get("estRows") or 0)
+        if est_rows > max_est_rows:
+            raise UnsafeQueryError(
+                f"Query is too expensive (~{int(est_rows)} rows at {row.get('id')}); add selective filters"
+            )
+
+def _truncate_row(row: dict, max_chars: int):
+    truncated = {}
+    for key, value in row.items():
+        if isinstance(value, (bytes, bytearray)):
+            value = f"<{len(value)} bytes>"
+        elif isinstance(value, str) and len(value) > max_chars:
+            value = value[:max_chars] + "..."
+        truncated[key] = value
+    return truncated
+
+def _start_snapshot_read(cursor):
+    """
+    Pins the session to a snapshot a moment in the past. TiDB rejects every write while
+    tidb_snapshot is set, so this holds even on the main account (TiDB treats
+    START TRANSACTION READ ONLY as a no-op, and rejects it unless noop functions are enabled).
+    """
+    cursor.execute("SELECT DATE_FORMAT(NOW(6) - INTERVAL 1 SECOND, '%Y-%m-%d %H:%i:%s.%f') AS ts")
+    cursor.execute("SET @@tidb_snapshot = %s", (cursor.fetchone()["ts"],))
+
+def run_guarded_query(graph, sql: str, max_rows: int = SQL_MAX_ROWS):
+    """
+    Validates, scopes to the graph's workspace, bounds and executes LLM-generated SQL as a
+    snapshot read on the read-only connection. Returns (rows, truncated).
+    Raises UnsafeQueryError when the query is rejected.
+    """
+    # One extra row tells us whether the result was cut off
+    sql = apply_limits(scope_to_workspace(validate_sql(sql), graph.workspace), max_rows=max_rows + 1)
+
+    conn = graph.get_readonly_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(f"SET SESSION max_execution_time = {int(SQL_MAX_EXECUTION_MS)}")
+        _start_snapshot_read(cursor)
+        try:
+            check_cost(cursor, sql)
+            cursor.execute(sql)
+            rows = cursor.fetchall()
+        finally:
+            cursor.execute("SET @@tidb_snapshot = ''")
+
+        truncated = len(rows) > max_rows
+        return [_truncate_row(r, SQL_MAX_CELL_CHARS) for r in rows[:max_rows]], truncated
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
@@ -0,0 +1,103 @@
+import os
+import re
+import sys
+import hashlib
+
+from pdf_loader import load_tables
+from resources import get_graph
+from workspaces import BASE_WORKSPACE
+
+NUMBER_RE = re.compile(r"^\(?-?[$€£]?\s*-?\d[\d,]*(\.\d+)?\)?\s*%?$")
+EMPTY_VALUES = {"", "-", "—", "–", "n/a", "na", "nm", "*"}
+MAX_TEXT = 255
+
+def clean_cell(value):
+    return re.sub(r"\s+", " ", value or "").strip()
+
+def parse_number(text: str):
+    """
+    Financial number -> float: "$1,234.5" -> 1234.5, "(12.3)" -> -12.3, "15%" -> 15.0.
+    Returns None for anything that is not a plain number.
+    """
+    value = clean_cell(text)
+    if value.lower() in EMPTY_VALUES or not NUMBER_RE.match(value):
+        return None
+    negative = value.startswith("(") and value.endswith(")")
+    digits = re.sub(r"[^\d.\-]", "", value)
+    try:
+        number = float(digits)
+    except ValueError:
+        return None
+    return -abs(number) if negative else number
+
+YEAR_RE = re.compile(r"^(FY\s?)?(19|20)\d\d$", re.IGNORECASE)
+
+def _is_header_row(row):
+    """A header row has (almost) no numbers outside the label column; bare years count as headers."""
+    values = [cell for cell in row[1:] if cell]
+    numbers = sum(parse_number(cell) is not None and not YEAR_RE.match(cell) for cell in values)
+    return bool(values) and numbers <= len(values) // 4
+
+def structure_table(rows):
+    """
+    Raw cell rows (pdfplumber) -> {"headers": [...], "rows": [{"label", "cells": [(col, name, text, num)]}]}.
+    Consecutive header rows are merged ("2024" over "Q3" -> "2024 Q3"); the first column is the row label.
+    """
+    width = max(len(row) for row in rows)
+    grid = [[clean_cell(cell) for cell in row] + [""] * (width - len(row)) for row in rows]
+
+    header_rows = []
+    while grid and len(header_rows) < 3 and _is_header_row(grid[0]) and len(grid) > 1:
+        header_rows.append(grid.pop(0))
+    # Group headers ("2024" spanning Q3 and Q4) come back as one cell followed by blanks
+    for row in header_rows[:-1]:
+        for col in range(2, width):
+            if not row[col]:
+                row[col] = row[col - 1]
+    headers = []
+    for col in range(width):
+        parts = [row[col] for row in header_rows if row[col]]
+        headers.append(" ".join(parts)[:MAX_TEXT] or f"col{col}")
+
+    records = []
+    for row in grid:
+        label = row[0][:MAX_TEXT]
+        cells = [
+            (col, headers[col], row[col][:MAX_TEXT], parse_number(row[col]))
+            for col in range(1, width) if row[col]
+        ]
+        if label or cells:
+            records.append({"label": label, "cells": cells})
+    return {"headers": headers, "rows": records}
+
+def table_id(document: str, page: int, index: int, workspace: str = BASE_WORKSPACE):
+    # Ids of the base workspace keep their original form
+    prefix = "" if workspace == BASE_WORKSPACE else f"{workspace}:"
+    return hashlib.sha1(f"{prefix}{document}:{page}:{index}".encode("utf-8")).hexdigest()
+
+def ingest_tables(file_path: str, status_callback=None, workspace=None):
+    """Stores every table detected in the PDF as structured rows (pdf_tables + table_cells), replacing earlier ones."""
+    def report(msg):
+        print(msg)
+        if status_callback: status_callback(msg)
+
+    graph = get_graph(workspace)
+    document = os.path.basename(file_path)
+    tables = []
+    for page, page_tables in load_tables(file_path):
+        for index, rows in enumerate(page_tables):
+            structured = structure_table(rows)
+            if structured["rows"]:
+                tables.append((table_id(document, page, index, graph.workspace), page, index, structured))
+    # Replaces the document's previous tables, including ones no longer detected
+    n_cells = graph.save_tables(document, tables)
+    n_tables = len(tables)
+    report(f"Stored {n_tables} tables ({n_cells} cells) from {document}.")
+    return n_tables
+
+if __name__ == "__main__":
+    # Usage: python src/tables.py <file.pdf>
+    if len(sys.argv) < 2:
+        print("Usage: python src/tables.py <file.pdf>")
+        sys.exit(1)
+    ingest_tables(sys.argv[1])
@@ -3,16 +3,41 @@ import os
 import mysql.connector
 from mysql.connector import Error
 import json
+import time
 import logging
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-from config import TIDB_HOST, TIDB_PORT, TIDB_USER, TIDB_PASSWORD, TIDB_DATABASE, TIDB_CA_PATH
+from config import (
+    TIDB_HOST, TIDB_PORT, TIDB_USER, TIDB_PASSWORD, TIDB_DATABASE, TIDB_CA_PATH,
+    TIDB_READONLY_USER, TIDB_READONLY_PASSWORD, SQL_REQUIRE_READONLY_USER,
+    VECTOR_CANDIDATE_FACTOR, VECTOR_MAX_CANDIDATES
+)
+from lexical_index import tokenize, term_postings, mentions
+from extraction_filter import clear_duplicate_indexes
+from migrations import migrate, current_version, LATEST_VERSION
+from workspaces import normalize_workspace
+
+# BM25 parameters and how long corpus statistics (N, avgdl) may be reused.
+BM25_K1 = 1.2
+BM25_B = 0.75
+CORPUS_STATS_TTL = 300
+
 
 class TiDBGraph:
-    def __init__(self):
+    """
+    Graph, vector, lexical and table storage of one workspace (tenant). Every table leads its
+    keys with workspace_id and every query here filters on it, so a tenant's queries only
+    touch that tenant's index ranges.
+    """
+    _corpus_stats = {}
+    _schema_versions = {}
+    _readonly_warned = False
+
+    def __init__(self, auto_migrate=True, workspace=None):
+        self.workspace = normalize_workspace(workspace)
         self.config = {
             'host': TIDB_HOST,
             'port': TIDB_PORT,
@@ -24,7 +49,19 @@ class TiDBGraph:
             self.config['ssl_ca'] = TIDB_CA_PATH
             self.config['ssl_verify_cert'] = True
 
-        self._init_schema()
+        if auto_migrate:
+            self.ensure_schema()
+
+    def ensure_schema(self):
+        """
+        Checked once per process and database: a single version lookup, and migrations
+        (DDL) only when the database is behind the latest schema version.
+        """
+        key = (self.config['host'], self.config['port'], self.config['database'])
+        if TiDBGraph._schema_versions.get(key) == LATEST_VERSION:
+            return
+        if current_version(self) >= LATEST_VERSION or self._init_schema():
+            TiDBGraph._schema_versions[key] = LATEST_VERSION
 
     def get_connection(self):
         try:
@@ -34,56 +71,37 @@ class TiDBGraph:
             logger.error(f"Error connecting to TiDB: {e}")
             raise e
 
-    def _init_schema(self):
-        """Initializes the database schema for Graph and Vector storage."""
-        conn = self.get_connection()
+    def get_readonly_connection(self):
+        """
+        Connection for untrusted (LLM-generated) SQL on the TIDB_READONLY_USER account.
+        Without one, the main account is used with a warning (callers still read from a snapshot,
+        which TiDB keeps write-free), or refused when SQL_REQUIRE_READONLY_USER is set.
+        """
+        config = dict(self.config)
+        if TIDB_READONLY_USER:
+            config['user'] = TIDB_READONLY_USER
+            config['password'] = TIDB_READONLY_PASSWORD
+        elif SQL_REQUIRE_READONLY_USER:
+            from sql_guard import UnsafeQueryError
+            raise UnsafeQueryError("Generated SQL is disabled: TIDB_READONLY_USER is not configured")
+        elif not TiDBGraph._readonly_warned:
+            TiDBGraph._readonly_warned = True
+            logger.warning("TIDB_READONLY_USER is not set; generated SQL runs on the read/write account "
+                           "(as a snapshot read). Configure a read-only account.")
         try:
-            cursor = conn.cursor()
-            
-            # Nodes Table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS nodes (
-                    id VARCHAR(255) PRIMARY KEY,
-                    type VARCHAR(100),
-                    properties JSON,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-
-            # Edges Table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS edges (
-                    source VARCHAR(255),
-                    target VARCHAR(255),
-                    type VARCHAR(100),
-                    properties JSON,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (source, target, type),
-                    FOREIGN KEY (source) REFERENCES nodes(id) ON DELETE CASCADE,
-                    FOREIGN KEY (target) REFERENCES nodes(id) ON DELETE CASCADE
-                );
-            """)
-
-            # Chunks Table for Vector Search
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS chunks (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    content TEXT,
-                    source VARCHAR(255),
-                    page INT,
-                    embedding VECTOR(384),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
+            return mysql.connector.connect(**config)
+        except Error as e:
+            logger.error(f"Error connecting to TiDB (read-only): {e}")
+            raise e
 
-            conn.commit()
-            logger.info("Schema initialized (nodes, edges, chunks tables).")
+    def _init_schema(self):
+        """Brings the database schema for Graph and Vector storage up to date (see migrations.py)."""
+        try:
+            migrate(self)
+            return True
         except Error as e:
             logger.error(f"Error initializing schema: {e}")
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+            return False
 
     def query(self, sql, params=None):
         """Executes a generic SQL query."""
@@ -91,7 +109,8 @@ class TiDBGraph:
         try:
             cursor = conn.cursor(dictionary=True)
             cursor.execute(sql, params or ())
-            if sql.strip().upper().startswith("SELECT"):
+            if cursor.with_rows:
+                # SELECT, WITH ... SELECT, EXPLAIN, SHOW
                 result = cursor.fetchall()
                 return result
             else:
@@ -111,33 +130,35 @@ class TiDBGraph:
         """Upserts a node."""
         properties_json = json.dumps(properties or {})
         sql = """
-            INSERT INTO nodes (id, type, properties) 
-            VALUES (%s, %s, %s) 
+            INSERT INTO nodes (workspace_id, id, type, properties) 
+            VALUES (%s, %s, %s, %s) 
             ON DUPLICATE KEY UPDATE 
             type=VALUES(type), properties=VALUES(properties);
         """
-        self.query(sql, (node_id, node_type, properties_json))
+        self.query(sql, (self.workspace, node_id, node_type, properties_json))
 
     def merge_edge(self, source, target, rel_type, properties=None):
         """Upserts an edge."""
         properties_json = json.dumps(properties or {})
         sql = """
-            INSERT INTO edges (source, target, type, properties) 
-            VALUES (%s, %s, %s, %s) 
+            INSERT INTO edges (workspace_id, source, target, type, properties) 
+            VALUES (%s, %s, %s, %s, %s) 
             ON DUPLICATE KEY UPDATE 
             properties=VALUES(properties);
         """
         try:
-            self.query(sql, (source, target, rel_type, properties_json))
+            self.query(sql, (self.workspace, source, target, rel_type, properties_json))
         except Error as e:
              # Handle case where nodes don't exist yet (though we should usually create nodes first)
              logger.error(f"Failed to create edge {source} -> {target}: {e}")
 
-    def batch_insert_graph_data(self, nodes, edges):
+    def batch_insert_graph_data(self, nodes, edges, document=None):
         """
         Inserts multiple nodes and edges in a single transaction/connection.
         nodes: list of dicts {'id': str, 'type': str, 'properties': dict}
         edges: list of dicts {'source': str, 'target': str, 'type': str, 'properties': dict}
+        document: when given, records that the nodes and edges came from this document
+                  (used to delete orphans when the document is removed)
         """
         conn = self.get_connection()
         try:
@@ -145,14 +166,15 @@ class TiDBGraph:
             
             # 1. Insert Nodes
             node_sql = """
-                INSERT INTO nodes (id, type, properties) 
-                VALUES (%s, %s, %s) 
+                INSERT INTO nodes (workspace_id, id, type, properties) 
+                VALUES (%s, %s, %s, %s) 
                 ON DUPLICATE KEY UPDATE 
                 type=VALUES(type), properties=VALUES(properties);
             """
             node_data = []
             for n in nodes:
                 node_data.append((
+                    self.workspace,
                     n['id'], 
                     n['type'], 
                     json.dumps(n.get('properties', {}))
@@ -163,14 +185,15 @@ class TiDBGraph:
             
             # 2. Insert Edges
             edge_sql = """
-                INSERT INTO edges (source, target, type, properties) 
-                VALUES (%s, %s, %s, %s) 
+                INSERT INTO edges (workspace_id, source, target, type, properties) 
+                VALUES (%s, %s, %s, %s, %s) 
                 ON DUPLICATE KEY UPDATE 
                 properties=VALUES(properties);
             """
             edge_data = []
             for e in edges:
                 edge_data.append((
+                    self.workspace,
                     e['source'], 
                     e['target'], 
                     e['type'], 
@@ -180,6 +203,27 @@ class TiDBGraph:
             if edge_data:
                 cursor.executemany(edge_sql, edge_data)
             
+            # 3. Provenance (Document nodes are removed explicitly, not as orphans).
+            # Relationship endpoints count too: an edge of this document keeps both its nodes alive.
+            if document:
+                documents = {n['id'] for n in nodes if n['type'] == 'Document'} | {document}
+                node_ids = [n['id'] for n in nodes if n['type'] != 'Document'] \
+                    + [v for e in edges for v in (e['source'], e['target'])]
+                node_sources = [(self.workspace, node_id, document)
+                                for node_id in dict.fromkeys(node_ids) if node_id not in documents]
+                if node_sources:
+                    cursor.executemany(
+                        "INSERT IGNORE INTO node_sources (workspace_id, node_id, document) VALUES (%s, %s, %s)",
+                        node_sources
+                    )
+                edge_sources = [(self.workspace, e['source'], e['target'], e['type'], document) for e in edges]
+                if edge_sources:
+                    cursor.executemany(
+                        "INSERT IGNORE INTO edge_sources (workspace_id, source, target, type, document) "
+                        "VALUES (%s, %s, %s, %s, %s)",
+                        edge_sources
+                    )
+            
             conn.commit()
             logger.info(f"Batch inserted {len(nodes)} nodes and {len(edges)} edges.")
             
@@ -192,69 +236,565 @@ class TiDBGraph:
                 cursor.close()
                 conn.close()
 
+    def link_chunk_entities(self, chunk_keys, node_ids):
+        """
+        Records which vector chunks mention which entities. Graph extraction reads a window
+        of consecutive chunks, so an entity is linked to the window's chunks that mention it
+        (verbatim, by its distinctive terms or its acronym, see lexical_index.mentions).
+        An entity found in none of them stays linked to its Document only.
+        """
+        node_ids = list(dict.fromkeys(n for n in node_ids if n))
+        if not node_ids or not chunk_keys:
+            return 0
+        placeholders = ", ".join(["%s"] * len(chunk_keys))
+        window_chunks = self.query(
+            f"SELECT id, content FROM chunks WHERE workspace_id = %s AND chunk_key IN ({placeholders})",
+            (self.workspace,) + tuple(chunk_keys)
+        )
+        if not window_chunks:
+            return 0
+
+        words = {c["id"]: set(tokenize(c["content"] or "")) for c in window_chunks}
+        links = [(self.workspace, c["id"], node_id) for node_id in node_ids for c in window_chunks
+                 if mentions(node_id, c["content"] or "", words[c["id"]])]
+        if not links:
+            return 0
+
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "INSERT IGNORE INTO chunk_entities (workspace_id, chunk_id, node_id) VALUES (%s, %s, %s)",
+                links
+            )
+            conn.commit()
+            return len(links)
+        finally:
+            if conn.is_connected():
+                cursor.close()
+                conn.close()
+
+    def expand_neighborhood(self, chunk_ids, hops=2, limit=100):
+        """
+        Returns the 1-2 hop entity neighborhood of the given chunks in one query:
+        rows of (source, type, target, hop), nearest edges first.
+        MENTIONED_IN edges are skipped; they only link entities to Document nodes.
+        """
+        if not chunk_ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(chunk_ids))
+        sql = f"""
+            WITH seeds AS (
+                SELECT DISTINCT node_id FROM chunk_entities
+                WHERE workspace_id = %s AND chunk_id IN ({placeholders})
+            ),
+            hop1 AS (
+                SELECT e.source, e.type, e.target FROM edges e
+                JOIN seeds s ON e.workspace_id = %s AND e.source = s.node_id WHERE e.type <> 'MENTIONED_IN'
+                UNION
+                SELECT e.source, e.type, e.target FROM edges e
+                JOIN seeds s ON e.workspace_id = %s AND e.target = s.node_id WHERE e.type <> 'MENTIONED_IN'
+            ),
+            frontier AS (
+                SELECT source AS node_id FROM hop1
+                UNION
+                SELECT target FROM hop1
+            ),
+            hop2 AS (
+                SELECT e.source, e.type, e.target FROM edges e
+                JOIN frontier f ON e.workspace_id = %s AND e.source = f.node_id
+                WHERE e.type <> 'MENTIONED_IN' AND %s >= 2
+                UNION
+                SELECT e.source, e.type, e.target FROM edges e
+                JOIN frontier f ON e.workspace_id = %s AND e.target = f.node_id
+                WHERE e.type <> 'MENTIONED_IN' AND %s >= 2
+            )
+            SELECT source, type, target, MIN(hop) AS hop
+            FROM (
+                SELECT source, type, target, 1 AS hop FROM hop1
+                UNION ALL
+                SELECT source, type, target, 2 AS hop FROM hop2
+            ) t
+            GROUP BY source, type, target
+            ORDER BY hop ASC
+            LIMIT %s;
+        """
+        ws = self.workspace
+        return self.query(sql, (ws,) + tuple(chunk_ids) + (ws, ws, ws, hops, ws, hops, limit))
+
+    # --- Community Methods ---
+
+    def save_community(self, community_id, title, summary, members, embedding):
+        """Stores one community summary and its member nodes."""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                REPLACE INTO communities (workspace_id, id, title, summary, node_count, embedding)
+                VALUES (%s, %s, %s, %s, %s, VEC_FROM_TEXT(%s));
+            """, (self.workspace, community_id, title, summary, len(members), str(embedding)))
+            cursor.execute(
+                "DELETE FROM community_members WHERE workspace_id = %s AND community_id = %s",
+                (self.workspace, community_id)
+            )
+            cursor.executemany(
+                "INSERT INTO community_members (workspace_id, community_id, node_id) VALUES (%s, %s, %s)",
+                [(self.workspace, community_id, node_id) for node_id in members]
+            )
+            conn.commit()
+        finally:
+            if conn.is_connected():
+                cursor.close()
+                conn.close()
+
+    def search_communities(self, query_embedding, top_k=20):
+        """Returns the community summaries of the workspace closest to the query embedding."""
+        return self._knn("communities", ["id", "title", "summary", "node_count"], ["workspace_id"],
+                         query_embedding, top_k, "knn.workspace_id = %s", [self.workspace])
+
+    def list_workspaces(self):
+        """Workspaces that hold any documents (reads only the leading column of a chunks index)."""
+        return [row["workspace_id"] for row in self.query("SELECT DISTINCT workspace_id FROM chunks ORDER BY workspace_id")]
+
     def get_schema(self):
         """Returns a string representation of the schema for LLM context."""
         return """
         Table 'nodes': id (VARCHAR PK), type (VARCHAR), properties (JSON)
         Table 'edges': source (VARCHAR FK), target (VARCHAR FK), type (VARCHAR), properties (JSON)
-        Table 'chunks': id (INT PK), content (TEXT), source (VARCHAR), page (INT), embedding (VECTOR<384>)
+        Table 'chunks': id (INT PK), content (TEXT), source (VARCHAR), document (VARCHAR), page (INT),
+                        heading (VARCHAR, section title), embedding (VECTOR<384>)
+        Table 'chunk_terms': term (VARCHAR), chunk_id (INT FK), tf (INT), doc_len (INT)
+        Table 'chunk_entities': chunk_id (INT FK chunks.id), node_id (VARCHAR FK nodes.id)
+        Table 'pdf_tables': id (VARCHAR PK), document (VARCHAR), page (INT), table_index (INT), headers (JSON)
+        Table 'table_cells': table_id (VARCHAR FK pdf_tables.id), row_index (INT), col_index (INT),
+                             row_label (VARCHAR, e.g. 'Revenue'), column_name (VARCHAR, e.g. 'Q3 2024'),
+                             value_text (VARCHAR), value_num (DOUBLE, parsed number or NULL)
         """
 
     # --- Vector Methods ---
 
     def insert_chunk(self, content, source, page, embedding):
-        """Inserts a text chunk with its vector embedding."""
+        """
+        Legacy single-row insert of a chunk without chunk key or offsets (only test_tidb.py uses it);
+        ingestion goes through insert_chunks. Returns the chunk id.
+        """
         # Note: mysql-connector-python might handle list->vector conversion if formatted as string or list
         # TiDB Vector expects a string representation like '[0.1, 0.2, ...]'
         embedding_str = str(embedding)
         sql = """
-            INSERT INTO chunks (content, source, page, embedding)
-            VALUES (%s, %s, %s, VEC_FROM_TEXT(%s));
+            INSERT INTO chunks (workspace_id, content, source, document, page, embedding)
+            VALUES (%s, %s, %s, %s, %s, VEC_FROM_TEXT(%s));
         """
-        self.query(sql, (content, source, page, embedding_str))
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, (self.workspace, content, source, os.path.basename(source), page, embedding_str))
+            chunk_id = cursor.lastrowid
+            self._insert_postings(cursor, chunk_id, content)
+            conn.commit()
+            return chunk_id
+        except Error as e:
+            logger.error(f"Error inserting chunk: {e}")
+            raise e
+        finally:
+            if conn.is_connected():
+                cursor.close()
+                conn.close()
 
-    def search_vectors(self, query_embedding, top_k=5, file_filters=None):
-        """Searches for similar chunks using Cosine Distance, optionally filtering by source file."""
+    def insert_chunks(self, chunks, embeddings, batch_size=200):
+        """
+        Inserts chunker output (key, text, page, heading, offsets, tokens) with embeddings and
+        lexical postings, one transaction per batch: one multi-row INSERT for the chunks, one
+        SELECT for their ids and one multi-row INSERT for the postings. Chunks whose key already
+        exists are skipped. Returns {chunk_key: chunk_id} for all given chunks.
+        """
+        ids = self.chunk_ids([c["key"] for c in chunks])
+        sql = """
+            INSERT INTO chunks (workspace_id, content, source, document, page, embedding,
+                                chunk_key, heading, start_char, end_char, token_count)
+            VALUES (%s, %s, %s, %s, %s, VEC_FROM_TEXT(%s), %s, %s, %s, %s, %s)
+        """
+        pending = [(c, e) for c, e in zip(chunks, embeddings) if c["key"] not in ids]
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            for i in range(0, len(pending), batch_size):
+                batch = pending[i:i + batch_size]
+                # executemany rewrites a plain INSERT ... VALUES into one multi-row statement
+                cursor.executemany(sql, [(
+                    self.workspace, chunk["text"], chunk["source"], os.path.basename(chunk["source"]), chunk["page"],
+                    str(list(embedding)), chunk["key"], chunk["heading"] or None,
+                    chunk["start"], chunk["end"], chunk["tokens"]
+                ) for chunk, embedding in batch])
+                # Auto-increment ids of a multi-row insert are not guaranteed consecutive: read them back
+                keys = [chunk["key"] for chunk, _ in batch]
+                cursor.execute(
+                    f"SELECT id, chunk_key FROM chunks WHERE workspace_id = %s AND chunk_key IN ({', '.join(['%s'] * len(keys))})",
+                    (self.workspace,) + tuple(keys)
+                )
+                ids.update({key: chunk_id for chunk_id, key in cursor.fetchall()})
+                postings = []
+                for chunk, _ in batch:
+                    terms, doc_len = term_postings(chunk["text"])
+                    postings.extend((self.workspace, term, ids[chunk["key"]], tf, doc_len) for term, tf in terms)
+                if postings:
+                    cursor.executemany(
+                        "INSERT INTO chunk_terms (workspace_id, term, chunk_id, tf, doc_len) VALUES (%s, %s, %s, %s, %s)",
+                        postings
+                    )
+                conn.commit()
+            return ids
+        except Error as e:
+            conn.rollback()
+            logger.error(f"Error inserting chunks: {e}")
+            raise e
+        finally:
+            if conn.is_connected():
+                cursor.close()
+                conn.close()
+
+    def chunk_ids(self, chunk_keys):
+        """{chunk_key: id} for the keys that exist."""
+        found = {}
+        for i in range(0, len(chunk_keys), 500):
+            batch = chunk_keys[i:i + 500]
+            placeholders = ", ".join(["%s"] * len(batch))
+            for row in self.query(
+                f"SELECT id, chunk_key FROM chunks WHERE workspace_id = %s AND chunk_key IN ({placeholders})",
+                (self.workspace,) + tuple(batch)
+            ):
+                found[row["chunk_key"]] = row["id"]
+        return found
+
+    def remove_stale_chunks(self, document, keep_keys, batch_size=1000):
+        """Deletes a document's chunks that are not in keep_keys (older chunking runs). Returns the count."""
+        keep = set(keep_keys)
+        stale = [row["id"] for row in self.query(
+            "SELECT id, chunk_key FROM chunks WHERE workspace_id = %s AND document = %s", (self.workspace, document)
+        ) if row["chunk_key"] not in keep]
+        for i in range(0, len(stale), batch_size):
+            batch = stale[i:i + batch_size]
+            self.query(
+                f"DELETE FROM chunks WHERE workspace_id = %s AND id IN ({', '.join(['%s'] * len(batch))})",
+                (self.workspace,) + tuple(batch)
+            )
+        return len(stale)
+
+    def _insert_postings(self, cursor, chunk_id, content):
+        postings, doc_len = term_postings(content)
+        if postings:
+            cursor.executemany(
+                "INSERT INTO chunk_terms (workspace_id, term, chunk_id, tf, doc_len) VALUES (%s, %s, %s, %s, %s)",
+                [(self.workspace, term, chunk_id, tf, doc_len) for term, tf in postings]
+            )
+
+    def index_chunk_terms(self, chunks):
+        """(Re)builds lexical postings for a list of (chunk_id, content) pairs."""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            for chunk_id, content in chunks:
+                cursor.execute(
+                    "DELETE FROM chunk_terms WHERE workspace_id = %s AND chunk_id = %s", (self.workspace, chunk_id)
+                )
+                self._insert_postings(cursor, chunk_id, content)
+            conn.commit()
+        finally:
+            if conn.is_connected():
+                cursor.close()
+                conn.close()
+
+    def _scope(self, file_filters, alias="", exclude_ids=None):
+        """
+        Builds "workspace_id = %s [AND document IN (...)] [AND id NOT IN (...)]" for the workspace,
+        the selected files and chunks the caller already has.
+        Filters are file names, which is what the document column holds (source may be a full path),
+        so both predicates are served by the (workspace_id, document) index.
+        """
+        prefix = f"{alias}." if alias else ""
+        condition, params = f"{prefix}workspace_id = %s", [self.workspace]
+        documents = [os.path.basename(f) for f in file_filters or []]
+        if documents:
+            condition += f" AND {prefix}document IN ({', '.join(['%s'] * len(documents))})"
+            params += documents
+        if exclude_ids:
+            condition += f" AND {prefix}id NOT IN ({', '.join(['%s'] * len(exclude_ids))})"
+            params += list(exclude_ids)
+        return condition, params
+
+    def _knn(self, table, columns, filter_columns, query_embedding, top_k, condition, params, excluded=0):
+        """
+        Nearest rows matching condition (written against the alias "knn").
+        TiDB only uses the HNSW index for an unfiltered ORDER BY distance LIMIT query; with a
+        WHERE clause every row's distance is computed. So the KNN runs unfiltered over
+        top_k * VECTOR_CANDIDATE_FACTOR candidates and the filter is applied to those, widening
+        the pool while fewer than top_k rows survive. Past VECTOR_MAX_CANDIDATES (a small
+        workspace or document inside a large table), the exact filtered scan runs instead.
+        `excluded` rows known to be filtered out are added to the first candidate pool.
+        """
         embedding_str = str(query_embedding)
-        
-        where_clause = ""
-        params = [embedding_str]
-        
-        if file_filters:
-            # Create placeholders for the IN clause
-            # We use LIKE matches because the source column might be a full path while filter is just filename
-            # OR we can assume file_filters are substrings.
-            # Let's use a logic where we check if source ends with any of the filters
-            # This is robust because source usually stores relative or absolute path ending with filename.
-             
-            # Constructing a dynamic OR clause: (source LIKE %f1 OR source LIKE %f2 ...)
-            conditions = []
-            img_params = []
-            for f in file_filters:
-                conditions.append("source LIKE %s")
-                # Add wildcard before filename to match full path ending with filename
-                img_params.append(f"%{f}")
-            
-            if conditions:
-                where_clause = "WHERE (" + " OR ".join(conditions) + ")"
-                params.extend(img_params)
-        
-        params.append(top_k)
+        selected = ", ".join(f"knn.{c}" for c in columns)
+        inner = ", ".join(dict.fromkeys(columns + filter_columns))
+        candidates = top_k * max(VECTOR_CANDIDATE_FACTOR, 1) + excluded
+        while candidates <= VECTOR_MAX_CANDIDATES:
+            rows = self.query(f"""
+                SELECT {selected}, knn.distance FROM (
+                    SELECT {inner}, VEC_COSINE_DISTANCE(embedding, VEC_FROM_TEXT(%s)) AS distance
+                    FROM {table}
+                    ORDER BY distance ASC
+                    LIMIT %s
+                ) knn
+                WHERE {condition}
+                ORDER BY knn.distance ASC
+                LIMIT %s;
+            """, (embedding_str, candidates, *params, top_k))
+            if len(rows) >= top_k:
+                return rows
+            candidates *= 4
+
+        return self.query(f"""
+            SELECT {selected}, knn.distance FROM (
+                SELECT {inner}, VEC_COSINE_DISTANCE(embedding, VEC_FROM_TEXT(%s)) AS distance
+                FROM {table}
+            ) knn
+            WHERE {condition}
+            ORDER BY knn.distance ASC
+            LIMIT %s;
+        """, (embedding_str, *params, top_k))
+
+    def search_vectors(self, query_embedding, top_k=5, file_filters=None, exclude_ids=None):
+        """Searches for similar chunks using Cosine Distance, optionally filtering by source file."""
+        condition, params = self._scope(file_filters, alias="knn", exclude_ids=exclude_ids)
+        return self._knn("chunks", ["id", "content", "source", "page"], ["workspace_id", "document"],
+                         query_embedding, top_k, condition, params, excluded=len(exclude_ids or []))
+
+    def get_chunks(self, chunk_ids):
+        """Chunk rows (id, content, source, page) by id, in no particular order."""
+        if not chunk_ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(chunk_ids))
+        return self.query(
+            f"SELECT id, content, source, page FROM chunks WHERE workspace_id = %s AND id IN ({placeholders})",
+            (self.workspace,) + tuple(chunk_ids)
+        )
+
+    def _get_corpus_stats(self):
+        """Returns (N, avgdl) of the workspace for BM25, cached for CORPUS_STATS_TTL seconds."""
+        now = time.time()
+        cached = TiDBGraph._corpus_stats.get(self.workspace)
+        if cached is None or now - cached[1] > CORPUS_STATS_TTL:
+            row = self.query("""
+                SELECT COUNT(*) AS n, AVG(doc_len) AS avgdl
+                FROM (
+                    SELECT chunk_id, MAX(doc_len) AS doc_len FROM chunk_terms
+                    WHERE workspace_id = %s GROUP BY chunk_id
+                ) t;
+            """, (self.workspace,))[0]
+            cached = ((int(row["n"] or 0), float(row["avgdl"] or 1.0)), now)
+            TiDBGraph._corpus_stats[self.workspace] = cached
+        return cached[0]
+
+    def search_lexical(self, query_text, top_k=5, file_filters=None, exclude_ids=None):
+        """BM25 search over chunk_terms. Catches exact tickers, contract numbers and names."""
+        terms = sorted(set(tokenize(query_text)))
+        if not terms:
+            return []
+        n_docs, avgdl = self._get_corpus_stats()
+        if n_docs == 0:
+            return []
+
+        placeholders = ", ".join(["%s"] * len(terms))
+        condition, filter_params = self._scope(file_filters, alias="c", exclude_ids=exclude_ids)
 
         sql = f"""
-            SELECT content, source, page, 
-                   VEC_COSINE_DISTANCE(embedding, VEC_FROM_TEXT(%s)) AS distance
-            FROM chunks
-            {where_clause}
-            ORDER BY distance ASC
+            SELECT c.id, c.content, c.source, c.page,
+                   SUM(LN(1 + (%s - d.df + 0.5) / (d.df + 0.5))
+                       * p.tf * (%s + 1) / (p.tf + %s * (1 - %s + %s * p.doc_len / %s))) AS bm25
+            FROM chunk_terms p
+            JOIN (
+                SELECT term, COUNT(*) AS df FROM chunk_terms
+                WHERE workspace_id = %s AND term IN ({placeholders}) GROUP BY term
+            ) d ON d.term = p.term
+            JOIN chunks c ON c.id = p.chunk_id
+            WHERE p.workspace_id = %s AND p.term IN ({placeholders}) AND {condition}
+            GROUP BY c.id
+            ORDER BY bm25 DESC
             LIMIT %s;
         """
+        params = ([n_docs, BM25_K1, BM25_K1, BM25_B, BM25_B, avgdl, self.workspace] + terms
+                  + [self.workspace] + terms + filter_params + [top_k])
         return self.query(sql, tuple(params))
 
+    # --- Table Methods ---
+
+    def save_tables(self, document, tables):
+        """
+        Replaces every extracted table of a document with tables [(table_id, page, table_index, structured)]
+        in one transaction, so tables no longer detected don't linger. Returns the number of cells stored.
+        """
+        cells = [
+            (self.workspace, table_id, row_index, col, row["label"], name, text, number)
+            for table_id, _, _, structured in tables
+            for row_index, row in enumerate(structured["rows"])
+            for col, name, text, number in row["cells"]
+        ]
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            # Cells cascade
+            cursor.execute("DELETE FROM pdf_tables WHERE workspace_id = %s AND document = %s", (self.workspace, document))
+            if tables:
+                cursor.executemany(
+                    "INSERT INTO pdf_tables (workspace_id, id, document, page, table_index, headers) "
+                    "VALUES (%s, %s, %s, %s, %s, %s)",
+                    [(self.workspace, table_id, document, page, table_index, json.dumps(structured["headers"]))
+                     for table_id, page, table_index, structured in tables]
+                )
+            if cells:
+                cursor.executemany("""
+                    INSERT INTO table_cells (workspace_id, table_id, row_index, col_index, row_label, column_name,
+                                             value_text, value_num)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """, cells)
+            conn.commit()
+            return len(cells)
+        except Error as e:
+            conn.rollback()
+            logger.error(f"Error saving tables of {document}: {e}")
+            raise e
+        finally:
+            if conn.is_connected():
+                cursor.close()
+                conn.close()
+
+    # --- Deletion ---
+
+    def delete_document_batches(self, document, batch_size=1000):
+        """
+        Deletes everything a document contributed to this workspace, in bounded transactions.
+        Yields (stage, rows_deleted) after every batch so callers can report progress.
+
+        1. chunks (chunk_terms / chunk_entities cascade) and extracted tables (cells cascade)
+        2. edge provenance, then edges no other document references
+        3. node provenance, then entities no other document references (their edges cascade)
+           and their community memberships
+        4. communities left without members
+        5. the Document node itself
+        """
+        ws = self.workspace
+        while True:
+            deleted = self.query(
+                "DELETE FROM chunks WHERE workspace_id = %s AND document = %s LIMIT %s", (ws, document, batch_size)
+            )
+            if not deleted:
+                break
+            yield "chunks", deleted
+
+        while True:
+            # Tables hold many cells each, so fewer per batch
+            deleted = self.query(
+                "DELETE FROM pdf_tables WHERE workspace_id = %s AND document = %s LIMIT %s",
+                (ws, document, max(batch_size // 50, 1))
+            )
+            if not deleted:
+                break
+            yield "tables", deleted
+
+        while True:
+            keys = self.query(
+                "SELECT source, target, type FROM edge_sources WHERE workspace_id = %s AND document = %s LIMIT %s",
+                (ws, document, batch_size)
+            )
+            if not keys:
+                break
+            tuples = ", ".join(["(%s, %s, %s)"] * len(keys))
+            params = tuple(v for k in keys for v in (k["source"], k["target"], k["type"]))
+            self.query(
+                f"DELETE FROM edge_sources WHERE workspace_id = %s AND document = %s "
+                f"AND (source, target, type) IN ({tuples})",
+                (ws, document) + params
+            )
+            deleted = self.query(f"""
+                DELETE FROM edges
+                WHERE workspace_id = %s AND (source, target, type) IN ({tuples})
+                  AND NOT EXISTS (
+                      SELECT 1 FROM edge_sources s
+                      WHERE s.workspace_id = edges.workspace_id AND s.source = edges.source
+                        AND s.target = edges.target AND s.type = edges.type
+                  )
+            """, (ws,) + params)
+            yield "edges", deleted
+
+        while True:
+            keys = [row["node_id"] for row in self.query(
+                "SELECT node_id FROM node_sources WHERE workspace_id = %s AND document = %s LIMIT %s",
+                (ws, document, batch_size)
+            )]
+            if not keys:
+                break
+            placeholders = ", ".join(["%s"] * len(keys))
+            self.query(
+                f"DELETE FROM node_sources WHERE workspace_id = %s AND document = %s AND node_id IN ({placeholders})",
+                (ws, document) + tuple(keys)
+            )
+            deleted = self.query(f"""
+                DELETE FROM nodes
+                WHERE workspace_id = %s AND id IN ({placeholders}) AND type <> 'Document'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM node_sources s WHERE s.workspace_id = nodes.workspace_id AND s.node_id = nodes.id
+                  )
+            """, (ws,) + tuple(keys))
+            # Community membership has no foreign key to nodes
+            self.query(f"""
+                DELETE FROM community_members
+                WHERE workspace_id = %s AND node_id IN ({placeholders})
+                  AND NOT EXISTS (
+                      SELECT 1 FROM nodes n WHERE n.workspace_id = community_members.workspace_id
+                        AND n.id = community_members.node_id
+                  )
+            """, (ws,) + tuple(keys))
+            yield "entities", deleted
+
+        # Communities left without members go (their summaries describe deleted entities); the others
+        # keep their summary until the next build_communities, with an accurate size
+        deleted = self.query("""
+            DELETE FROM communities
+            WHERE workspace_id = %s AND NOT EXISTS (
+                SELECT 1 FROM community_members m WHERE m.workspace_id = communities.workspace_id
+                  AND m.community_id = communities.id
+            )
+        """, (ws,))
+        self.query("""
+            UPDATE communities SET node_count = (
+                SELECT COUNT(*) FROM community_members m
+                WHERE m.workspace_id = communities.workspace_id AND m.community_id = communities.id
+            ) WHERE workspace_id = %s
+        """, (ws,))
+        yield "communities", deleted
+
+        # Remaining MENTIONED_IN edges cascade with the Document node
+        yield "document", self.query("DELETE FROM nodes WHERE workspace_id = %s AND id = %s", (ws, document))
+
     def clear_data(self):
         """Clears all data from tables (for testing)."""
         # Order matters due to foreign keys
+        self.query("DROP TABLE IF EXISTS table_cells;")
+        self.query("DROP TABLE IF EXISTS pdf_tables;")
+        self.query("DROP TABLE IF EXISTS chunk_terms;")
+        self.query("DROP TABLE IF EXISTS edge_sources;")
+        self.query("DROP TABLE IF EXISTS node_sources;")
+        self.query("DROP TABLE IF EXISTS chunk_entities;")
+        self.query("DROP TABLE IF EXISTS community_members;")
+        self.query("DROP TABLE IF EXISTS communities;")
         self.query("DROP TABLE IF EXISTS edges;")
         self.query("DROP TABLE IF EXISTS nodes;")
         self.query("DROP TABLE IF EXISTS chunks;")
-        logger.info("All tables dropped. They will be recreated on next run.")
+        self.query("DROP TABLE IF EXISTS schema_version;")
+        TiDBGraph._schema_versions.clear()
+        # Extraction fingerprints refer to the dropped graph; keeping them would skip re-ingested windows
+        removed = clear_duplicate_indexes()
+        # The local vector index is keyed by chunk ids of the dropped chunks table
+        from local_index import clear_local_indexes
+        removed_indexes = clear_local_indexes()
+        logger.info(f"All tables dropped ({removed} extraction index files, {removed_indexes} local vector indexes "
+                    f"removed). They will be recreated on next run.")
@@ -1,15 +1,19 @@
 import os
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # 1. Setup
-from config import EMBEDDING_MODEL
-from tidb_store import TiDBGraph
+from config import (
+    RETRIEVAL_TOP_K, HYBRID_SEARCH, RRF_K,
+    RERANK_ENABLED, RERANK_CANDIDATES, GRAPHRAG_HOPS, GRAPHRAG_MAX_EDGES, VECTOR_BACKEND, VECTOR_MAX_CANDIDATES
+)
+from chunk_store import load_chunks, embed_chunks
+from resources import get_graph, get_embeddings, get_local_index
+from lexical_index import reciprocal_rank_fusion
+from evidence import Evidence, GRAPH
 import sys
 
-def ingest_vectors(file_path: str = None, status_callback=None):
+def ingest_vectors(file_path: str = None, status_callback=None, workspace=None):
     msg = "Loading PDF for Vectorization..."
     print(msg)
     if status_callback: status_callback(msg)
@@ -31,62 +35,128 @@ def ingest_vectors(file_path: str = None, status_callback=None):
         if status_callback: status_callback(msg)
         return
     
-    loader = PyPDFLoader(file_path)
-    docs = loader.load()
-
-    # Split documents
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = splitter.split_documents(docs)
+    # One structure-aware chunking shared with graph extraction (stable chunk keys)
+    chunks = load_chunks(file_path)
     
     msg = f"Created {len(chunks)} text chunks."
     print(msg)
     if status_callback: status_callback(msg)
 
-    # 2. Initialize Embedding Model (HuggingFace)
-    msg = "Initializing HuggingFace Embeddings..."
+    # 2. Generate Embeddings (model is loaded on first use; unchanged spans come from the cache)
+    embeddings_list = embed_chunks(chunks, status_callback=status_callback)
+
+    # 3. Insert into TiDB
+    msg = "Inserting chunks into TiDB..."
     print(msg)
     if status_callback: status_callback(msg)
     
-    # Downloads model locally (cache)
-    embeddings_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    graph = get_graph(workspace)
+    graph.insert_chunks(chunks, embeddings_list)
+    removed = graph.remove_stale_chunks(os.path.basename(file_path), [c["key"] for c in chunks])
+    if removed:
+        msg = f"Removed {removed} chunks from an earlier chunking of this document."
+        print(msg)
+        if status_callback: status_callback(msg)
 
-    # 3. Generate Embeddings Manually
-    msg = "Generating embeddings and inserting into TiDB..."
+    if VECTOR_BACKEND == "local":
+        get_local_index(graph.workspace).sync(graph, status_callback=status_callback)
+
+    msg = "Vector Indexing Complete!"
     print(msg)
     if status_callback: status_callback(msg)
-    
-    graph = TiDBGraph()
-    
-    texts = [c.page_content for c in chunks]
-    embeddings_list = embeddings_model.embed_documents(texts)
-    
-    for i, chunk in enumerate(chunks):
+
+def _vector_rows(graph, query, top_k, file_filters, exclude_ids=None):
+    query_embedding = get_embeddings().embed_query(query)
+    if VECTOR_BACKEND != "local":
+        return graph.search_vectors(query_embedding, top_k=top_k, file_filters=file_filters, exclude_ids=exclude_ids)
+
+    # Local index ranks ids; the text comes from TiDB. Excluded chunks are skipped before their
+    # text is fetched. Chunks deleted since the last sync are missing from TiDB: fetch deeper
+    # until top_k live rows are found, so they don't take result slots.
+    exclude = set(exclude_ids or [])
+    index = get_local_index(graph.workspace)
+    depth = top_k + len(exclude)
+    while True:
+        hits = index.search(query_embedding, top_k=depth, file_filters=file_filters)
+        candidates = [(chunk_id, distance) for chunk_id, distance in hits if chunk_id not in exclude]
+        rows = {row["id"]: row for row in graph.get_chunks([chunk_id for chunk_id, _ in candidates])}
+        results = [{**rows[chunk_id], "distance": distance} for chunk_id, distance in candidates if chunk_id in rows]
+        if len(results) >= top_k or len(hits) < depth or depth >= VECTOR_MAX_CANDIDATES:
+            return results[:top_k]
+        depth = min(depth * 2, VECTOR_MAX_CANDIDATES)
+
+def _candidate_rows(graph, query, top_k, file_filters, exclude_ids=None):
+    """
+    With HYBRID_SEARCH, the BM25 query runs concurrently with embedding + vector search
+    and both candidate lists are fused by reciprocal rank fusion.
+    """
+    if not HYBRID_SEARCH:
+        return _vector_rows(graph, query, top_k, file_filters, exclude_ids)
+
+    # Over-fetch each side so fusion has candidates to promote
+    depth = top_k * 2
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        vector_future = pool.submit(_vector_rows, graph, query, depth, file_filters, exclude_ids)
+        lexical_future = pool.submit(graph.search_lexical, query, depth, file_filters, exclude_ids)
+        vector_rows = vector_future.result()
         try:
-            graph.insert_chunk(
-                content=chunk.page_content,
-                source=chunk.metadata.get("source", "unknown"),
-                page=chunk.metadata.get("page", 0),
-                embedding=embeddings_list[i]
-            )
+            lexical_rows = lexical_future.result()
         except Exception as e:
-            print(f"Error inserting chunk {i}: {e}")
+            # Lexical search is an enhancement; never fail retrieval because of it
+            print(f"Lexical search failed, using vector results only: {e}")
+            lexical_rows = []
 
-    msg = "Vector Indexing Complete!"
-    print(msg)
-    if status_callback: status_callback(msg)
+    return reciprocal_rank_fusion([vector_rows, lexical_rows], k=RRF_K)[:top_k]
+
+def retrieve_chunks(query: str, top_k: int = None, file_filters: list = None, rerank: bool = None, workspace=None,
+                    exclude_ids=None):
+    """
+    Returns the raw chunk rows (id, content, source, page, distance) of a workspace for a query.
+    With reranking on, RERANK_CANDIDATES rows are fetched and the cross-encoder keeps top_k.
+    Chunks in exclude_ids (already in the caller's context) are never fetched again.
+    """
+    top_k = top_k or RETRIEVAL_TOP_K
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    graph = get_graph(workspace)
+
+    if not rerank:
+        return _candidate_rows(graph, query, top_k, file_filters, exclude_ids)
 
-def search_vectors(query: str, file_filters: list = None):
-    """Simple wrapper for vector search using TiDB."""
+    from rerank import get_reranker
+    candidates = _candidate_rows(graph, query, max(RERANK_CANDIDATES, top_k), file_filters, exclude_ids)
     try:
-        embeddings_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-        query_embedding = embeddings_model.embed_query(query)
-        
-        graph = TiDBGraph()
-        results = graph.search_vectors(query_embedding, top_k=5, file_filters=file_filters)
-        
-        return [f"Source: {row['source']} (Page {row['page']})\nContent: {row['content']}" for row in results]
+        return get_reranker().rerank(query, candidates, top_k)
+    except Exception as e:
+        print(f"Reranking failed, keeping retrieval order: {e}")
+        return candidates[:top_k]
+
+def search_vectors(query: str, file_filters: list = None, top_k: int = None, workspace=None, exclude_ids=None):
+    """Simple wrapper for vector search using TiDB. Returns chunk Evidence records (id, source, page, distance)."""
+    try:
+        rows = retrieve_chunks(query, top_k=top_k, file_filters=file_filters, workspace=workspace,
+                               exclude_ids=exclude_ids)
+        return [Evidence.from_chunk(row) for row in rows]
+    except Exception as e:
+        return [Evidence.error(f"Error searching vectors: {e}", query)]
+
+def graphrag_search(query: str, file_filters: list = None, top_k: int = None, workspace=None, exclude_ids=None):
+    """
+    GraphRAG retrieval: vector hits plus the 1-2 hop entity neighborhood of the
+    entities mentioned in those chunks, fetched in one batched query.
+    Returns the chunk records followed by one graph record with the subgraph triples.
+    """
+    try:
+        rows = retrieve_chunks(query, top_k=top_k, file_filters=file_filters, workspace=workspace,
+                               exclude_ids=exclude_ids)
+        docs = [Evidence.from_chunk(row) for row in rows]
+
+        edges = get_graph(workspace).expand_neighborhood([row["id"] for row in rows], hops=GRAPHRAG_HOPS, limit=GRAPHRAG_MAX_EDGES)
+        if edges:
+            triples = tuple((e["source"], e["type"], e["target"]) for e in edges)
+            docs.append(Evidence(GRAPH, query=query, triples=triples))
+        return docs
     except Exception as e:
-        return [f"Error searching vectors: {e}"]
+        return [Evidence.error(f"Error in GraphRAG search: {e}", query)]
 
 if __name__ == "__main__":
     ingest_vectors()
@@ -0,0 +1,26 @@
+import os
+import re
+
+from config import DEFAULT_WORKSPACE, WORKSPACES_DIR
+
+# Existing rows are migrated into this workspace, and its files stay in the original directories
+BASE_WORKSPACE = "default"
+# Workspace ids end up in file paths and the workspace_id columns (VARCHAR(64))
+WORKSPACE_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+def normalize_workspace(workspace=None):
+    """Returns the workspace id to use (DEFAULT_WORKSPACE when None). Raises ValueError if invalid."""
+    workspace = (workspace or DEFAULT_WORKSPACE).strip()
+    if not WORKSPACE_RE.match(workspace):
+        raise ValueError(f"Invalid workspace id: {workspace!r} (letters, digits, '-' and '_', up to 64 characters)")
+    return workspace
+
+def workspace_dir(base_dir, workspace=None):
+    """
+    Local directory of a workspace: base_dir itself for BASE_WORKSPACE (so existing data
+    stays where it is), data/workspaces/<workspace>/<name> for the others.
+    """
+    workspace = normalize_workspace(workspace)
+    if workspace == BASE_WORKSPACE:
+        return base_dir
+    return os.path.join(WORKSPACES_DIR, workspace, os.path.basename(base_dir))
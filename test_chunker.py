@@ -0,0 +1,61 @@
+import os
+import sys
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from chunker import is_heading, split_units, chunk_pages, group_windows
+
+def count_words(texts):
+    return [len(t.split()) for t in texts]
+
+class TestChunker(unittest.TestCase):
+    def test_is_heading(self):
+        self.assertTrue(is_heading("Item 7. Management's Discussion"))
+        self.assertTrue(is_heading("RISK FACTORS"))
+        self.assertTrue(is_heading("Revenue Recognition"))
+        self.assertFalse(is_heading("Revenue grew by ten percent in the third quarter."))
+
+    def test_split_units(self):
+        text = "RISK FACTORS\nSupply is tight. Prices rose.\n\nDemand fell."
+        units = [(kind, text[s:e]) for kind, s, e in split_units(text)]
+        self.assertEqual(units, [
+            ("heading", "RISK FACTORS"),
+            ("sentence", "Supply is tight."),
+            ("sentence", "Prices rose."),
+            ("sentence", "Demand fell."),
+        ])
+
+    def test_chunks_respect_budget_headings_and_pages(self):
+        text = "OVERVIEW\n" + " ".join(f"Sentence number {i} is here." for i in range(20)) + "\n\nOUTLOOK\nGrowth ahead."
+        chunks = chunk_pages([(1, text), (2, "Another page starts.")], "hash", count_words,
+                             max_tokens=20, overlap_tokens=5)
+        self.assertTrue(all(c["tokens"] <= 20 for c in chunks))
+        self.assertEqual([c["heading"] for c in chunks][-2:], ["OUTLOOK", "OUTLOOK"])
+        self.assertEqual(chunks[-1]["page"], 2)
+        for c in chunks:
+            page_text = text if c["page"] == 1 else "Another page starts."
+            self.assertEqual(page_text[c["start"]:c["end"]], c["text"])
+        # Neighbours on the same heading overlap by the carried sentence
+        self.assertLess(chunks[1]["start"], chunks[0]["end"])
+
+    def test_keys_are_stable(self):
+        pages = [(1, "First sentence here. Second sentence here.")]
+        first = chunk_pages(pages, "hash", count_words)
+        self.assertEqual([c["key"] for c in first], [c["key"] for c in chunk_pages(pages, "hash", count_words)])
+        self.assertNotEqual(first[0]["key"], chunk_pages(pages, "other", count_words)[0]["key"])
+
+    def test_long_sentence_is_split(self):
+        chunks = chunk_pages([(1, " ".join(["word"] * 50) + ".")], "hash", count_words, max_tokens=20)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(c["tokens"] <= 20 for c in chunks))
+
+    def test_group_windows_drops_overlap(self):
+        text = " ".join(f"Sentence number {i} is here." for i in range(12))
+        chunks = chunk_pages([(1, text)], "hash", count_words, max_tokens=20, overlap_tokens=5)
+        windows = group_windows(chunks, max_tokens=1000)
+        self.assertEqual(len(windows), 1)
+        self.assertEqual(windows[0]["text"], text)
+        self.assertEqual(windows[0]["keys"], [c["key"] for c in chunks])
+
+if __name__ == '__main__':
+    unittest.main()
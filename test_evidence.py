@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from evidence import Evidence, CHUNK, GRAPH, add_evidence, chunk_ids, format_context
+
+def chunk(chunk_id, distance=0.1):
+    return Evidence.from_chunk({"id": chunk_id, "content": f"text {chunk_id}", "source": "a.pdf", "page": 1,
+                                "distance": distance})
+
+class TestAddEvidence(unittest.TestCase):
+    def test_appends_new_records_only(self):
+        existing = [chunk(1)]
+        result = add_evidence(existing, [chunk(1, 0.5), chunk(2), chunk(2)])
+        self.assertEqual(chunk_ids(result), [1, 2])
+
+    def test_does_not_mutate_previous_state(self):
+        existing = [chunk(1)]
+        result = add_evidence(existing, [chunk(2)])
+        self.assertEqual(chunk_ids(existing), [1])
+        self.assertIsNot(result, existing)
+
+    def test_nothing_added_returns_previous_list(self):
+        existing = [chunk(1)]
+        self.assertIs(add_evidence(existing, []), existing)
+        self.assertIs(add_evidence(existing, [chunk(1, 0.5)]), existing)
+
+    def test_empty_state(self):
+        self.assertEqual(chunk_ids(add_evidence(None, [chunk(3)])), [3])
+        self.assertEqual(add_evidence(None, None), [])
+
+    def test_keys_by_kind(self):
+        graph = Evidence(GRAPH, query="Acme", triples=(("Acme", "OWNS", "Beta"),))
+        same = Evidence(GRAPH, query="Acme Corp", triples=(("Acme", "OWNS", "Beta"),))
+        self.assertEqual(len(add_evidence([graph], [same])), 1)
+        self.assertEqual(chunk(1).key, (CHUNK, 1))
+
+class TestFormatContext(unittest.TestCase):
+    def test_keeps_whole_records_up_to_limit(self):
+        documents = [chunk(1), chunk(2)]
+        full = format_context(documents)
+        self.assertIn("text 1", full)
+        self.assertIn("text 2", full)
+        limited = format_context(documents, max_chars=len(full) - 1)
+        self.assertIn("text 1", limited)
+        self.assertNotIn("text 2", limited)
+
+if __name__ == '__main__':
+    unittest.main()
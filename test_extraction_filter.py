@@ -0,0 +1,88 @@
+import os
+import sys
+import tempfile
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from extraction_filter import (
+    SHINGLE_WORDS, DuplicateIndex, minhash, jaccard_estimate, boilerplate_share, is_table_of_contents,
+    repeated_lines, strip_lines, entity_density, _PRIME
+)
+
+WORDS = [f"word{i}" for i in range(400)]
+
+def text(start, stop):
+    return " ".join(WORDS[start:stop])
+
+def exact_jaccard(a, b):
+    def shingles(t):
+        words = t.split()
+        return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    a, b = shingles(a), shingles(b)
+    return len(a & b) / len(a | b)
+
+class TestMinHash(unittest.TestCase):
+    def test_values_stay_below_the_prime(self):
+        signature = minhash(text(0, 300))
+        self.assertTrue((signature < _PRIME).all())
+
+    def test_estimates_track_exact_jaccard(self):
+        pairs = [(text(0, 200), text(s, s + 200)) for s in (0, 20, 50, 100, 150, 200)]
+        errors = []
+        for a, b in pairs:
+            exact = exact_jaccard(a, b)
+            estimate = jaccard_estimate(minhash(a), minhash(b))
+            self.assertAlmostEqual(estimate, exact, delta=0.2)
+            errors.append(abs(estimate - exact))
+        self.assertLess(sum(errors) / len(errors), 0.08)
+        self.assertEqual(jaccard_estimate(minhash(text(0, 200)), minhash(text(0, 200))), 1.0)
+
+class TestDuplicateIndex(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.index = DuplicateIndex(path=os.path.join(tmp.name, "minhash.sqlite"))
+
+    def test_near_duplicate_of_another_document(self):
+        self.index.add("k1", "a.pdf", minhash(text(0, 200)), extraction={"nodes": [], "relationships": []})
+        similarity, key = self.index.best_match(minhash(text(5, 205)), exclude_document="b.pdf")
+        self.assertEqual(key, "k1")
+        self.assertGreater(similarity, 0.8)
+        self.assertEqual(self.index.best_match(minhash(text(5, 205)), exclude_document="a.pdf"), (0.0, None))
+        self.assertEqual(self.index.extraction("k1"), {"nodes": [], "relationships": []})
+
+    def test_deferred_windows(self):
+        self.index.defer("a.pdf", ["k1", "k2"])
+        self.index.add("k1", "a.pdf", minhash(text(0, 50)))
+        self.assertEqual(self.index.deferred("a.pdf"), {"k2"})
+        self.index.remove_document("a.pdf")
+        self.assertEqual(self.index.deferred("a.pdf"), set())
+        self.assertIsNone(self.index.extraction("k1"))
+
+class TestBoilerplate(unittest.TestCase):
+    def test_boilerplate_share(self):
+        sentences = ("This report contains forward-looking statements about our plans. "
+                     "Actual results may differ materially from expectations. "
+                     "Acme acquired Beta Corp for two billion dollars.")
+        self.assertAlmostEqual(boilerplate_share(sentences), 2 / 3)
+
+    def test_table_of_contents(self):
+        toc = "\n".join(["Item 1. Business ........ 3", "Item 1A. Risk Factors ..... 12",
+                         "Item 7. Management's Discussion ..... 40", "Item 8. Financial Statements ..... 61"])
+        self.assertTrue(is_table_of_contents(toc))
+        self.assertFalse(is_table_of_contents("Acme grew.\nBeta shrank.\nGamma held.\nDelta left."))
+
+    def test_repeated_lines_are_stripped(self):
+        segments = ["Cloud", "Retail", "Energy", "Mining", "Health", "Media", "Travel", "Banking", "Food", "Games"]
+        windows = [{"text": f"ACME CORP ANNUAL REPORT 2024\n{segment} results are discussed.\nPage {i}"}
+                   for i, segment in enumerate(segments)]
+        fingerprints = repeated_lines(windows)
+        self.assertEqual(strip_lines(windows[3]["text"], fingerprints), "Mining results are discussed.")
+
+    def test_entity_density(self):
+        self.assertEqual(entity_density(""), 0.0)
+        self.assertGreater(entity_density("The deal between Acme Corp and NVIDIA closed with Beta Holdings."),
+                           entity_density("the deal between the two companies closed last year without issues."))
+
+if __name__ == '__main__':
+    unittest.main()
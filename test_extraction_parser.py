@@ -0,0 +1,64 @@
+import os
+import sys
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from extraction_parser import IncrementalJSONParser, parse_partial, validate_extraction
+
+class TestParsePartial(unittest.TestCase):
+    def test_complete_object(self):
+        data, complete = parse_partial('Here you go: {"nodes": [{"id": "A", "type": "Org"}]} Done.')
+        self.assertTrue(complete)
+        self.assertEqual(data, {"nodes": [{"id": "A", "type": "Org"}]})
+
+    def test_trailing_comma(self):
+        data, complete = parse_partial('{"nodes": [{"id": "A"},]}')
+        self.assertTrue(complete)
+        self.assertEqual(data["nodes"], [{"id": "A"}])
+
+    def test_cut_off_element_is_dropped(self):
+        data, complete = parse_partial('{"nodes":[{"id":"A","type":"Org"},{"id":"B","ty')
+        self.assertFalse(complete)
+        self.assertEqual(data, {"nodes": [{"id": "A", "type": "Org"}]})
+
+    def test_cut_off_inside_second_list(self):
+        data, complete = parse_partial('{"nodes":[{"id":"A"}],"relationships":[{"source":"A","tar')
+        self.assertFalse(complete)
+        self.assertEqual(data, {"nodes": [{"id": "A"}], "relationships": []})
+
+    def test_cut_off_inside_string(self):
+        data, complete = parse_partial('{"nodes":[{"id":"A"},{"id":"Acme, In')
+        self.assertFalse(complete)
+        self.assertEqual(data["nodes"], [{"id": "A"}])
+
+    def test_no_json(self):
+        self.assertEqual(parse_partial("no json here"), (None, False))
+
+    def test_streamed_pieces(self):
+        parser = IncrementalJSONParser()
+        for piece in ['{"nodes": [', '{"id": "A"}', ', {"id": "B"}', ']}']:
+            parser.feed(piece)
+        self.assertEqual(parser.value(), ({"nodes": [{"id": "A"}, {"id": "B"}]}, True))
+
+class TestValidateExtraction(unittest.TestCase):
+    def test_keeps_well_formed_items(self):
+        result, dropped = validate_extraction({
+            "nodes": [{"id": "A", "type": "Org"}, "B", {"name": "C"}, {"type": "Org"}, {"id": "A"}],
+            "relationships": [{"source": "A", "target": "B", "type": "OWNS"}, {"source": "A"}, "bad"],
+        })
+        self.assertEqual(result["nodes"], [
+            {"id": "A", "type": "Org"}, {"id": "B", "type": "Unknown"}, {"id": "C", "type": "Unknown"}
+        ])
+        self.assertEqual(result["relationships"], [{"source": "A", "target": "B", "type": "OWNS"}])
+        self.assertEqual(dropped, 3)
+
+    def test_edges_alias_and_defaults(self):
+        result, dropped = validate_extraction({"edges": [{"source": "A", "target": 2023}]})
+        self.assertEqual(result["relationships"], [{"source": "A", "target": "2023", "type": "RELATED_TO"}])
+        self.assertEqual(dropped, 0)
+
+    def test_not_a_dict(self):
+        self.assertEqual(validate_extraction(["A"]), ({"nodes": [], "relationships": []}, 1))
+
+if __name__ == '__main__':
+    unittest.main()
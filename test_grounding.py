@@ -0,0 +1,67 @@
+import os
+import sys
+import unittest
+from unittest import mock
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+import grounding
+from grounding import grounding_check, question_relevance, paraphrased
+
+DOCUMENTS = [
+    "NovaSystems reported revenue of 4.2 billion dollars in fiscal 2023. "
+    "The company expanded its cloud services division into Europe.",
+    "Supply chain disruptions remain the largest operational risk for NovaSystems.",
+]
+
+class FakeEmbeddings:
+    """Maps sentences about growth abroad and about cloud expansion to the same direction."""
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] if any(w in t.lower() for w in ("cloud", "overseas")) else [0.0, 1.0] for t in texts]
+
+@mock.patch.object(grounding, "GROUNDING_EMBEDDING_SIMILARITY", 0)
+class TestGroundingCheck(unittest.TestCase):
+    def test_supported_answer_is_approved(self):
+        answer = "NovaSystems reported revenue of 4.2 billion dollars in fiscal 2023."
+        verdict, score, unsupported = grounding_check(answer, DOCUMENTS, "What revenue did NovaSystems report?")
+        self.assertEqual((verdict, score, unsupported), ("APPROVED", 1.0, []))
+
+    def test_unsupported_answer_is_rejected(self):
+        answer = "Quantum batteries power every factory on Mars. Penguins manage the treasury department."
+        verdict, score, unsupported = grounding_check(answer, DOCUMENTS)
+        self.assertEqual(verdict, "REJECTED")
+        self.assertEqual(len(unsupported), 2)
+
+    def test_refusal_is_never_rejected(self):
+        answer = "The documents do not mention the dividend policy. Penguins manage the treasury department."
+        verdict, _, _ = grounding_check(answer, DOCUMENTS)
+        self.assertNotEqual(verdict, "REJECTED")
+
+    def test_off_topic_answer_is_not_approved(self):
+        answer = "Supply chain disruptions remain the largest operational risk for NovaSystems."
+        verdict, score, _ = grounding_check(answer, DOCUMENTS, "Who is the chief executive officer?")
+        self.assertIsNone(verdict)
+        self.assertEqual(score, 1.0)
+
+    def test_question_relevance(self):
+        self.assertEqual(question_relevance("", "anything"), 1.0)
+        self.assertAlmostEqual(question_relevance("NovaSystems revenue", "Revenue was 4.2 billion."), 0.5)
+
+@mock.patch.object(grounding, "get_embeddings", FakeEmbeddings)
+class TestParaphrased(unittest.TestCase):
+    def test_paraphrase_is_supported(self):
+        answer = "The firm grew its overseas business substantially."
+        verdict, score, unsupported = grounding_check(answer, DOCUMENTS)
+        self.assertEqual((verdict, score, unsupported), ("APPROVED", 1.0, []))
+
+    def test_new_figures_are_not_paraphrases(self):
+        doc_unigrams = set(grounding.tokenize(" ".join(DOCUMENTS)))
+        self.assertEqual(paraphrased(["Its overseas revenue reached 7.9 billion."], DOCUMENTS, doc_unigrams), [])
+        self.assertEqual(paraphrased(["Its overseas revenue reached 4.2 billion."], DOCUMENTS, doc_unigrams),
+                         ["Its overseas revenue reached 4.2 billion."])
+
+    def test_disabled_by_zero_threshold(self):
+        doc_unigrams = set(grounding.tokenize(" ".join(DOCUMENTS)))
+        self.assertEqual(paraphrased(["It grew overseas."], DOCUMENTS, doc_unigrams, threshold=0), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from quantization import parse_vector, quantize, dequantize, approximate_scores, normalize, bytes_per_vector
+import local_index
+from local_index import LocalVectorIndex, clear_local_indexes
+
+class FakeGraph:
+    """Answers the three queries LocalVectorIndex.sync issues from an in-memory chunks table."""
+    workspace = "default"
+
+    def __init__(self, vectors, created="2026-01-01 00:00:00"):
+        self.rows = {i + 1: {"document": "a.pdf" if i % 2 else "b.pdf", "embedding": v} for i, v in enumerate(vectors)}
+        self.created = created
+
+    def query(self, sql, params=()):
+        if "information_schema" in sql:
+            return [{"created": self.created}]
+        if sql.startswith("SELECT id FROM"):
+            last_id, limit = params[1], params[2]
+            return [{"id": i} for i in sorted(self.rows) if i > last_id][:limit]
+        ids = params[1:]
+        return [{"id": i, "document": self.rows[i]["document"],
+                 "embedding": "[" + ",".join(repr(x) for x in self.rows[i]["embedding"].tolist()) + "]"}
+                for i in ids if i in self.rows]
+
+class TestQuantization(unittest.TestCase):
+    def test_parse_vector(self):
+        np.testing.assert_array_equal(parse_vector("[0.5,-1,2]"), np.array([0.5, -1, 2], dtype="float32"))
+        self.assertIsNone(parse_vector(None))
+
+    def test_int8_round_trip_and_scores(self):
+        vectors = normalize(np.random.default_rng(0).normal(size=(50, 32)))
+        codes, scales = quantize(vectors, "int8")
+        self.assertEqual(codes.dtype, np.int8)
+        self.assertLess(np.abs(dequantize(codes, scales) - vectors).max(), 0.01)
+        query = vectors[3]
+        np.testing.assert_allclose(approximate_scores(codes, scales, query), vectors @ query, atol=0.02)
+
+    def test_unknown_dtype(self):
+        with self.assertRaises(ValueError):
+            quantize(np.zeros((1, 4)), "int4")
+        self.assertEqual(bytes_per_vector("int8", 384), 388)
+
+class TestLocalVectorIndex(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = os.path.join(tmp.name, "index")
+        self.vectors = normalize(np.random.default_rng(1).normal(size=(200, 16)))
+        self.graph = FakeGraph(self.vectors)
+
+    def exact_top(self, query, k):
+        return [int(i) + 1 for i in np.argsort(-(self.vectors @ query))[:k]]
+
+    def test_rescored_search_matches_exact_order(self):
+        index = LocalVectorIndex(root=self.root)
+        self.assertEqual(index.sync(self.graph, dtype="int8"), 200)
+        query = self.vectors[10] + 0.1 * self.vectors[20]
+        hits = index.search(query, top_k=5)
+        self.assertEqual([i for i, _ in hits], self.exact_top(normalize(query), 5))
+        self.assertAlmostEqual(hits[0][1], 1.0 - float(self.vectors[10] @ normalize(query)), places=5)
+
+    def test_file_filters_and_tombstones(self):
+        index = LocalVectorIndex(root=self.root)
+        index.sync(self.graph, dtype="float16")
+        hits = index.search(self.vectors[0], top_k=10, file_filters=["a.pdf"])
+        self.assertTrue(all(i % 2 == 0 for i, _ in hits))
+        del self.graph.rows[2]
+        self.assertEqual(index.sync(self.graph), 0)
+        self.assertNotIn(2, [i for i, _ in index.search(self.vectors[1], top_k=5)])
+        self.assertEqual(index.stats()["deleted"], 1)
+
+    def test_recreated_table_rebuilds(self):
+        index = LocalVectorIndex(root=self.root)
+        index.sync(self.graph, dtype="int8")
+        self.graph.created = "2026-02-01 00:00:00"
+        self.assertEqual(index.sync(self.graph), 200)
+        self.assertEqual(index.stats()["count"], 200)
+
+    def test_clear_removes_every_workspace_index(self):
+        base = os.path.dirname(self.root)
+        workspaces = os.path.join(base, "workspaces")
+        other = os.path.join(workspaces, "client-a", "index")
+        LocalVectorIndex(root=self.root).sync(self.graph, dtype="int8")
+        LocalVectorIndex(root=other).sync(self.graph, dtype="int8")
+        with mock.patch.object(local_index, "LOCAL_INDEX_DIR", self.root), \
+                mock.patch.object(local_index, "WORKSPACES_DIR", workspaces):
+            self.assertEqual(clear_local_indexes(), 2)
+        self.assertFalse(os.path.exists(self.root) or os.path.exists(other))
+
+if __name__ == '__main__':
+    unittest.main()
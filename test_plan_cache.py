@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from mysql.connector import ProgrammingError, OperationalError
+from plan_cache import QueryPlanCache, normalize_question
+from sql_guard import UnsafeQueryError
+
+SQL = "SELECT t.name FROM edges e JOIN nodes s ON e.source = s.id JOIN nodes t ON e.target = t.id WHERE s.name = '{}'"
+
+class TestNormalizeQuestion(unittest.TestCase):
+    def test_entities_become_placeholders(self):
+        template, entities = normalize_question("Who owns NovaSystems?")
+        self.assertEqual(template, "who owns <e0>")
+        self.assertEqual(entities, ["NovaSystems"])
+        self.assertEqual(normalize_question("Who owns CyberDyne Labs?")[0], template)
+
+class TestQueryPlanCache(unittest.TestCase):
+    def test_hit_substitutes_new_entity(self):
+        cache = QueryPlanCache()
+        cache.record_success("Who owns NovaSystems?", SQL.format("NovaSystems"))
+        self.assertEqual(cache.lookup("Who owns CyberDyne Labs?"), SQL.format("CyberDyne Labs"))
+        self.assertEqual(cache.stats["hits"], 1)
+
+    def test_sql_without_the_entity_is_cached_for_the_exact_question_only(self):
+        cache = QueryPlanCache()
+        cache.record_success("Who owns NovaSystems?", SQL.format("Nova Systems Inc"))
+        self.assertIsNone(cache.lookup("Who owns CyberDyne?"))
+        self.assertEqual(cache.lookup("who owns  NovaSystems?"), SQL.format("Nova Systems Inc"))
+
+    def test_failed_plan_is_not_served_and_sql_is_negatively_cached(self):
+        cache = QueryPlanCache()
+        cache.record_success("Who owns NovaSystems?", SQL.format("NovaSystems"))
+        cache.record_failure("Who owns NovaSystems?", SQL.format("NovaSystems"), ProgrammingError("bad column"))
+        self.assertIsNone(cache.lookup("Who owns CyberDyne?"))
+        self.assertEqual(cache.known_failure(SQL.format("NovaSystems") + ";"), "bad column")
+        self.assertEqual(cache.failures_for("Who owns CyberDyne?"), [(SQL.format("NovaSystems"), "bad column")])
+
+    def test_transient_failures_are_not_cached(self):
+        cache = QueryPlanCache()
+        cache.record_failure("Who owns NovaSystems?", "SELECT 1 FROM nodes", OperationalError("lost connection"))
+        self.assertIsNone(cache.known_failure("SELECT 1 FROM nodes"))
+        self.assertEqual(cache.stats["transient_failures"], 1)
+        cache.record_failure("Who owns NovaSystems?", "SELECT 1 FROM nodes", UnsafeQueryError("rejected"))
+        self.assertEqual(cache.known_failure("SELECT 1 FROM nodes"), "rejected")
+
+    def test_evicts_least_recently_used(self):
+        cache = QueryPlanCache(max_entries=2)
+        cache.record_success("Who owns NovaSystems?", SQL.format("NovaSystems"))
+        cache.record_success("List all risks", "SELECT name FROM nodes WHERE type = 'Risk'")
+        cache.lookup("Who owns CyberDyne?")
+        cache.record_success("List all subsidiaries", "SELECT name FROM nodes WHERE type = 'Subsidiary'")
+        self.assertEqual([p["template"] for p in cache.summary()["plans"]], ["who owns <e0>", "list all subsidiaries"])
+
+if __name__ == '__main__':
+    unittest.main()
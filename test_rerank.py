@@ -0,0 +1,54 @@
+import os
+import sys
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from rerank import Reranker
+
+class FakeCrossEncoder:
+    """Scores a pair by the number in the chunk text, so the expected order is known."""
+    def __init__(self):
+        self.pairs = []
+
+    def predict(self, pairs, batch_size=None):
+        self.pairs.extend(pairs)
+        return [float(text.split()[-1]) for _, text in pairs]
+
+def rows(*scores):
+    return [{"id": i, "content": f"chunk {score}"} for i, score in enumerate(scores)]
+
+class TestReranker(unittest.TestCase):
+    def setUp(self):
+        self.reranker = Reranker(model_name="fake", budget_ms=100, cache_size=10)
+        self.model = self.reranker._model = FakeCrossEncoder()
+
+    def test_orders_by_score_and_caches(self):
+        ranked = self.reranker.rerank("q", rows(1, 3, 2), top_k=2)
+        self.assertEqual([r["id"] for r in ranked], [1, 2])
+        self.assertEqual(ranked[0]["rerank_score"], 3.0)
+        self.reranker.rerank("q", rows(1, 3, 2), top_k=2)
+        self.assertEqual(len(self.model.pairs), 3)
+        self.assertEqual(self.reranker.stats["cache_hits"], 3)
+
+    def test_over_budget_reranks_a_prefix(self):
+        self.reranker._ms_per_pair = 50.0  # two pairs fit the 100ms budget
+        ranked = self.reranker.rerank("q", rows(1, 2, 9, 8), top_k=4)
+        self.assertEqual([r["id"] for r in ranked], [1, 0, 2, 3])
+        self.assertEqual(len(self.model.pairs), 2)
+        self.assertEqual(self.reranker.stats["partial"], 1)
+        self.assertNotIn("rerank_score", ranked[2])
+
+    def test_cached_pairs_do_not_count_against_budget(self):
+        self.reranker.rerank("q", rows(1, 2), top_k=2)
+        self.reranker._ms_per_pair = 100.0  # one new pair fits
+        ranked = self.reranker.rerank("q", rows(1, 2, 9, 8), top_k=4)
+        self.assertEqual([r["id"] for r in ranked], [2, 1, 0, 3])
+        self.assertEqual(self.reranker.stats["partial"], 1)
+
+    def test_cache_is_bounded(self):
+        self.reranker.cache_size = 2
+        self.reranker.rerank("q", rows(1, 2, 3), top_k=3)
+        self.assertEqual(len(self.reranker._cache), 2)
+
+if __name__ == '__main__':
+    unittest.main()
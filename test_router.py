@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+import router
+from router import EmbeddingRouter, rule_route, log_decision
+
+class FakeEmbeddings:
+    """Questions about owners point one way, questions about risks the other."""
+    def embed_documents(self, texts):
+        return [[1.0, 0.1] if "own" in t.lower() else [0.1, 1.0] if "risk" in t.lower() else [1.0, 1.0]
+                for t in texts]
+
+class TestRuleRoute(unittest.TestCase):
+    def test_single_matching_rule(self):
+        self.assertEqual(rule_route("What are the main themes across all filings?"), "GlobalSearch")
+        self.assertEqual(rule_route("Who owns NovaSystems?"), "GraphSearch")
+        self.assertEqual(rule_route("What was the revenue in Q3 2023?"), "GraphSearch")
+        self.assertEqual(rule_route("Describe the supply chain risks"), "VectorSearch")
+
+    def test_no_or_conflicting_rules_fall_through(self):
+        self.assertIsNone(rule_route("Tell me about NovaSystems"))
+        self.assertIsNone(rule_route("Describe the risks of the parent company"))
+
+class TestEmbeddingRouter(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for name, value in [("ROUTER_DIR", tmp.name),
+                            ("DECISIONS_PATH", os.path.join(tmp.name, "decisions.jsonl")),
+                            ("MODEL_PATH", os.path.join(tmp.name, "centroids.json")),
+                            ("get_embeddings", FakeEmbeddings)]:
+            patcher = mock.patch.object(router, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_untrained_router_defers(self):
+        self.assertEqual(EmbeddingRouter().predict("Who owns Acme?"), (None, 0.0))
+
+    def test_trained_router_predicts_only_when_confident(self):
+        for i in range(5):
+            log_decision(f"Who owns company {i}?", "GraphSearch")
+            log_decision(f"What risk number {i} matters?", "VectorSearch")
+        log_decision("Hello", "GenerateAnswer")  # not a routable step: never logged
+        model = EmbeddingRouter()
+        model.train()
+        self.assertEqual(model.predict("Who owns Acme?")[0], "GraphSearch")
+        self.assertEqual(model.predict("Which risk is largest?")[0], "VectorSearch")
+        step, similarity = model.predict("Tell me everything")
+        self.assertIsNone(step)
+        self.assertGreater(similarity, 0.0)
+
+if __name__ == '__main__':
+    unittest.main()
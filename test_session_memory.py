@@ -0,0 +1,83 @@
+import os
+import sys
+import unittest
+from unittest import mock
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from evidence import Evidence
+from session_memory import SessionMemory, condense_question, is_follow_up
+
+class FakeEmbeddings:
+    """Deterministic 2-d embeddings: texts mentioning "revenue" point one way, others the other."""
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0] if "revenue" in text.lower() else [0.0, 1.0]
+
+def chunk(chunk_id, words=30, topic="revenue"):
+    return Evidence.from_chunk({"id": chunk_id, "content": " ".join([topic] * words), "source": "a.pdf",
+                                "page": 1, "distance": 0.2})
+
+class TestCondenseQuestion(unittest.TestCase):
+    previous = ["What was Acme's revenue in 2023?"]
+
+    def test_follow_ups(self):
+        self.assertTrue(is_follow_up("And the operating margin?"))
+        self.assertTrue(is_follow_up("Their largest acquisition?"))
+        self.assertTrue(is_follow_up("What was its revenue growth over the prior year?"))
+        self.assertTrue(is_follow_up("Why?"))
+
+    def test_standalone_question_with_demonstrative_is_not_rewritten(self):
+        question = "What is the revenue of Acme in that year?"
+        self.assertFalse(is_follow_up(question))
+        self.assertEqual(condense_question(question, self.previous), question)
+        question = "Which risks does NVIDIA list in this filing?"
+        self.assertEqual(condense_question(question, self.previous), question)
+
+    def test_follow_up_gets_earlier_questions(self):
+        condensed = condense_question("What about its margin?", self.previous)
+        self.assertTrue(condensed.startswith("What about its margin?"))
+        self.assertIn(self.previous[0], condensed)
+
+    def test_first_question_is_unchanged(self):
+        self.assertEqual(condense_question("What about its margin?", []), "What about its margin?")
+
+@mock.patch("session_memory.get_embeddings", FakeEmbeddings)
+class TestSessionMemory(unittest.TestCase):
+    def test_evicts_least_recently_used_over_budget(self):
+        memory = SessionMemory(budget_tokens=100)
+        memory.remember([chunk(1), chunk(2)])
+        memory.remember([chunk(1)])  # touched again: chunk 2 is now the oldest
+        memory.remember([chunk(3)])
+        self.assertLessEqual(memory.tokens, 100)
+        self.assertEqual([key[1] for key in memory.entries], [1, 3])
+
+    def test_skips_records_larger_than_budget(self):
+        memory = SessionMemory(budget_tokens=10)
+        memory.remember([chunk(1)])
+        self.assertEqual(len(memory), 0)
+        self.assertEqual(memory.tokens, 0)
+
+    def test_recall_rescores_against_new_question(self):
+        memory = SessionMemory()
+        memory.remember([chunk(1), chunk(2, topic="risk")])
+        documents, best = memory.recall("revenue by segment")
+        self.assertEqual([d.chunk_id for d in documents], [1])
+        self.assertAlmostEqual(best, 1.0)
+        self.assertAlmostEqual(documents[0].score, 0.0)
+
+    def test_start_turn_keeps_question_and_clears_on_scope_change(self):
+        memory = SessionMemory()
+        memory.start_turn("What was Acme's revenue in 2023?", "default", [])
+        memory.remember([chunk(1)])
+        state = memory.start_turn("And its margin?", "default", [])
+        self.assertNotIn("question", state)
+        self.assertIn("Acme", state["retrieval_query"])
+        self.assertEqual(state["recalled"], 1)
+        state = memory.start_turn("And its margin?", "other", [])
+        self.assertEqual(state["recalled"], 0)
+        self.assertEqual(state["retrieval_query"], "And its margin?")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from sql_guard import validate_sql, scope_to_workspace, apply_limits, UnsafeQueryError
+
+class TestValidateSql(unittest.TestCase):
+    def test_accepts_select_and_strips_semicolon(self):
+        self.assertEqual(validate_sql("SELECT id, name FROM nodes WHERE type = 'Org';"),
+                         "SELECT id, name FROM nodes WHERE type = 'Org'")
+
+    def test_accepts_cte(self):
+        validate_sql("WITH orgs AS (SELECT id FROM nodes) SELECT id FROM orgs")
+
+    def test_rejects_writes_and_multiple_statements(self):
+        for sql in ["DELETE FROM nodes", "SELECT id FROM nodes; DROP TABLE nodes",
+                    "SELECT id INTO OUTFILE '/tmp/x' FROM nodes", "SELECT SLEEP(10) FROM nodes"]:
+            with self.assertRaises(UnsafeQueryError, msg=sql):
+                validate_sql(sql)
+
+    def test_keywords_inside_literals_are_allowed(self):
+        validate_sql("SELECT id FROM nodes WHERE name LIKE '%Drop; Update%'")
+
+    def test_rejects_comments_unknown_tables_and_embeddings(self):
+        for sql in ["SELECT id FROM nodes -- x", "SELECT * FROM chunk_terms", "SELECT * FROM mysql.user",
+                    "SELECT embedding FROM nodes", "SELECT * FROM chunks", "SELECT 1"]:
+            with self.assertRaises(UnsafeQueryError, msg=sql):
+                validate_sql(sql)
+
+class TestApplyLimits(unittest.TestCase):
+    def test_adds_limit_and_hint(self):
+        self.assertEqual(apply_limits("SELECT id FROM nodes", max_rows=50, max_execution_ms=1000),
+                         "SELECT /*+ MAX_EXECUTION_TIME(1000) */ id FROM nodes LIMIT 50")
+
+    def test_clamps_large_limit_and_keeps_offset(self):
+        self.assertTrue(apply_limits("SELECT id FROM nodes LIMIT 20, 1000", max_rows=50)
+                        .endswith("LIMIT 50 OFFSET 20"))
+        self.assertTrue(apply_limits("SELECT id FROM nodes LIMIT 10", max_rows=50).endswith("LIMIT 10"))
+
+    def test_with_query_gets_no_hint(self):
+        sql = apply_limits("WITH o AS (SELECT id FROM nodes) SELECT id FROM o", max_rows=5)
+        self.assertNotIn("MAX_EXECUTION_TIME", sql)
+        self.assertTrue(sql.endswith("LIMIT 5"))
+
+class TestScopeToWorkspace(unittest.TestCase):
+    def test_aliased_tables(self):
+        sql = scope_to_workspace(
+            "SELECT s.id, t.id FROM edges e JOIN nodes s ON e.source = s.id JOIN nodes t ON e.target = t.id",
+            "client-a"
+        )
+        self.assertEqual(sql,
+            "SELECT s.id, t.id FROM (SELECT * FROM edges WHERE workspace_id = 'client-a') AS e "
+            "JOIN (SELECT * FROM nodes WHERE workspace_id = 'client-a') AS s ON e.source = s.id "
+            "JOIN (SELECT * FROM nodes WHERE workspace_id = 'client-a') AS t ON e.target = t.id")
+
+    def test_unaliased_table_keeps_its_name(self):
+        sql = scope_to_workspace("SELECT id FROM nodes WHERE type = 'Org'", "default")
+        self.assertEqual(sql, "SELECT id FROM (SELECT * FROM nodes WHERE workspace_id = 'default') AS nodes "
+                              "WHERE type = 'Org'")
+
+    def test_table_names_in_literals_are_ignored(self):
+        sql = scope_to_workspace("SELECT id FROM nodes WHERE id = 'from edges'", "default")
+        self.assertIn("'from edges'", sql)
+        self.assertEqual(sql.count("workspace_id"), 1)
+
+    def test_cte_names_are_not_scoped(self):
+        sql = scope_to_workspace("WITH orgs AS (SELECT id FROM nodes) SELECT id FROM orgs", "default")
+        self.assertEqual(sql.count("workspace_id"), 1)
+        self.assertTrue(sql.endswith("SELECT id FROM orgs"))
+
+    def test_comma_join_is_rejected(self):
+        with self.assertRaises(UnsafeQueryError):
+            scope_to_workspace("SELECT * FROM nodes n, edges e WHERE e.source = n.id", "default")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import unittest
+from unittest import mock
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+import tables
+from tables import parse_number, structure_table, ingest_tables
+
+class FakeGraph:
+    workspace = "default"
+
+    def __init__(self):
+        self.saved = {}
+
+    def save_tables(self, document, found):
+        self.saved[document] = found
+        return sum(len(row["cells"]) for _, _, _, structured in found for row in structured["rows"])
+
+class TestParseNumber(unittest.TestCase):
+    def test_financial_formats(self):
+        self.assertEqual(parse_number("$1,234.5"), 1234.5)
+        self.assertEqual(parse_number("(12.3)"), -12.3)
+        self.assertEqual(parse_number("15%"), 15.0)
+        self.assertEqual(parse_number(" -7 "), -7.0)
+        self.assertEqual(parse_number("€ 2,000"), 2000.0)
+
+    def test_non_numbers(self):
+        for text in ["", "-", "n/a", "NM", "Q3 2024", "1.2.3", "Revenue", None]:
+            self.assertIsNone(parse_number(text), text)
+
+class TestStructureTable(unittest.TestCase):
+    def test_merges_header_rows_and_parses_cells(self):
+        structured = structure_table([
+            ["", "2024", ""],
+            ["", "Q3", "Q4"],
+            ["Revenue", "$1,200", "(15)"],
+            ["Margin", "12%", "n/a"],
+        ])
+        self.assertEqual(structured["headers"], ["col0", "2024 Q3", "2024 Q4"])
+        revenue = structured["rows"][0]
+        self.assertEqual(revenue["label"], "Revenue")
+        self.assertEqual(revenue["cells"], [(1, "2024 Q3", "$1,200", 1200.0), (2, "2024 Q4", "(15)", -15.0)])
+        self.assertEqual(structured["rows"][1]["cells"][1], (2, "2024 Q4", "n/a", None))
+
+class TestIngestTables(unittest.TestCase):
+    def test_replaces_the_documents_tables(self):
+        graph = FakeGraph()
+        pages = [(1, [[["", "2024"], ["Revenue", "10"]], [["", ""]]]), (2, [])]
+        with mock.patch.object(tables, "get_graph", return_value=graph), \
+                mock.patch.object(tables, "load_tables", return_value=pages):
+            self.assertEqual(ingest_tables("/tmp/report.pdf"), 1)
+        (table_id, page, index, structured), = graph.saved["report.pdf"]
+        self.assertEqual((page, index), (1, 0))
+        with mock.patch.object(tables, "get_graph", return_value=graph), \
+                mock.patch.object(tables, "load_tables", return_value=[]):
+            self.assertEqual(ingest_tables("/tmp/report.pdf"), 0)
+        self.assertEqual(graph.saved["report.pdf"], [])
+
+if __name__ == '__main__':
+    unittest.main()